@@ -1,3 +1,4 @@
+import logging
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config, pool
 from alembic import context
@@ -32,8 +33,7 @@ for finder, name, ispkg in pkgutil.iter_modules([models_path]):
     # Optionally, you can filter names if you only want certain files
     importlib.import_module(f"app.db.models.{name}")
     
-    # Debug print: List all registered tables
-print("Registered tables:", list(Base.metadata.tables.keys()))
+logging.getLogger("alembic.env").info("Registered tables: %s", list(Base.metadata.tables.keys()))
 
 # Now Alembic knows all the tables from these models
 target_metadata = Base.metadata 
@@ -0,0 +1,35 @@
+"""Add book_co_purchases
+
+Revision ID: 3c7e1a9b5d21
+Revises: faf72dc96367
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7e1a9b5d21'
+down_revision: Union[str, None] = 'faf72dc96367'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'book_co_purchases',
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('other_book_id', sa.Integer(), sa.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('score', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_book_co_purchases_book_id_score', 'book_co_purchases', ['book_id', 'score'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_book_co_purchases_book_id_score', table_name='book_co_purchases')
+    op.drop_table('book_co_purchases')
@@ -0,0 +1,30 @@
+"""Set books updated_at on insert
+
+Revision ID: 5b8e3f0a2c47
+Revises: e2b7d4c9a613
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e3f0a2c47'
+down_revision: Union[str, None] = 'e2b7d4c9a613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The catalog snapshot finds inserted books by updated_at, so it may not be NULL
+    op.execute("UPDATE books SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL")
+    op.alter_column('books', 'updated_at', existing_type=sa.DateTime(timezone=True), server_default=sa.func.now())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('books', 'updated_at', existing_type=sa.DateTime(timezone=True), server_default=None)
@@ -0,0 +1,35 @@
+"""Add book_similarities
+
+Revision ID: 8d4f2b6e1a73
+Revises: 3c7e1a9b5d21
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4f2b6e1a73'
+down_revision: Union[str, None] = '3c7e1a9b5d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'book_similarities',
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('other_book_id', sa.Integer(), sa.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('score', sa.Float(), nullable=False),
+    )
+    op.create_index('ix_book_similarities_book_id_score', 'book_similarities', ['book_id', 'score'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_book_similarities_book_id_score', table_name='book_similarities')
+    op.drop_table('book_similarities')
@@ -0,0 +1,41 @@
+"""Add book_sales and book_sales_totals
+
+Revision ID: b91c5e0d7f42
+Revises: 8d4f2b6e1a73
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b91c5e0d7f42'
+down_revision: Union[str, None] = '8d4f2b6e1a73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'book_sales',
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('hour', sa.Integer(), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_book_sales_hour', 'book_sales', ['hour'], unique=False)
+    op.create_table(
+        'book_sales_totals',
+        sa.Column('book_id', sa.Integer(), sa.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('book_sales_totals')
+    op.drop_index('ix_book_sales_hour', table_name='book_sales')
+    op.drop_table('book_sales')
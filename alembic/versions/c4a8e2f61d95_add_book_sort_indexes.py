@@ -0,0 +1,50 @@
+"""Add books rating columns and sort indexes
+
+Revision ID: c4a8e2f61d95
+Revises: b91c5e0d7f42
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a8e2f61d95'
+down_revision: Union[str, None] = 'b91c5e0d7f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('books', sa.Column('average_rating', sa.Float(), nullable=True))
+    op.add_column('books', sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE books SET"
+        " average_rating = (SELECT avg(score) FROM ratings WHERE ratings.book_id = books.id),"
+        " rating_count = (SELECT count(*) FROM ratings WHERE ratings.book_id = books.id)"
+    )
+    # Books without a date or rating sort last; SQLite puts NULLs there already
+    # and does not accept NULLS LAST in an index
+    nulls_last = " NULLS LAST" if op.get_bind().dialect.name == "postgresql" else ""
+    op.create_index('ix_books_cost_id', 'books', ['cost', 'id'], unique=False)
+    op.create_index(
+        'ix_books_publication_date_id', 'books',
+        [sa.text(f'publication_date DESC{nulls_last}'), sa.text('id DESC')], unique=False,
+    )
+    op.create_index(
+        'ix_books_average_rating_id', 'books',
+        [sa.text(f'average_rating DESC{nulls_last}'), sa.text('id DESC')], unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_average_rating_id', table_name='books')
+    op.drop_index('ix_books_publication_date_id', table_name='books')
+    op.drop_index('ix_books_cost_id', table_name='books')
+    op.drop_column('books', 'rating_count')
+    op.drop_column('books', 'average_rating')
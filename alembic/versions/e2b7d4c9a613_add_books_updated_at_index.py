@@ -0,0 +1,29 @@
+"""Add books updated_at index
+
+Revision ID: e2b7d4c9a613
+Revises: c4a8e2f61d95
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7d4c9a613'
+down_revision: Union[str, None] = 'c4a8e2f61d95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The catalog snapshot reads the books changed since its last refresh
+    op.create_index('ix_books_updated_at', 'books', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_books_updated_at', table_name='books')
@@ -0,0 +1,8 @@
+from fastapi import FastAPI
+
+from app.api.routers.sqladmin import init_admin
+
+# Standalone SQLAdmin process, so API workers can run with ADMIN_MOUNT=off:
+#   uvicorn app.admin_main:app --port 8001
+app = FastAPI(title="Book Shop Admin", docs_url=None, redoc_url=None, openapi_url=None)
+init_admin(app)
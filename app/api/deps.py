@@ -1,11 +1,14 @@
+from datetime import date
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer, HTTPBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt
 
 from app.core import security
-from app.db.base import get_db
+from app.core.tracing import traced
+from app.db.routing import get_db, get_read_db
+from app.db.models.book import BookAvailability
 from app.db.models.user import User
 from app.crud.crud_user import user as crud_user
 from app.schemas import TokenData
@@ -13,7 +16,9 @@ from app.schemas import TokenData
 # security_bearer = HTTPBearer()
 
 security_bearer = OAuth2PasswordBearer(tokenUrl="/api/v1/login")
+optional_security_bearer = OAuth2PasswordBearer(tokenUrl="/api/v1/login", auto_error=False)
 
+@traced("deps.get_current_user")
 async def get_current_user(
     db: AsyncSession = Depends(get_db), token: str = Depends(security_bearer)
 ) -> User:
@@ -22,7 +27,8 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    username = security.decode_access_token(token)
+    payload = security.decode_access_token(token)
+    username = payload.get("sub") if payload else None
     if username is None:
         raise credentials_exception
     token_data = TokenData(username=username)
@@ -32,17 +38,34 @@ async def get_current_user(
         raise credentials_exception
     return user
 
+@traced("deps.get_current_user_optional")
+async def get_current_user_optional(
+    db: AsyncSession = Depends(get_read_db), token: Optional[str] = Depends(optional_security_bearer)
+) -> Optional[User]:
+    """
+    The authenticated user for endpoints open to everyone. Anonymous requests
+    and invalid or expired tokens give None rather than a 401.
+    """
+    if token is None:
+        return None
+    try:
+        return await get_current_user(db=db, token=token)
+    except HTTPException:
+        return None
+
+@traced("deps.get_current_active_user")
 async def get_current_active_user(
     current_user: User = Depends(get_current_user),
 ) -> User:
-    if not crud_user.is_active(current_user):
+    if not await crud_user.is_active(current_user):
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+@traced("deps.get_current_active_superuser")
 async def get_current_active_superuser(
     current_user: User = Depends(get_current_active_user),
 ) -> User:
-    if not crud_user.is_superuser(current_user):
+    if not await crud_user.is_superuser(current_user):
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
@@ -54,4 +77,24 @@ async def get_pagination_params(
     limit: int = 100,
 ) -> dict:
     # Add validation if needed (e.g., limit <= max_limit)
-    return {"skip": skip, "limit": limit}
\ No newline at end of file
+    return {"skip": skip, "limit": limit}
+
+# Dependency for the catalog filters shared by the listing and its facets
+async def get_book_filters(
+    author: Optional[str] = Query(None, description="Filter by author name (case-insensitive)"),
+    genre: Optional[str] = Query(None, description="Filter by genre (case-insensitive)"),
+    availability: Optional[BookAvailability] = Query(None, description="Filter by availability status"),
+    language: Optional[str] = Query(None, description="Filter by language (case-insensitive)"),
+    title: Optional[str] = Query(None, description="Filter by title (case-insensitive)"),
+    min_cost: Optional[float] = Query(None, ge=0, description="Minimum price"),
+    max_cost: Optional[float] = Query(None, ge=0, description="Maximum price"),
+    published_from: Optional[date] = Query(None, description="Published on or after this date"),
+    published_to: Optional[date] = Query(None, description="Published on or before this date"),
+    min_rating: Optional[float] = Query(None, ge=1, le=5, description="Minimum average rating"),
+    fuzzy: bool = Query(False, description="Tolerate typos in the author and title filters"),
+) -> dict:
+    return {
+        "author": author, "genre": genre, "availability": availability, "language": language, "title": title,
+        "min_cost": min_cost, "max_cost": max_cost, "published_from": published_from, "published_to": published_to,
+        "min_rating": min_rating, "fuzzy": fuzzy,
+    }
@@ -1,3 +1,4 @@
+import logging
 from typing import List, Any
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Security
@@ -12,6 +13,7 @@ from app.db.models.user import User
 from app.api import deps
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 @router.post("/", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
@@ -63,7 +65,7 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    if not crud_user.user.is_active(user):
+    if not await crud_user.user.is_active(user):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
@@ -85,7 +87,7 @@ async def read_users_me(
     """
     Retrieve the current user's profile, including favorite books.
     """
-    print(f"Current user: {current_user.username}")
+    logger.debug("Profile requested", extra={"user_id": current_user.id})
     profile = await crud_user.user.get_user_profile(db, user_id=current_user.id)
     if not profile:
         raise HTTPException(status_code=404, detail="User not found")
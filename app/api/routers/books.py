@@ -1,4 +1,5 @@
-from typing import List, Optional, Any
+import logging
+from typing import List, Optional, Any, Union
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -6,51 +7,133 @@ from app import crud, schemas
 from app.crud import crud_book
 from app.db.models.user import User
 from app.api import deps
-from app.db.models.book import BookAvailability # Import enum
+from app.core.config import settings
+from app.db.similarity import TEXT_FIELDS
+from app.db.suggest import suggest_index
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.get("/", response_model=List[schemas.Book])
+@router.get("/", response_model=Union[List[schemas.Book], schemas.BookPage])
 async def read_books(
-    db: AsyncSession = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_read_db),
     pagination: dict = Depends(deps.get_pagination_params),
-    author: Optional[str] = Query(None, description="Filter by author name (case-insensitive)"),
-    genre: Optional[str] = Query(None, description="Filter by genre (case-insensitive)"),
-    availability: Optional[BookAvailability] = Query(None, description="Filter by availability status"),
-    language: Optional[str] = Query(None, description="Filter by language (case-insensitive)"),
-    # Add more filters: title, price range etc.
+    filters: dict = Depends(deps.get_book_filters),
+    sort: schemas.BookSort = Query(schemas.BookSort.TITLE, description="Ordering; 'personalized' ranks by the signed-in user's tastes"),
+    facets: bool = Query(False, description="Return {items, total, facets} with counts per genre, language and availability"),
+    token: Optional[str] = Depends(deps.optional_security_bearer),
 ):
     """
     Retrieve books with optional filtering and pagination.
     Accessible to all users (registered or not).
     """
+    # Only personalized ordering needs to know who is asking
+    current_user = await deps.get_current_user_optional(db=db, token=token) if sort == schemas.BookSort.PERSONALIZED else None
     books, total_count = await crud_book.book.get_multi_filtered(
         db,
         skip=pagination["skip"],
         limit=pagination["limit"],
-        author=author,
-        genre=genre,
-        availability=availability,
-        language=language,
+        sort=sort,
+        user_id=current_user.id if current_user else None,
+        **filters,
     )
+    if facets:
+        counts = await crud_book.book.get_facets(db, **filters)
+        return {"items": books, "total": total_count, "facets": counts}
     # You can add total_count to response headers if needed (e.g., 'X-Total-Count')
     return books
 
+@router.get("/facets", response_model=schemas.BookFacets)
+async def read_book_facets(
+    db: AsyncSession = Depends(deps.get_read_db),
+    filters: dict = Depends(deps.get_book_filters),
+):
+    """
+    Number of books per genre, language and availability status under the
+    catalog filters. Accessible to all users.
+    """
+    return await crud_book.book.get_facets(db, **filters)
+
+@router.get("/trending", response_model=List[schemas.Book])
+async def read_trending(
+    db: AsyncSession = Depends(deps.get_read_db),
+    window: schemas.SalesWindow = Query(schemas.SalesWindow.DAY, description="Sales period to rank by"),
+    genre: Optional[str] = Query(None, description="Only books of this genre (case-insensitive)"),
+    limit: int = Query(10, ge=1, le=settings.TRENDING_TOP_K),
+):
+    """
+    Best-selling books of the last day, week, month or all time.
+    Accessible to all users.
+    """
+    return await crud.recommendation.get_trending(db=db, window=window.value, genre=genre, limit=limit)
+
+@router.get("/suggest", response_model=List[schemas.Suggestion])
+async def suggest_books(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+):
+    """
+    Typeahead: titles and authors starting with `prefix` (at any of their first
+    words), most popular first. Served from memory; accessible to all users.
+    """
+    return suggest_index.suggest(prefix, limit)
+
 @router.get("/{book_id}", response_model=schemas.BookDetail)
 async def read_book(
     *,
-    db: AsyncSession = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_read_db),
     book_id: int,
 ):
     """
     Get book by ID, including comments and ratings.
     Accessible to all users.
     """
-    book = await crud_book.get_book_with_details(db=db, book_id=book_id)
+    book = await crud.book.get_book_with_details(db=db, book_id=book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     return book
 
+@router.get("/{book_id}/also-bought", response_model=List[schemas.Book])
+async def read_also_bought(
+    *,
+    db: AsyncSession = Depends(deps.get_read_db),
+    book_id: int,
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Books most often bought by customers who bought this one.
+    Accessible to all users.
+    """
+    books = await crud.recommendation.get_also_bought(db=db, book_id=book_id, limit=limit)
+    # Only an empty answer needs the existence check
+    if not books and not await crud.book.get(db=db, id=book_id):
+        raise HTTPException(status_code=404, detail="Book not found")
+    return books
+
+@router.get("/{book_id}/similar", response_model=List[schemas.Book])
+async def read_similar(
+    *,
+    db: AsyncSession = Depends(deps.get_read_db),
+    book_id: int,
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Books with similar title, author, genre and description.
+    Accessible to all users.
+    """
+    books = await crud.recommendation.get_similar(db=db, book_id=book_id, limit=limit)
+    if not books and not await crud.book.get(db=db, id=book_id):
+        raise HTTPException(status_code=404, detail="Book not found")
+    return books
+
+async def _refresh_similar(db: AsyncSession, book) -> None:
+    try:
+        # Best effort: the book is saved either way and the next rebuild catches up
+        await crud.recommendation.refresh_similar(db=db, book=book)
+    except Exception:
+        logger.exception("Could not refresh similar books", extra={"book_id": book.id})
+
 @router.post("/{book_id}/favorite", response_model=schemas.Message, status_code=status.HTTP_201_CREATED)
 async def mark_book_as_favorite(
     *,
@@ -61,7 +144,7 @@ async def mark_book_as_favorite(
     """
     Mark a book as favorite for the current user.
     """
-    book = await crud_book.get(db=db, id=book_id)
+    book = await crud.book.get(db=db, id=book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
@@ -122,7 +205,7 @@ async def add_comment_to_book(
 @router.get("/{book_id}/comments", response_model=List[schemas.Comment])
 async def get_book_comments(
     *,
-    db: AsyncSession = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_read_db),
     book_id: int,
     pagination: dict = Depends(deps.get_pagination_params),
 ):
@@ -169,7 +252,7 @@ async def rate_book(
 @router.get("/{book_id}/ratings", response_model=List[schemas.Rating])
 async def get_book_ratings(
     *,
-    db: AsyncSession = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_read_db),
     book_id: int,
     pagination: dict = Depends(deps.get_pagination_params),
 ):
@@ -198,6 +281,8 @@ async def create_book(
     Create a new book (Admin only).
     """
     book = await crud.book.create(db=db, obj_in=book_in)
+    suggest_index.upsert(book.id, book.title, book.author)
+    await _refresh_similar(db, book)
     return book
 
 @router.put("/{book_id}", response_model=schemas.Book)
@@ -215,6 +300,10 @@ async def update_book(
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     book = await crud.book.update(db=db, db_obj=book, obj_in=book_in)
+    if book_in.model_fields_set & {"title", "author"}:
+        suggest_index.upsert(book.id, book.title, book.author)
+    if book_in.model_fields_set & TEXT_FIELDS:
+        await _refresh_similar(db, book)
     return book
 
 @router.delete("/{book_id}", response_model=schemas.Message)
@@ -238,5 +327,6 @@ async def delete_book(
     deleted_book = await crud.book.remove(db=db, id=book_id)
     if not deleted_book: # Should not happen if found above, but good practice
          raise HTTPException(status_code=404, detail="Book not found during deletion")
+    suggest_index.remove(book_id)
 
     return {"message": f"Book '{deleted_book.title}' deleted successfully"}
\ No newline at end of file
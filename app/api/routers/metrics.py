@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core import metrics
+from app.core.config import settings
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics() -> PlainTextResponse:
+    """
+    Prometheus exposition of this worker's metrics, merged with the other
+    workers' snapshots when METRICS_DIR is set.
+    """
+    return PlainTextResponse(
+        metrics.exposition(settings.METRICS_DIR or None),
+        media_type="text/plain; version=0.0.4",
+    )
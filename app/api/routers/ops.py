@@ -0,0 +1,159 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse
+
+from app.api import deps
+from app.core.loopmonitor import loop_monitor
+from app.core.memprofile import GROUP_BY, compare, memory_profiler
+from app.core.profiling import profile_store
+from app.core.startup import boot_timer
+from app.db.base import engine
+from app.db.querystats import ORDER_KEYS, query_stats
+from app.db.pool import pool_stats
+from app.db.suggest import suggest_index
+
+router = APIRouter()
+
+
+@router.get("/startup", dependencies=[Depends(deps.get_current_active_superuser)])
+async def read_startup_report() -> Dict[str, Any]:
+    """
+    Boot timing of this worker: import, route setup, engine/schema bootstrap
+    and the latency of the first request it served.
+    """
+    return boot_timer.report()
+
+
+@router.get("/pool", dependencies=[Depends(deps.get_current_active_superuser)])
+async def read_pool_stats() -> Dict[str, Any]:
+    """
+    Connection pool usage of this worker: checked out / overflow connections,
+    checkout count, timeouts and the checkout wait histogram.
+    """
+    return pool_stats.snapshot(engine.sync_engine.pool)
+
+
+@router.get("/loop", dependencies=[Depends(deps.get_current_active_superuser)])
+async def read_loop_report() -> Dict[str, Any]:
+    """
+    Event loop lag over the last minute, threadpool occupancy and the most recent
+    loop stalls with the stack that was blocking (superusers only).
+    """
+    return loop_monitor.report()
+
+
+@router.get("/suggest", dependencies=[Depends(deps.get_current_active_superuser)])
+async def read_suggest_status() -> Dict[str, Any]:
+    """
+    Size of this worker's typeahead index against its memory budget, and the
+    catalog writes applied since it was built (superusers only).
+    """
+    return suggest_index.status()
+
+
+@router.get("/profiles", dependencies=[Depends(deps.get_current_active_superuser)])
+async def list_profiles() -> List[Dict[str, Any]]:
+    """
+    Request profiles kept on disk, newest first (superusers only).
+    Send `X-Profile: 1` as a superuser to profile a request.
+    """
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(deps.get_current_active_superuser)])
+async def download_profile(profile_id: str, format: str = Query("speedscope", pattern="^(speedscope|collapsed)$")):
+    """
+    Download a profile as speedscope JSON (open at https://www.speedscope.app)
+    or as collapsed stacks for flamegraph.pl (superusers only).
+    """
+    path = profile_store.path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(path, filename=os.path.basename(path))
+
+
+@router.get("/queries", dependencies=[Depends(deps.get_current_active_superuser)])
+async def read_query_stats(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query("total_time", pattern="^(" + "|".join(ORDER_KEYS) + ")$"),
+) -> Dict[str, Any]:
+    """
+    Top SQL statement fingerprints of this worker by calling route (superusers only).
+    """
+    return {
+        "since": query_stats.since,
+        "slow_query_ms": query_stats.slow_seconds * 1000,
+        "statements": query_stats.top(limit, order_by),
+    }
+
+
+@router.delete("/queries", dependencies=[Depends(deps.get_current_active_superuser)])
+async def reset_query_stats() -> Dict[str, str]:
+    """Start collecting query statistics from scratch (superusers only)."""
+    query_stats.reset()
+    return {"message": "Query statistics reset"}
+
+
+@router.get("/memory", dependencies=[Depends(deps.get_current_active_superuser)])
+async def read_memory_status() -> Dict[str, Any]:
+    """tracemalloc state of this worker and the snapshots it holds (superusers only)."""
+    return memory_profiler.status()
+
+
+@router.post("/memory/start", dependencies=[Depends(deps.get_current_active_superuser)])
+async def start_memory_tracing(frames: Optional[int] = Query(None, ge=1, le=100)) -> Dict[str, Any]:
+    """
+    Start tracing allocations (superusers only). Tracing slows the worker down;
+    `frames` bounds the traceback depth kept per allocation.
+    """
+    memory_profiler.start(frames)
+    return memory_profiler.status()
+
+
+@router.post("/memory/stop", dependencies=[Depends(deps.get_current_active_superuser)])
+async def stop_memory_tracing() -> Dict[str, Any]:
+    """Stop tracing; snapshots already taken are kept (superusers only)."""
+    memory_profiler.stop()
+    return memory_profiler.status()
+
+
+@router.post("/memory/snapshots", status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(deps.get_current_active_superuser)])
+async def take_memory_snapshot(label: str = Query("manual", max_length=64)) -> Dict[str, Any]:
+    """Snapshot the traced allocations (superusers only)."""
+    try:
+        snapshot_id = await memory_profiler.snapshot(label)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"id": snapshot_id}
+
+
+@router.delete("/memory/snapshots", dependencies=[Depends(deps.get_current_active_superuser)])
+async def clear_memory_snapshots() -> Dict[str, str]:
+    """Drop every stored snapshot (superusers only)."""
+    memory_profiler.store.clear()
+    return {"message": "Snapshots cleared"}
+
+
+@router.get("/memory/diff", dependencies=[Depends(deps.get_current_active_superuser)])
+async def read_memory_diff(
+    request: Request,
+    base: Optional[int] = Query(None, description="Snapshot id; defaults to the oldest"),
+    target: Optional[int] = Query(None, description="Snapshot id; defaults to the newest"),
+    group_by: str = Query("lineno", pattern="^(" + "|".join(GROUP_BY) + ")$"),
+    limit: int = Query(20, ge=1, le=500),
+) -> Dict[str, Any]:
+    """
+    Allocation growth between two snapshots grouped by file, line or route,
+    largest first (superusers only).
+    """
+    base_entry = memory_profiler.store.get(base, 0)
+    target_entry = memory_profiler.store.get(target, -1)
+    if base_entry is None or target_entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Snapshot not found")
+    stats = await asyncio.get_running_loop().run_in_executor(
+        None, compare, base_entry[1], target_entry[1], group_by, limit, list(request.app.routes)
+    )
+    return {"base": base_entry[0], "target": target_entry[0], "group_by": group_by, "stats": stats}
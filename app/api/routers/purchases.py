@@ -1,3 +1,4 @@
+import logging
 from typing import List, Any
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,6 +9,7 @@ from app.db.models.book import BookAvailability
 from app.api import deps
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # --- Cart Management ---
 
@@ -46,7 +48,7 @@ async def add_book_to_cart(
         book_id=purchase_record.book_id,
         cost_at_purchase=purchase_record.cost_at_purchase,
         added_at=purchase_record.purchase_date, # purchase_date serves as added_at for IN_CART
-        book=purchase_record.book # Nested book details loaded by refresh/joinedload
+        book=schemas.Book.model_validate(purchase_record.book, from_attributes=True) # Nested book details loaded by refresh/joinedload
     )
     return cart_item_response
 
@@ -69,7 +71,7 @@ async def view_cart(
             book_id=record.book_id,
             cost_at_purchase=record.cost_at_purchase,
             added_at=record.purchase_date,
-            book=record.book # Assumes book relationship was loaded
+            book=schemas.Book.model_validate(record.book, from_attributes=True) # Assumes book relationship was loaded
         ))
         total_cost += record.cost_at_purchase
 
@@ -111,12 +113,11 @@ async def checkout(
         # Refresh user object to get the latest balance before checkout
         await db.refresh(current_user, ["balance"])
         completed_purchases = await crud.purchase.checkout_cart(db=db, user=current_user)
-        return completed_purchases
     except ValueError as e:
         # Catch specific errors like "Insufficient balance" or "Cart is empty"
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-    except Exception as e:
+    except Exception:
         # Catch potential database errors during transaction
-        # Log the error e
-        print(f"Checkout error: {e}") # Replace with proper logging
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred during checkout.")
\ No newline at end of file
+        logger.exception("Checkout failed", extra={"user_id": current_user.id})
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred during checkout.")
+    return completed_purchases
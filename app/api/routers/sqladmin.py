@@ -1,26 +1,113 @@
+import asyncio
+from typing import Any, Optional
+from dataclasses import dataclass
+
 from fastapi import FastAPI
+from starlette.applications import Starlette
+from starlette.datastructures import URL
+from starlette.requests import Request
 from sqladmin import Admin, ModelView
-from sqlalchemy import create_engine
+from sqladmin.pagination import Pagination
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import selectinload
 
+from app.db.base import engine
 from app.db.models.book import Book  # Corrected import path assuming models are in db/models
 from app.db.models.user import User  # Corrected import path assuming models are in db/models
 from app.core.config import settings  # Ensure settings.DATABASE_URL is configured properly
 
-if settings.DATABASE_URL.startswith("postgresql+asyncpg"):
-    sync_db_url = settings.DATABASE_URL.replace("+asyncpg", "")
-elif settings.DATABASE_URL.startswith("mysql+aiomysql"):
-     sync_db_url = settings.DATABASE_URL.replace("+aiomysql", "+pymysql") # Or +mysqlconnector
-elif settings.DATABASE_URL.startswith("sqlite+aiosqlite"):
-     sync_db_url = settings.DATABASE_URL.replace("+aiosqlite", "")
-else:
-    # Assume it's already sync or handle other drivers
-    sync_db_url = settings.DATABASE_URL
+# Caps how many admin queries may hold a connection of the shared pool at once,
+# so browsing the admin cannot starve API requests.
+admin_query_slots = asyncio.Semaphore(settings.ADMIN_MAX_CONCURRENT_QUERIES)
+
+
+@dataclass
+class KeysetPagination(Pagination):
+    """
+    Pagination whose "next" link carries the last primary key of the page, so the
+    following page is fetched with an index seek instead of an OFFSET scan.
+    """
+    last_pk: Optional[Any] = None
+
+    def add_pagination_urls(self, base_url: URL) -> None:
+        super().add_pagination_urls(base_url.remove_query_params("after"))
+        if self.last_pk is None:
+            return
+        for page_control in self.page_controls:
+            if page_control.number == self.page + 1:
+                page_control.url = str(URL(page_control.url).include_query_params(after=self.last_pk))
+
+
+class ScalableModelView(ModelView):
+    """
+    ModelView for large tables:
+      - every query goes through `admin_query_slots`;
+      - unfiltered counts use the planner estimate on PostgreSQL once a table
+        is larger than ADMIN_EXACT_COUNT_LIMIT, search counts stop at that limit;
+      - sequential browsing in primary key order uses keyset paging.
+    """
+
+    async def _run_query(self, stmt: Any) -> Any:
+        async with admin_query_slots:
+            return await super()._run_query(stmt)
+
+    async def estimated_count(self) -> Optional[int]:
+        if engine.dialect.name != "postgresql":
+            return None
+        stmt = text(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)"
+        ).bindparams(table_name=self.model.__tablename__)
+        rows = await self._run_query(stmt)
+        # reltuples is -1 for tables that have never been analyzed
+        return rows[0] if rows and rows[0] >= 0 else None
+
+    async def count(self, request: Request, stmt: Optional[Any] = None) -> int:
+        if stmt is None:
+            estimate = await self.estimated_count()
+            if estimate is not None and estimate >= settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return await super().count(request, stmt)
+
+    async def list(self, request: Request) -> Pagination:
+        page = self.validate_page_number(request.query_params.get("page"), 1)
+        page_size = self.validate_page_number(request.query_params.get("pageSize"), 0)
+        page_size = min(page_size or self.page_size, max(self.page_size_options))
+        search = request.query_params.get("search", None)
+        # Keyset paging only applies to the default (primary key ascending) order
+        keyset = not request.query_params.get("sortBy") and not self.column_default_sort
+        pk_column = self.pk_columns[0]
 
-sync_engine = create_engine(sync_db_url)
+        stmt = self.list_query(request)
+        for relation in self._list_relations:
+            stmt = stmt.options(selectinload(relation))
+
+        stmt = self.sort_query(stmt, request)
+
+        if search:
+            stmt = self.search_query(stmt=stmt, term=search)
+            bounded = stmt.limit(settings.ADMIN_EXACT_COUNT_LIMIT).subquery()
+            count = await self.count(request, select(func.count()).select_from(bounded))
+        else:
+            count = await self.count(request)
+
+        after = request.query_params.get("after")
+        if keyset and page > 1 and after is not None and after.isdigit():
+            stmt = stmt.filter(pk_column > int(after)).limit(page_size)
+        else:
+            stmt = stmt.limit(page_size).offset((page - 1) * page_size)
+        rows = await self._run_query(stmt)
+
+        return KeysetPagination(
+            rows=rows,
+            page=page,
+            page_size=page_size,
+            count=count,
+            last_pk=getattr(rows[-1], pk_column.name) if keyset and rows else None,
+        )
 
 
 # Define the admin view for the Book model
-class BookAdmin(ModelView, model=Book):
+class BookAdmin(ScalableModelView, model=Book):
     name = "Books"  # Display name in the admin panel
     icon = "fas fa-book"  # Icon (if supported by your UI)
     # List the columns to show in the table view
@@ -45,7 +132,7 @@ class BookAdmin(ModelView, model=Book):
 
 
 # Define the admin view for the User model
-class UserAdmin(ModelView, model=User):
+class UserAdmin(ScalableModelView, model=User):
     name = "Users"
     icon = "fas fa-user"
     column_list = [
@@ -66,13 +153,28 @@ class UserAdmin(ModelView, model=User):
     column_sortable_list = [User.id, User.username, User.email, User.full_name, User.balance]
 
 
+def build_admin(app: Starlette) -> Admin:
+    """
+    Create the Admin instance mounted on `app` and register the model views.
+    The admin shares the application's async engine and connection pool.
+    """
+    admin = Admin(app, engine=engine, base_url="/admin")
+
+    admin.add_view(BookAdmin)
+    admin.add_view(UserAdmin)
+    return admin
+
+
+def build_admin_app() -> Starlette:
+    """
+    Build the admin panel as a standalone ASGI app (used by the lazy /admin mount).
+    """
+    admin = build_admin(Starlette())
+    return admin.admin
+
+
 def init_admin(app: FastAPI):
     """
     Initialize SQLAdmin by binding it to the FastAPI app instance and registering model views.
     """
-    # Create the Admin instance with the provided app
-    admin = Admin(app, engine=sync_engine, base_url="/admin") # Removed trailing slash from base_url if not intended
-
-    # Register your admin views using add_view
-    admin.add_view(BookAdmin) # <--- CORRECT METHOD
-    admin.add_view(UserAdmin) # <--- CORRECT METHOD
\ No newline at end of file
+    build_admin(app)
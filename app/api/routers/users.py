@@ -75,12 +75,24 @@ async def read_my_favorites(
     """
     Retrieve list of favorite books for the current user.
     """
-    favorites = await crud_user.book.get_user_favorites(
+    favorites = await crud.book.get_user_favorites(
         db, user_id=current_user.id, skip=pagination["skip"], limit=pagination["limit"]
         )
     return favorites
 
 
+@router.get("/me/recommendations", response_model=List[schemas.Book])
+async def read_my_recommendations(
+    db: AsyncSession = Depends(deps.get_db),
+    limit: int = Query(10, ge=1, le=100),
+    current_user: User = Security(deps.get_current_active_user),
+):
+    """
+    Books recommended from the current user's ratings (collaborative filtering),
+    excluding books already bought, in the cart or favorited.
+    """
+    return await crud.recommendation.get_for_user(db, user_id=current_user.id, limit=limit)
+
 @router.get("/me/stats", response_model=schemas.UserStats)
 async def read_my_stats(
     db: AsyncSession = Depends(deps.get_db),
@@ -0,0 +1,168 @@
+"""
+Management commands.
+
+    python -m app.cli seed --books 1M --users 200k --purchases 20M [--seed 42] [--workers 8] [--truncate]
+    python -m app.cli also-bought [--top-k 50] [--max-basket 200]
+    python -m app.cli train-recommender [--factors 32] [--iterations 10] [--reg 0.05]
+    python -m app.cli similar-books [--top-k 20]
+    python -m app.cli backfill-sales
+
+`seed` fills the database at DATABASE_URL with synthetic, deterministic data
+(see app.db.seed). Counts accept k/M suffixes. Every seeded user can log in as
+user<N> with the password from app.db.seed.SEED_PASSWORD.
+
+`also-bought` recomputes the co-purchase table behind GET /books/{id}/also-bought
+from completed purchases (see app.db.cooccurrence); run it periodically, e.g.
+nightly, checkouts keep it current in between.
+
+`train-recommender` fits the ALS model behind GET /users/me/recommendations on
+the ratings table and publishes it to MODEL_DIR (see app.db.factorization);
+running workers pick it up without a restart.
+
+`similar-books` rebuilds the TF-IDF index behind GET /books/{id}/similar from
+the catalog text (see app.db.similarity); books created or edited through the
+API are scored against the last published index in between.
+
+`backfill-sales` rebuilds the sales counts behind GET /books/trending and
+sort=bestselling from completed purchases (see app.db.sales); run it once
+when deploying, checkouts keep the counts current afterwards.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from app.core.config import settings
+
+
+def _add_seed_parser(subparsers) -> None:
+    from app.db.seed import parse_count
+
+    parser = subparsers.add_parser("seed", help="Generate synthetic catalog, users and activity.")
+    parser.add_argument("--books", type=parse_count, default=parse_count("10k"))
+    parser.add_argument("--users", type=parse_count, default=parse_count("2k"))
+    parser.add_argument("--purchases", type=parse_count, default=parse_count("100k"))
+    parser.add_argument("--ratings", type=parse_count, help="Default: a quarter of --purchases")
+    parser.add_argument("--comments", type=parse_count, help="Default: a twentieth of --purchases")
+    parser.add_argument("--favorites", type=parse_count, help="Default: a tenth of --purchases")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of book popularity and user activity")
+    parser.add_argument("--chunk-size", type=parse_count, default=parse_count("50k"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--truncate", action="store_true", help="Delete existing rows first")
+
+
+async def _seed(args: argparse.Namespace) -> None:
+    from app.core.startup import bootstrap_schema
+    from app.db.base import engine
+    from app.db.seed import SEED_PASSWORD, SeedPlan, seed_database
+
+    plan = SeedPlan(
+        books=args.books,
+        users=args.users,
+        purchases=args.purchases,
+        ratings=args.ratings if args.ratings is not None else args.purchases // 4,
+        comments=args.comments if args.comments is not None else args.purchases // 20,
+        favorites=args.favorites if args.favorites is not None else args.purchases // 10,
+        seed=args.seed,
+        zipf_exponent=args.zipf,
+        chunk_size=args.chunk_size,
+    )
+    await bootstrap_schema(engine, settings.SCHEMA_BOOTSTRAP)
+    stats = await seed_database(
+        engine, plan, workers=args.workers, truncate=args.truncate, progress=lambda message: print(message, flush=True)
+    )
+    await engine.dispose()
+    print(json.dumps(stats, indent=2))
+    print(f"Users log in as user<N> with password {SEED_PASSWORD!r}")
+
+
+def _add_also_bought_parser(subparsers) -> None:
+    parser = subparsers.add_parser("also-bought", help="Rebuild the \"also bought\" recommendations.")
+    parser.add_argument("--top-k", type=int, default=settings.ALSO_BOUGHT_TOP_K, help="Neighbours kept per book")
+    parser.add_argument("--max-basket", type=int, default=settings.ALSO_BOUGHT_MAX_BASKET,
+                        help="Most recent books per user taken into account")
+
+
+async def _also_bought(args: argparse.Namespace) -> None:
+    from app.db.base import engine
+    from app.db.cooccurrence import rebuild_also_bought
+
+    stats = await rebuild_also_bought(engine, top_k=args.top_k, max_basket=args.max_basket)
+    await engine.dispose()
+    print(json.dumps(stats, indent=2))
+
+
+def _add_train_recommender_parser(subparsers) -> None:
+    parser = subparsers.add_parser("train-recommender", help="Train the ratings-based recommendation model.")
+    parser.add_argument("--factors", type=int, default=settings.ALS_FACTORS)
+    parser.add_argument("--iterations", type=int, default=settings.ALS_ITERATIONS)
+    parser.add_argument("--reg", type=float, default=settings.ALS_REGULARIZATION)
+    parser.add_argument("--model-dir", default=settings.MODEL_DIR)
+
+
+async def _train_recommender(args: argparse.Namespace) -> None:
+    from app.db.base import engine
+    from app.db.factorization import train_from_ratings
+
+    stats = await train_from_ratings(
+        engine, args.model_dir, factors=args.factors, iterations=args.iterations, reg=args.reg
+    )
+    await engine.dispose()
+    print(json.dumps(stats, indent=2))
+
+
+def _add_similar_books_parser(subparsers) -> None:
+    parser = subparsers.add_parser("similar-books", help="Rebuild the content-based \"similar books\" index.")
+    parser.add_argument("--top-k", type=int, default=settings.SIMILAR_TOP_K, help="Neighbours kept per book")
+    parser.add_argument("--model-dir", default=settings.MODEL_DIR)
+
+
+async def _similar_books(args: argparse.Namespace) -> None:
+    from app.db.base import engine
+    from app.db.similarity import rebuild_similar_books
+
+    stats = await rebuild_similar_books(engine, args.model_dir, top_k=args.top_k)
+    await engine.dispose()
+    print(json.dumps(stats, indent=2))
+
+
+def _add_backfill_sales_parser(subparsers) -> None:
+    subparsers.add_parser("backfill-sales", help="Rebuild the sales counts from completed purchases.")
+
+
+async def _backfill_sales(args: argparse.Namespace) -> None:
+    from app.db.base import engine
+    from app.db.sales import backfill_sales
+
+    stats = await backfill_sales(engine)
+    await engine.dispose()
+    print(json.dumps(stats, indent=2))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Book Shop management commands.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    _add_seed_parser(subparsers)
+    _add_also_bought_parser(subparsers)
+    _add_train_recommender_parser(subparsers)
+    _add_similar_books_parser(subparsers)
+    _add_backfill_sales_parser(subparsers)
+    args = parser.parse_args(argv)
+
+    if args.command == "seed":
+        asyncio.run(_seed(args))
+    elif args.command == "also-bought":
+        asyncio.run(_also_bought(args))
+    elif args.command == "train-recommender":
+        asyncio.run(_train_recommender(args))
+    elif args.command == "similar-books":
+        asyncio.run(_similar_books(args))
+    elif args.command == "backfill-sales":
+        asyncio.run(_backfill_sales(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 from functools import lru_cache
@@ -11,6 +12,148 @@ class Settings(BaseSettings):
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+    # Schema handling on boot: "create_all" (dev), "check_head" (verify the Alembic head) or "skip"
+    SCHEMA_BOOTSTRAP: str = os.getenv("SCHEMA_BOOTSTRAP", "create_all")
+    # SQLAdmin panel: "eager" (built on startup), "lazy" (built on first /admin request) or "off"
+    ADMIN_MOUNT: str = os.getenv("ADMIN_MOUNT", "lazy")
+    # Max admin queries running at once on the shared pool
+    ADMIN_MAX_CONCURRENT_QUERIES: int = int(os.getenv("ADMIN_MAX_CONCURRENT_QUERIES", 2))
+    # Tables above this size use estimated counts in the admin; search counts stop here
+    ADMIN_EXACT_COUNT_LIMIT: int = int(os.getenv("ADMIN_EXACT_COUNT_LIMIT", 10000))
+
+    # Server entry point (python -m app.server)
+    SERVER_HOST: str = os.getenv("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT: int = int(os.getenv("SERVER_PORT", 8000))
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", 1))  # Number of worker processes
+    SERVER_LOOP: str = os.getenv("SERVER_LOOP", "uvloop")  # "uvloop", "asyncio" or "auto"
+    SERVER_HTTP: str = os.getenv("SERVER_HTTP", "httptools")  # "httptools", "h11" or "auto"
+    # Import the app once in the master and fork workers (shares code pages copy-on-write)
+    SERVER_PRELOAD: bool = os.getenv("SERVER_PRELOAD", "true").lower() == "true"
+    SERVER_BACKLOG: int = int(os.getenv("SERVER_BACKLOG", 2048))
+    SERVER_KEEPALIVE_TIMEOUT: int = int(os.getenv("SERVER_KEEPALIVE_TIMEOUT", 5))
+    SERVER_ACCESS_LOG: bool = os.getenv("SERVER_ACCESS_LOG", "false").lower() == "true"
+    # Preforked workers that die are restarted after a delay doubling from the first value up
+    # to the second while they keep dying within SERVER_RESTART_HEALTHY_SECONDS of starting;
+    # after SERVER_RESTART_MAX_FAILURES such deaths in a row of one worker the server exits
+    SERVER_RESTART_BACKOFF_SECONDS: float = float(os.getenv("SERVER_RESTART_BACKOFF_SECONDS", 1))
+    SERVER_RESTART_MAX_BACKOFF_SECONDS: float = float(os.getenv("SERVER_RESTART_MAX_BACKOFF_SECONDS", 30))
+    SERVER_RESTART_HEALTHY_SECONDS: float = float(os.getenv("SERVER_RESTART_HEALTHY_SECONDS", 30))
+    SERVER_RESTART_MAX_FAILURES: int = int(os.getenv("SERVER_RESTART_MAX_FAILURES", 5))
+
+    # DB connections allowed across all workers; each worker's pool gets an equal share
+    DB_CONNECTION_BUDGET: int = int(os.getenv("DB_CONNECTION_BUDGET", 40))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    # Explicit per-worker pool sizing; -1 derives it from DB_CONNECTION_BUDGET
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", -1))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", -1))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+    # Prepared statements cached per asyncpg connection
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+    # "session" (direct or session pooling) or "transaction" (PgBouncer transaction pooling,
+    # which cannot keep prepared statements across transactions)
+    DB_POOLER_MODE: str = os.getenv("DB_POOLER_MODE", "session")
+
+    # Comma-separated async URLs of read replicas serving the public catalog reads
+    DATABASE_REPLICA_URLS: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    # How long a replica that failed at the connection level stays out of rotation
+    REPLICA_EJECT_SECONDS: float = float(os.getenv("REPLICA_EJECT_SECONDS", 30))
+    # After a user writes, their reads stay on the primary for this long
+    READ_YOUR_WRITES_SECONDS: float = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+
+    # Password hashing (bcrypt) runs in this many threads instead of on the event loop
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+
+    # Prometheus metrics at /metrics
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # Directory shared by the workers for their metric snapshots; empty serves per-worker metrics
+    # (app.server creates a temporary one when it starts several workers)
+    METRICS_DIR: str = os.getenv("METRICS_DIR", "")
+    METRICS_FLUSH_SECONDS: float = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+
+    # Request tracing (spans for routes, dependencies, CRUD methods and SQL)
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    # Share of requests traced when the caller did not send a sampled traceparent
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+    # "stdout" or a file path receiving one JSON span per line
+    TRACE_EXPORTER: str = os.getenv("TRACE_EXPORTER", "stdout")
+    TRACE_QUEUE_SIZE: int = int(os.getenv("TRACE_QUEUE_SIZE", 10000))  # spans beyond this are dropped, not waited on
+
+    # Per-request profiler: superusers send "X-Profile: 1"; a share of requests can be sampled too
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+    # Comma-separated path prefixes the sample rate applies to; empty means every path
+    PROFILE_SAMPLE_PATHS: str = os.getenv("PROFILE_SAMPLE_PATHS", "")
+    PROFILE_INTERVAL_MS: float = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "bookshop-profiles"))
+    PROFILE_MAX_FILES: int = int(os.getenv("PROFILE_MAX_FILES", 50))  # oldest profiles are deleted beyond this
+
+    # In-process query fingerprint statistics and slow-query log
+    QUERY_STATS_ENABLED: bool = os.getenv("QUERY_STATS_ENABLED", "true").lower() == "true"
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", 200))
+    QUERY_STATS_MAX_ENTRIES: int = int(os.getenv("QUERY_STATS_MAX_ENTRIES", 5000))  # (fingerprint, route) pairs
+
+    # Logging: "json" or "text" lines on stdout, written by a background thread
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records beyond this are dropped, not waited on
+    # Comma-separated logger=rate pairs, e.g. "app.db.slow_queries=0.1"; ERROR and above are never sampled
+    LOG_SAMPLING: str = os.getenv("LOG_SAMPLING", "")
+    LOG_REQUEST_BUDGET: int = int(os.getenv("LOG_REQUEST_BUDGET", 50))  # records below ERROR per request; 0 disables
+
+    # Event loop lag / threadpool monitor; stalls longer than the threshold log the blocking stack
+    LOOP_MONITOR_ENABLED: bool = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+    LOOP_MONITOR_INTERVAL_MS: float = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", 100))
+    LOOP_STALL_THRESHOLD_MS: float = float(os.getenv("LOOP_STALL_THRESHOLD_MS", 250))
+
+    # tracemalloc snapshots for superusers; periodic mode runs in the canary worker only
+    # (WORKER_SLOT=0, set by app.server), tracing all along and snapshotting every PERIODIC seconds
+    TRACEMALLOC_FRAMES: int = int(os.getenv("TRACEMALLOC_FRAMES", 16))
+    TRACEMALLOC_MAX_SNAPSHOTS: int = int(os.getenv("TRACEMALLOC_MAX_SNAPSHOTS", 8))
+    TRACEMALLOC_PERIODIC_SECONDS: float = float(os.getenv("TRACEMALLOC_PERIODIC_SECONDS", 0))  # 0 disables
+    TRACEMALLOC_PERIODIC_FRAMES: int = int(os.getenv("TRACEMALLOC_PERIODIC_FRAMES", 1))
+
+    # "Also bought": neighbours kept per book by `python -m app.cli also-bought`, and the
+    # most recent purchases of a user paired with each new checkout
+    ALSO_BOUGHT_TOP_K: int = int(os.getenv("ALSO_BOUGHT_TOP_K", 50))
+    ALSO_BOUGHT_MAX_BASKET: int = int(os.getenv("ALSO_BOUGHT_MAX_BASKET", 200))
+
+    # Trained recommendation models (memory-mapped by the workers) and ALS training defaults
+    MODEL_DIR: str = os.getenv("MODEL_DIR", os.path.join(tempfile.gettempdir(), "bookshop-models"))
+    ALS_FACTORS: int = int(os.getenv("ALS_FACTORS", 32))
+    ALS_REGULARIZATION: float = float(os.getenv("ALS_REGULARIZATION", 0.05))
+    ALS_ITERATIONS: int = int(os.getenv("ALS_ITERATIONS", 10))
+
+    # Content-based "similar books": neighbours kept per book by the rebuild and on edits
+    SIMILAR_TOP_K: int = int(os.getenv("SIMILAR_TOP_K", 20))
+
+    # Personalized catalog ordering: how often popularity is recomputed, per-user affinity caches
+    PERSONALIZATION_CATALOG_TTL_SECONDS: float = float(os.getenv("PERSONALIZATION_CATALOG_TTL_SECONDS", 300))
+    PERSONALIZATION_AFFINITY_TTL_SECONDS: float = float(os.getenv("PERSONALIZATION_AFFINITY_TTL_SECONDS", 300))
+    PERSONALIZATION_AFFINITY_CACHE_SIZE: int = int(os.getenv("PERSONALIZATION_AFFINITY_CACHE_SIZE", 10000))
+
+    # Trending/bestseller counters: books kept per (window, genre) ranking and how often
+    # each worker writes its sales and reads the other workers'
+    TRENDING_TOP_K: int = int(os.getenv("TRENDING_TOP_K", 100))
+    TRENDING_SYNC_SECONDS: float = float(os.getenv("TRENDING_SYNC_SECONDS", 30))
+
+    # Typeahead index (GET /books/suggest): bytes kept per key, memory budget and rebuild interval
+    SUGGEST_KEY_BYTES: int = int(os.getenv("SUGGEST_KEY_BYTES", 32))
+    SUGGEST_MAX_MEMORY_MB: int = int(os.getenv("SUGGEST_MAX_MEMORY_MB", 128))
+    SUGGEST_REFRESH_SECONDS: float = float(os.getenv("SUGGEST_REFRESH_SECONDS", 900))
+    # Typo-tolerant catalog filters (fuzzy=true): how often the word vocabulary is reloaded
+    FUZZY_VOCABULARY_TTL_SECONDS: float = float(os.getenv("FUZZY_VOCABULARY_TTL_SECONDS", 900))
+    # Facet counts (GET /books/facets): cached per filter combination for this long, this many combinations
+    FACETS_CACHE_TTL_SECONDS: float = float(os.getenv("FACETS_CACHE_TTL_SECONDS", 60))
+    FACETS_CACHE_SIZE: int = int(os.getenv("FACETS_CACHE_SIZE", 1000))
+    # Catalog listings: "database" filters and sorts in SQL, "snapshot" on each worker's columnar
+    # snapshot of the catalog (personalized and bestseller orderings always use the snapshot).
+    # The snapshot picks up changed books (updated_at) this often and reloads in full, which is
+    # when deletions by other workers show up, this often
+    CATALOG_READ_ENGINE: str = os.getenv("CATALOG_READ_ENGINE", "database")
+    CATALOG_SNAPSHOT_REFRESH_SECONDS: float = float(os.getenv("CATALOG_SNAPSHOT_REFRESH_SECONDS", 30))
+    CATALOG_SNAPSHOT_RELOAD_SECONDS: float = float(os.getenv("CATALOG_SNAPSHOT_RELOAD_SECONDS", 3600))
+
     class Config:
         env_file = ".env"
         # For Pydantic v1:
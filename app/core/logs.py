@@ -0,0 +1,222 @@
+"""
+Structured JSON logging that never blocks the event loop.
+
+Records are handed to a bounded in-memory queue (QueueHandler) and written
+to stdout by a QueueListener thread; when the queue is full records are
+dropped and counted rather than waited on. On the way in every record gets
+the current request id, loggers can be sampled (LOG_SAMPLING) and each
+request may emit at most LOG_REQUEST_BUDGET records below ERROR, so a
+chatty hot path cannot flood the pipeline. Drops are exported as the
+logs_dropped_total metric.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import traceback
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+from app.core.metrics import current_scope, registry
+from app.core.tracing import current_span
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+# [records emitted, records suppressed] for the current request
+_budget_var: ContextVar[Optional[List[int]]] = ContextVar("log_budget", default=None)
+
+registry.describe("logs_dropped_total", "counter", "Log records dropped, by reason (queue_full, sampled, budget).")
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "trace_id"}
+# uvicorn passes an ANSI-coloured copy of the message as an extra
+_RESERVED.add("color_message")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            data["request_id"] = request_id
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            data["trace_id"] = trace_id
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = "".join(traceback.format_exception(*record.exc_info))
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking on a full queue."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            registry.inc("logs_dropped_total", {"reason": "queue_full"})
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render the traceback here: the listener thread formats
+        # the record later, when the objects it references may have changed.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+        return record
+
+
+class ContextFilter(logging.Filter):
+    """Adds the request id and applies per-logger sampling and the per-request budget."""
+
+    def __init__(self, sampling: Dict[str, float], request_budget: int):
+        super().__init__()
+        self.sampling = sampling
+        self.request_budget = request_budget
+
+    def _sample_rate(self, name: str) -> float:
+        while True:
+            rate = self.sampling.get(name)
+            if rate is not None:
+                return rate
+            if "." not in name:
+                return 1.0
+            name = name.rsplit(".", 1)[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        span = current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+        if record.levelno >= logging.ERROR:
+            return True
+        if self.sampling:
+            rate = self._sample_rate(record.name)
+            if rate < 1.0 and random.random() >= rate:
+                registry.inc("logs_dropped_total", {"reason": "sampled"})
+                return False
+        budget = _budget_var.get()
+        if budget is not None and self.request_budget > 0:
+            if budget[0] >= self.request_budget:
+                budget[1] += 1
+                registry.inc("logs_dropped_total", {"reason": "budget"})
+                return False
+            budget[0] += 1
+        return True
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """"app.db.slow_queries=0.1,uvicorn.access=0.01" -> {logger: rate}."""
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json", queue_size: int = 10000,
+                      sampling: str = "", request_budget: int = 0) -> None:
+    """Install the queue-based pipeline on the root logger (once per process)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter(parse_sampling(sampling), request_budget))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    def _restart_in_child() -> None:
+        # Threads do not survive fork and the queue's locks may have been held
+        # mid-operation: give preforked workers a fresh queue and listener thread.
+        fresh: queue.Queue = queue.Queue(maxsize=queue_size)
+        queue_handler.queue = fresh
+        _listener.queue = fresh
+        _listener._thread = None
+        _listener.start()
+
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_in_child)
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Write out the queued records and stop the listener thread."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+class RequestContextMiddleware:
+    """
+    Pure ASGI middleware assigning a request id (taken from X-Request-ID when the
+    caller sends one) and opening the request's log budget. The id is returned in
+    the X-Request-ID response header. It also publishes the request's scope
+    (metrics.current_scope), which per-route query statistics and metrics read.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("app.request")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        header = request_id.encode("latin-1")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", header)]
+            await send(message)
+
+        budget = [0, 0]
+        id_token = request_id_var.set(request_id)
+        budget_token = _budget_var.set(budget)
+        scope_token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_scope.reset(scope_token)
+            _budget_var.reset(budget_token)
+            if budget[1]:
+                self.logger.warning("Log budget exceeded", extra={"suppressed": budget[1], "path": scope["path"]})
+            request_id_var.reset(id_token)
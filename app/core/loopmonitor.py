@@ -0,0 +1,168 @@
+"""
+Event loop lag and threadpool saturation monitor.
+
+A task on the event loop wakes up every LOOP_MONITOR_INTERVAL_MS and records
+how late it was woken (the loop's scheduling lag) together with the occupancy
+of the threadpools blocking work is pushed to: anyio's default limiter (sync
+endpoints/dependencies, starlette's run_in_threadpool) and the loop's default
+executor. A watchdog thread watches the task's heartbeat; when the loop has
+not turned for LOOP_STALL_THRESHOLD_MS it captures the loop thread's stack and
+the task that is running, i.e. the code blocking the loop.
+
+The default executor's occupancy and the running task are read from asyncio
+and concurrent.futures internals, which have no public equivalent. Where an
+interpreter lacks them the monitor reports less instead of failing: the
+default executor's pool is left out and stalls are logged without their task.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+from asyncio import tasks as asyncio_tasks
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.profiling import _extract_stack, _short_path
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+registry.describe("event_loop_lag_seconds", "histogram", "How late the loop monitor's periodic wake-up ran.")
+registry.describe("event_loop_lag_max_seconds", "gauge", "Largest event loop lag over the last minute.")
+registry.describe("event_loop_stalls_total", "counter", "Times the event loop did not turn for LOOP_STALL_THRESHOLD_MS.")
+registry.describe("threadpool_threads", "gauge", "Worker threads by pool and state (busy/capacity).")
+registry.describe("threadpool_queue_depth", "gauge", "Calls waiting for a free thread, by pool.")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float, stall_threshold: float, max_stalls: int = 20):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=max_stalls)
+        self.recent_lags: Deque[float] = deque(maxlen=max(int(60 / interval), 1))
+        self.threadpools: Dict[str, Dict[str, int]] = {}
+        self._heartbeat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        # The watchdog thread appends stalls while the loop thread reports them
+        self._stalls_lock = threading.Lock()
+        self._executor_internals = True
+
+    def start(self) -> None:
+        """Start monitoring the running loop (call from a startup handler)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = self._loop.create_task(self._run(), name="loop-monitor")
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(now - expected, 0.0)
+            registry.observe("event_loop_lag_seconds", lag, buckets=LAG_BUCKETS)
+            self.recent_lags.append(lag)
+            self._sample_threadpools()
+
+    def _sample_threadpools(self) -> None:
+        import anyio.to_thread
+
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        self.threadpools["anyio"] = {
+            "busy": int(limiter.borrowed_tokens),
+            "capacity": int(limiter.total_tokens),
+            "waiting": limiter.statistics().tasks_waiting,
+        }
+        executor = getattr(self._loop, "_default_executor", None)
+        if executor is None or not self._executor_internals:
+            return
+        try:
+            queued = executor._work_queue.qsize()
+            threads = len(executor._threads)
+            # Idle threads block on the work queue; the semaphore counts them
+            idle = executor._idle_semaphore._value
+            capacity = executor._max_workers
+        except AttributeError:
+            logger.info("ThreadPoolExecutor internals changed; default executor occupancy is not reported")
+            self._executor_internals = False
+            self.threadpools.pop("default_executor", None)
+            return
+        self.threadpools["default_executor"] = {"busy": max(threads - idle, 0), "capacity": capacity, "waiting": queued}
+
+    def _watch(self) -> None:
+        # One report per stall: the heartbeat we already reported on is remembered
+        reported = None
+        while True:
+            time.sleep(self.interval)
+            if self._task is None or self._task.done():
+                continue
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat
+            if blocked < self.stall_threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            self._record_stall(blocked)
+
+    def _record_stall(self, blocked: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        # current_task() only answers for the calling thread's loop; this is the watchdog thread
+        current_tasks = getattr(asyncio_tasks, "_current_tasks", None)
+        task = current_tasks.get(self._loop) if current_tasks is not None else None
+        stack = [f"{name} ({_short_path(file)}:{line})" for name, file, line in _extract_stack(frame)]
+        # The frame currently executing, rather than where its function starts
+        if frame is not None and stack:
+            stack[-1] = f"{frame.f_code.co_name} ({_short_path(frame.f_code.co_filename)}:{frame.f_lineno})"
+        stall = {
+            "at": time.time(),
+            "blocked_ms": round(blocked * 1000, 1),
+            "task": task.get_name() if task is not None else None,
+            "coroutine": getattr(task.get_coro(), "__qualname__", None) if task is not None else None,
+            "stack": stack,
+        }
+        with self._stalls_lock:
+            self.stalls.append(stall)
+        # Safe off the loop thread: the registry takes its own lock
+        registry.inc("event_loop_stalls_total")
+        logger.warning(
+            "Event loop blocked for %.0fms in %s", blocked * 1000, stack[-1] if stack else "<unknown>",
+            extra={"task": stall["task"], "stack": stack},
+        )
+
+    def max_lag(self) -> float:
+        return max(self.recent_lags, default=0.0)
+
+    def report(self) -> Dict[str, Any]:
+        with self._stalls_lock:
+            stalls = list(reversed(self.stalls))
+        return {
+            "interval_ms": self.interval * 1000,
+            "stall_threshold_ms": self.stall_threshold * 1000,
+            "max_lag_ms": round(self.max_lag() * 1000, 3),
+            "threadpools": self.threadpools,
+            "stalls": stalls,
+        }
+
+
+loop_monitor = LoopMonitor(settings.LOOP_MONITOR_INTERVAL_MS / 1000, settings.LOOP_STALL_THRESHOLD_MS / 1000)
+
+
+@registry.collector
+def _loop_monitor_metrics(reg) -> None:
+    reg.set("event_loop_lag_max_seconds", loop_monitor.max_lag())
+    for pool, stats in loop_monitor.threadpools.items():
+        reg.set("threadpool_threads", stats["busy"], {"pool": pool, "state": "busy"})
+        reg.set("threadpool_threads", stats["capacity"], {"pool": pool, "state": "capacity"})
+        reg.set("threadpool_queue_depth", stats["waiting"], {"pool": pool})
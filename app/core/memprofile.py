@@ -0,0 +1,197 @@
+"""
+tracemalloc control for chasing memory growth in a running worker.
+
+Tracing is started and stopped on demand, or run in one canary worker in
+periodic mode: it traces all along with TRACEMALLOC_PERIODIC_FRAMES frames (1
+by default, the cheapest setting) and snapshots every
+TRACEMALLOC_PERIODIC_SECONDS, so two periodic snapshots compared show what grew
+between them. Snapshots are kept in memory, at most TRACEMALLOC_MAX_SNAPSHOTS
+of them, and any two can be compared grouped by file, by line or by route. Route
+attribution walks each allocation's traceback to the endpoint function it was
+made under, so it needs tracing started with enough frames (TRACEMALLOC_FRAMES);
+periodic snapshots with one frame only support file and line.
+"""
+import asyncio
+import inspect
+import itertools
+import logging
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.profiling import _short_path
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY = ("filename", "lineno", "route")
+NO_ROUTE = "<no route>"
+
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class SnapshotStore:
+    """Bounded, insertion-ordered collection of tracemalloc snapshots."""
+
+    def __init__(self, max_snapshots: int):
+        self.max_snapshots = max_snapshots
+        self.snapshots: "OrderedDict[int, Tuple[float, str, tracemalloc.Snapshot]]" = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def add(self, label: str, snapshot: tracemalloc.Snapshot) -> int:
+        snapshot_id = next(self._ids)
+        self.snapshots[snapshot_id] = (time.time(), label, snapshot)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return snapshot_id
+
+    def get(self, snapshot_id: Optional[int], default_index: int) -> Optional[Tuple[int, tracemalloc.Snapshot]]:
+        """A snapshot by id, or by position (0 oldest, -1 newest) when no id is given."""
+        if snapshot_id is None:
+            if not self.snapshots:
+                return None
+            snapshot_id = list(self.snapshots)[default_index]
+        entry = self.snapshots.get(snapshot_id)
+        return (snapshot_id, entry[2]) if entry else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [
+            {"id": snapshot_id, "created_at": created, "label": label,
+             "traced_bytes": sum(trace.size for trace in snapshot.traces)}
+            for snapshot_id, (created, label, snapshot) in self.snapshots.items()
+        ]
+
+    def clear(self) -> None:
+        self.snapshots.clear()
+
+
+class MemoryProfiler:
+    def __init__(self, frames: int, max_snapshots: int):
+        self.frames = frames
+        self.store = SnapshotStore(max_snapshots)
+        self.periodic_task: Optional[asyncio.Task] = None
+
+    def start(self, frames: Optional[int] = None) -> None:
+        """
+        Start tracing with `frames` frames. Tracing with fewer (periodic mode) is
+        restarted with them, which discards the traces so far: snapshots taken
+        before are not comparable with later ones.
+        """
+        frames = frames or self.frames
+        if tracemalloc.is_tracing():
+            if tracemalloc.get_traceback_limit() >= frames:
+                return
+            tracemalloc.stop()
+        tracemalloc.start(frames)
+        logger.info("tracemalloc started with %s frames", tracemalloc.get_traceback_limit())
+
+    def stop(self) -> None:
+        """Stop tracing and periodic mode; traces are discarded but stored snapshots are kept."""
+        if self.periodic_task is not None:
+            self.periodic_task.cancel()
+            self.periodic_task = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("tracemalloc stopped")
+
+    async def snapshot(self, label: str = "manual") -> int:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing")
+        # Copying every trace takes a while on a big heap; keep it off the loop thread
+        snapshot = await asyncio.get_running_loop().run_in_executor(None, tracemalloc.take_snapshot)
+        return self.store.add(label, snapshot.filter_traces(_FILTERS))
+
+    def start_periodic(self, interval: float, frames: int) -> None:
+        """
+        Trace with `frames` frames (unless already tracing) and snapshot every
+        `interval` seconds (the oldest snapshots roll off).
+        """
+        if self.periodic_task is None or self.periodic_task.done():
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                logger.info("tracemalloc started with %s frames, snapshot every %ss", frames, interval)
+            self.periodic_task = asyncio.get_running_loop().create_task(self._periodic(interval), name="tracemalloc")
+
+    async def _periodic(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.snapshot("periodic")
+            except RuntimeError:
+                return
+
+    def status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "frames": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else self.frames,
+            "periodic": self.periodic_task is not None and not self.periodic_task.done(),
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+            "snapshots": self.store.list(),
+        }
+
+
+def _route_index(routes) -> List[Tuple[str, int, int, str]]:
+    """(file, first line, last line, "METHOD path") of every endpoint function."""
+    index = []
+    for route in routes:
+        endpoint = getattr(route, "endpoint", None)
+        code = getattr(inspect.unwrap(endpoint), "__code__", None) if endpoint else None
+        if code is None:
+            continue
+        last = max((line for _, _, line in code.co_lines() if line), default=code.co_firstlineno)
+        methods = ",".join(sorted(getattr(route, "methods", None) or ()))
+        index.append((code.co_filename, code.co_firstlineno, last, f"{methods} {route.path}".strip()))
+    return index
+
+
+def _route_of(traceback: tracemalloc.Traceback, index: List[Tuple[str, int, int, str]]) -> str:
+    for frame in traceback:
+        for filename, first, last, name in index:
+            if frame.filename == filename and first <= frame.lineno <= last:
+                return name
+    return NO_ROUTE
+
+
+def compare(base: tracemalloc.Snapshot, target: tracemalloc.Snapshot, group_by: str,
+            limit: int, routes=()) -> List[Dict[str, Any]]:
+    """Top allocation growth from `base` to `target`, largest size difference first."""
+    if group_by != "route":
+        rows = [
+            {
+                "location": _short_path(stat.traceback[0].filename) if group_by == "filename"
+                else f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                "size_diff": stat.size_diff,
+                "size": stat.size,
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in target.compare_to(base, group_by)[:limit]
+        ]
+        return rows
+
+    index = _route_index(routes)
+    totals: Dict[str, List[int]] = {}
+    for stat in target.compare_to(base, "traceback"):
+        row = totals.setdefault(_route_of(stat.traceback, index), [0, 0, 0, 0])
+        row[0] += stat.size_diff
+        row[1] += stat.size
+        row[2] += stat.count_diff
+        row[3] += stat.count
+    rows = [
+        {"location": route, "size_diff": size_diff, "size": size, "count_diff": count_diff, "count": count}
+        for route, (size_diff, size, count_diff, count) in totals.items()
+    ]
+    rows.sort(key=lambda row: abs(row["size_diff"]), reverse=True)
+    return rows[:limit]
+
+
+memory_profiler = MemoryProfiler(settings.TRACEMALLOC_FRAMES, settings.TRACEMALLOC_MAX_SNAPSHOTS)
@@ -0,0 +1,357 @@
+"""
+Prometheus metrics without a client library.
+
+Each worker keeps its metrics in plain dicts behind one lock: most recording
+happens on the event loop thread, but logging filters and the loop watchdog
+record from other threads, and a snapshot must not see a dict mid-update. The
+lock is only held for a dict update or copy. With several workers every
+process periodically writes a snapshot to METRICS_DIR/<pid>.json (write to a
+temp file + atomic rename, so nobody ever reads a half-written file) and
+`/metrics` merges all snapshots: counters and histograms are summed, gauges
+are summed over live workers only.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Optional[Dict[str, Any]]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+class Registry:
+    """Counters, gauges and histograms of one worker process."""
+
+    def __init__(self):
+        self.meta: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        # (name, labels) -> [bucket bounds, per-bucket counts (+Inf last), sum]
+        self.histograms: Dict[Tuple[str, Labels], list] = {}
+        self.collectors: List[Callable[["Registry"], None]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self.meta[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 1) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_counter(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        """Publish a counter maintained elsewhere."""
+        with self._lock:
+            self.counters[(name, _labels(labels))] = value
+
+    def counter_values(self, name: str) -> List[Tuple[Labels, float]]:
+        with self._lock:
+            return [(labels, value) for (counter, labels), value in self.counters.items() if counter == name]
+
+    def set(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    def add(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(
+        self, name: str, value: float, labels: Optional[Dict[str, Any]] = None, buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [tuple(buckets), [0] * (len(buckets) + 1), 0.0]
+            histogram[1][bisect_left(histogram[0], value)] += 1
+            histogram[2] += value
+
+    def set_histogram(self, name: str, buckets: Sequence[float], counts: Sequence[int], total: float,
+                      labels: Optional[Dict[str, Any]] = None) -> None:
+        """Publish a histogram maintained elsewhere (non-cumulative counts, +Inf last)."""
+        histogram = [tuple(buckets), list(counts), total]
+        with self._lock:
+            self.histograms[(name, _labels(labels))] = histogram
+
+    def collector(self, fn: Callable[["Registry"], None]) -> Callable[["Registry"], None]:
+        """Register a function refreshing gauges right before a snapshot or scrape."""
+        self.collectors.append(fn)
+        return fn
+
+    def collect(self) -> None:
+        for fn in self.collectors:
+            try:
+                fn(self)
+            except Exception:
+                logger.exception("Metrics collector %s failed", getattr(fn, "__name__", fn))
+
+    def snapshot(self) -> Dict[str, Any]:
+        self.collect()
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "meta": dict(self.meta),
+                "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+                "gauges": [[name, labels, value] for (name, labels), value in self.gauges.items()],
+                "histograms": [[name, labels, list(h[0]), list(h[1]), h[2]] for (name, labels), h in self.histograms.items()],
+            }
+
+
+registry = Registry()
+
+# The ASGI scope of the request being served, for collectors that label by route. Set by
+# logs.RequestContextMiddleware, which runs whether or not metrics are enabled.
+current_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("metrics_scope", default=None)
+
+
+# --- Multi-worker aggregation ---
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_snapshot(directory: str, reg: Registry = registry) -> None:
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(reg.snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def read_snapshots(directory: str) -> List[Dict[str, Any]]:
+    snapshots = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # removed or replaced while listing
+    return snapshots
+
+
+def merge(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    meta: Dict[str, Any] = {}
+    counters: Dict[Tuple[str, Labels], float] = {}
+    gauges: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[Tuple[str, Labels], list] = {}
+    for snap in snapshots:
+        meta.update(snap["meta"])
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        # Gauges describe the current state, which a dead worker no longer has
+        if snap["pid"] == os.getpid() or _pid_alive(snap["pid"]):
+            for name, labels, value in snap["gauges"]:
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0) + value
+        for name, labels, buckets, counts, total in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            if key not in histograms:
+                histograms[key] = [buckets, list(counts), total]
+            elif histograms[key][0] == buckets:
+                merged = histograms[key]
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+    return {"meta": meta, "counters": counters, "gauges": gauges, "histograms": histograms}
+
+
+# --- Exposition format ---
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = tuple(labels) + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(data: Dict[str, Any]) -> str:
+    samples: Dict[str, List[str]] = {}
+    for (name, labels), value in sorted(data["counters"].items()):
+        samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), value in sorted(data["gauges"].items()):
+        samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), (buckets, counts, total) in sorted(data["histograms"].items()):
+        lines = samples.setdefault(name, [])
+        running = 0
+        for bound, count in zip(list(buckets) + [float("inf")], counts):
+            running += count
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', _format_value(bound)),))} {running}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(round(total, 6))}")
+        lines.append(f"{name}_count{_format_labels(labels)} {running}")
+
+    out = []
+    for name in sorted(samples):
+        kind, help_text = data["meta"].get(name, ("untyped", ""))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(samples[name])
+    return "\n".join(out) + "\n"
+
+
+def exposition(directory: Optional[str] = None) -> str:
+    """Metrics of this worker, or of all workers sharing `directory`."""
+    if not directory:
+        return render(merge([registry.snapshot()]))
+    write_snapshot(directory)
+    return render(merge(read_snapshots(directory)))
+
+
+async def flush_periodically(directory: str, interval: float) -> None:
+    """Keep this worker's snapshot fresh for scrapes served by other workers."""
+    while True:
+        try:
+            write_snapshot(directory)
+        except OSError:
+            logger.exception("Could not write metrics snapshot to %s", directory)
+        await asyncio.sleep(interval)
+
+
+# --- HTTP instrumentation ---
+
+registry.describe("http_requests_total", "counter", "HTTP responses by method, route template and status code.")
+registry.describe("http_request_duration_seconds", "histogram", "HTTP request latency by method and route template.")
+registry.describe("http_requests_in_flight", "gauge", "HTTP requests currently being served.")
+
+
+def route_template(scope: dict) -> str:
+    """Route path template ("/api/v1/books/{book_id}") of a routed request."""
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return "<unmatched>"
+    templates = getattr(app.state, "_metrics_route_templates", None)
+    if templates is None:
+        templates = {}
+        for route in app.routes:
+            target = getattr(route, "endpoint", None) or getattr(route, "app", None)
+            if target is not None:
+                templates.setdefault(target, route.path)
+        app.state._metrics_route_templates = templates
+    # Mounted apps (the admin) see their own routes; root_path holds the mount prefix
+    return scope.get("root_path", "") + templates[endpoint] if endpoint in templates else "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, status and in-flight requests."""
+
+    def __init__(self, app, reg: Registry = registry):
+        self.app = app
+        self.registry = reg
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status = 500
+        reg = self.registry
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        reg.add("http_requests_in_flight", 1, {"method": method})
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            reg.add("http_requests_in_flight", -1, {"method": method})
+            route = route_template(scope)
+            reg.inc("http_requests_total", {"method": method, "route": route, "status": status})
+            reg.observe("http_request_duration_seconds", elapsed, {"method": method, "route": route})
+
+
+# --- Cache statistics ---
+
+registry.describe("cache_requests_total", "counter", "Cache lookups by cache and result (hit/miss).")
+registry.describe("cache_hit_ratio", "gauge", "Share of cache lookups that were hits since the worker started.")
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    registry.inc("cache_requests_total", {"cache": cache, "result": "hit" if hit else "miss"})
+
+
+@registry.collector
+def _cache_hit_ratios(reg: Registry) -> None:
+    totals: Dict[str, List[float]] = {}
+    for labels, value in reg.counter_values("cache_requests_total"):
+        label_map = dict(labels)
+        hits_total = totals.setdefault(label_map["cache"], [0, 0])
+        hits_total[1] += value
+        if label_map["result"] == "hit":
+            hits_total[0] += value
+    for cache, (hits, total) in totals.items():
+        reg.set("cache_hit_ratio", hits / total if total else 0.0, {"cache": cache})
+
+
+# --- Database ---
+
+registry.describe("db_queries_total", "counter", "SQL statements executed, by the route that issued them.")
+registry.describe("db_pool_checkouts_total", "counter", "Connections checked out of the pool.")
+registry.describe("db_pool_checkout_timeouts_total", "counter", "Checkouts that gave up after DB_POOL_TIMEOUT.")
+registry.describe("db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a pool connection.")
+registry.describe("db_pool_connections", "gauge", "Pool connections by state.")
+
+
+def instrument_engine(engine) -> None:
+    """Count statements per route and SQLAlchemy compiled-cache hits on `engine`."""
+    from sqlalchemy import event
+    from sqlalchemy.engine.interfaces import CacheStats
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        scope = current_scope.get()
+        registry.inc("db_queries_total", {"route": route_template(scope) if scope else "<background>"})
+        cache_hit = getattr(context, "cache_hit", None)
+        if cache_hit is CacheStats.CACHE_HIT:
+            record_cache("sqlalchemy_compiled", True)
+        elif cache_hit is CacheStats.CACHE_MISS:
+            record_cache("sqlalchemy_compiled", False)
+
+    @registry.collector
+    def _pool(reg: Registry) -> None:
+        from app.db.pool import pool_stats
+
+        snapshot = pool_stats.snapshot(engine.sync_engine.pool)
+        reg.set_counter("db_pool_checkouts_total", snapshot["checkouts"])
+        reg.set_counter("db_pool_checkout_timeouts_total", snapshot["timeouts"])
+        reg.set_histogram("db_pool_checkout_wait_seconds", pool_stats.buckets, pool_stats.wait_counts,
+                          pool_stats.wait_seconds_sum)
+        for state in ("checked_out", "checked_in", "overflow"):
+            if state in snapshot:
+                reg.set("db_pool_connections", snapshot[state], {"state": state})
@@ -0,0 +1,278 @@
+"""
+On-demand statistical profiling of single requests.
+
+A request is profiled when a superuser sends `X-Profile: 1` or when it matches
+the sampling rule (PROFILE_SAMPLE_RATE over the paths in PROFILE_SAMPLE_PATHS).
+While at least one profiled request is running, a background thread samples
+the event loop thread's stack every PROFILE_INTERVAL_MS. Each sample is
+attributed to the profiled request only when its task is the one running;
+otherwise it is recorded as "[awaiting]" (the loop is waiting on I/O while the
+request is suspended) or "[other tasks]", so the profile adds up to wall time.
+
+Profiles are written to PROFILE_DIR as speedscope JSON and collapsed stacks
+(flamegraph.pl / speedscope input), keeping only the PROFILE_MAX_FILES newest.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from asyncio import tasks as asyncio_tasks
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.startup import PROJECT_ROOT
+
+logger = logging.getLogger(__name__)
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+STDLIB = sysconfig.get_paths()["stdlib"]
+MAX_DEPTH = 128
+MAX_SAMPLES = 50_000  # per request; ~4 minutes at the default interval
+
+AWAITING: Tuple[Frame, ...] = (("[awaiting]", "", 0),)
+OTHER_TASKS: Tuple[Frame, ...] = (("[other tasks]", "", 0),)
+
+
+class ProfileSession:
+    def __init__(self, task: asyncio.Task, name: str):
+        self.task = task
+        self.name = name
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.samples: List[Tuple[Tuple[Frame, ...], float]] = []  # (stack, seconds since last sample)
+
+
+class StackSampler:
+    """Samples the stack of the event loop thread for the active sessions."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.sessions: Dict[int, ProfileSession] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+
+    def start(self, name: str) -> ProfileSession:
+        session = ProfileSession(asyncio.current_task(), name)
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self.sessions[id(session)] = session
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+            self._thread.start()
+        self._wake.set()
+        return session
+
+    def stop(self, session: ProfileSession) -> ProfileSession:
+        self.sessions.pop(id(session), None)
+        session.finished = time.perf_counter()
+        return session
+
+    def _run(self) -> None:
+        # The thread sleeps on an event while nothing is being profiled
+        last = time.perf_counter()
+        while True:
+            if not self.sessions:
+                self._wake.wait()
+                self._wake.clear()
+                last = time.perf_counter()
+                continue
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frame = sys._current_frames().get(self._loop_thread_id)
+            running = asyncio_tasks._current_tasks.get(self._loop)
+            stack = None
+            for session in list(self.sessions.values()):
+                if len(session.samples) >= MAX_SAMPLES:
+                    continue
+                if running is session.task:
+                    if stack is None:
+                        stack = _extract_stack(frame)
+                    session.samples.append((stack, elapsed))
+                else:
+                    session.samples.append((AWAITING if running is None else OTHER_TASKS, elapsed))
+
+
+def _extract_stack(frame) -> Tuple[Frame, ...]:
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _short_path(path: str) -> str:
+    if "site-packages" + os.sep in path:
+        return path.split("site-packages" + os.sep, 1)[1]
+    if path.startswith(PROJECT_ROOT + os.sep):
+        return os.path.relpath(path, PROJECT_ROOT)
+    if path.startswith(STDLIB + os.sep):
+        return os.path.relpath(path, STDLIB)
+    return path
+
+
+def to_collapsed(session: ProfileSession) -> str:
+    """Brendan Gregg's collapsed format, counts in microseconds."""
+    weights: Counter = Counter()
+    for stack, elapsed in session.samples:
+        weights[";".join(f"{name} ({_short_path(file)}:{line})" if file else name for name, file, line in stack)] += elapsed
+    return "".join(f"{stack} {int(us * 1e6)}\n" for stack, us in weights.most_common())
+
+
+def to_speedscope(session: ProfileSession) -> Dict[str, Any]:
+    frames: Dict[Frame, int] = {}
+    samples, weights = [], []
+    for stack, elapsed in session.samples:
+        samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+        weights.append(round(elapsed * 1000, 3))
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": session.name,
+        "exporter": "bookshop-profiler",
+        "shared": {
+            "frames": [{"name": name, "file": _short_path(file), "line": line} for name, file, line in frames]
+        },
+        "profiles": [{
+            "type": "sampled",
+            "name": session.name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": round(sum(weights), 3),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of request profiles."""
+
+    FORMATS = {"speedscope": ".speedscope.json", "collapsed": ".collapsed.txt"}
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+
+    def save(self, profile_id: str, session: ProfileSession) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile_id)
+        with open(base + ".collapsed.txt", "w") as f:
+            f.write(to_collapsed(session))
+        # Written last: a profile is listed once its speedscope file exists
+        with open(base + ".speedscope.json.tmp", "w") as f:
+            json.dump(to_speedscope(session), f)
+        os.replace(base + ".speedscope.json.tmp", base + ".speedscope.json")
+        self._evict()
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".speedscope.json"):
+                profile_id = entry.name[: -len(".speedscope.json")]
+                stat = entry.stat()
+                profiles.append({"id": profile_id, "created_at": stat.st_mtime, "size_bytes": stat.st_size})
+        return sorted(profiles, key=lambda p: p["id"], reverse=True)
+
+    def path(self, profile_id: str, fmt: str) -> Optional[str]:
+        if fmt not in self.FORMATS or os.sep in profile_id or profile_id.startswith("."):
+            return None
+        path = os.path.join(self.directory, profile_id + self.FORMATS[fmt])
+        return path if os.path.isfile(path) else None
+
+    def _evict(self) -> None:
+        for profile in self.list()[self.max_files:]:
+            for suffix in self.FORMATS.values():
+                try:
+                    os.remove(os.path.join(self.directory, profile["id"] + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+sampler = StackSampler(settings.PROFILE_INTERVAL_MS / 1000)
+profile_store = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_MAX_FILES)
+
+
+def new_profile_id() -> str:
+    # Sortable by time, unique across workers
+    return f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling requests from superusers that send
+    `X-Profile: 1`, plus a random share of requests under the sampled paths.
+    The response carries the profile id in `X-Profile-Id`.
+    """
+
+    def __init__(self, app, sampler: StackSampler, store: ProfileStore,
+                 sample_rate: float = 0.0, sample_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.sampler = sampler
+        self.store = store
+        self.sample_rate = sample_rate
+        self.sample_paths = sample_paths
+
+    def _sampled(self, path: str) -> bool:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return False
+        return not self.sample_paths or path.startswith(self.sample_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        wants_profile = headers.get(b"x-profile") == b"1" and await _is_superuser(headers.get(b"authorization"))
+        if not wants_profile and not self._sampled(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = new_profile_id()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        session = self.sampler.start(f"{scope['method']} {scope['path']}")
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.sampler.stop(session)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.store.save, profile_id, session)
+            except OSError:
+                logger.exception("Could not store profile %s", profile_id)
+
+
+async def _is_superuser(authorization: Optional[bytes]) -> bool:
+    """Resolve the bearer token through the regular auth dependencies."""
+    if not authorization or not authorization.lower().startswith(b"bearer "):
+        return False
+    from fastapi import HTTPException
+
+    from app.api import deps
+    from app.db.base import AsyncSessionLocal
+
+    token = authorization[7:].decode("latin-1").strip()
+    async with AsyncSessionLocal() as db:
+        try:
+            user = await deps.get_current_user(db=db, token=token)
+            user = await deps.get_current_active_user(current_user=user)
+            await deps.get_current_active_superuser(current_user=user)
+        except HTTPException:
+            return False
+    return True
@@ -1,3 +1,7 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Union, Any
 
@@ -5,6 +9,9 @@ from jose import jwt, JWTError
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.metrics import registry
+
+logger = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -18,6 +25,35 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+# bcrypt is deliberately slow; running it on the event loop would stall every other request
+password_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+registry.describe("password_hash_queue_depth", "gauge", "Password hash/verify calls waiting for a bcrypt thread.")
+registry.describe("password_hash_in_flight", "gauge", "Password hash/verify calls submitted and not finished.")
+registry.describe("password_hash_seconds", "histogram", "Password hash/verify latency including queueing.")
+
+
+@registry.collector
+def _password_executor_depth(reg) -> None:
+    reg.set("password_hash_queue_depth", password_executor._work_queue.qsize())
+
+
+async def _run_password_op(op: str, fn, *args):
+    registry.add("password_hash_in_flight", 1)
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, fn, *args)
+    finally:
+        registry.add("password_hash_in_flight", -1)
+        registry.observe("password_hash_seconds", time.perf_counter() - started, {"op": op})
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_op("verify", verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_op("hash", get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -26,9 +62,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 def decode_access_token(token: str) -> Optional[dict]:
-    print(f"Decoding token: {token}")
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
-    except JWTError:
+    except JWTError as e:
+        # Never log the token itself
+        logger.debug("Rejected access token: %s", e)
         return None
\ No newline at end of file
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Set
+
+# Nothing heavy at import time: app.main imports this module first, so that
+# boot_timer starts before the imports it times
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+ALEMBIC_INI = os.path.join(PROJECT_ROOT, "alembic.ini")
+
+
+class BootTimer:
+    """
+    Collects wall-clock durations of the boot phases of a worker
+    (imports, route setup, engine/schema bootstrap) and of its first request.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self._last_mark = self.started_at
+        self.phases: Dict[str, float] = {}
+        self.ready_at: Optional[float] = None
+        self.first_request: Optional[Dict[str, float]] = None
+
+    def mark(self, phase: str) -> None:
+        """Record the time spent since the previous mark under `phase`."""
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self._last_mark) * 1000, 2)
+        self._last_mark = now
+
+    def mark_forked(self) -> None:
+        """
+        Start the next phase now, in a worker forked from a preloaded master: the
+        import phases are the master's, and its time idling before the fork is no
+        part of the worker's boot.
+        """
+        self._last_mark = time.perf_counter()
+
+    def mark_ready(self) -> None:
+        self.ready_at = time.perf_counter()
+
+    def record_first_request(self, started: float) -> None:
+        finished = time.perf_counter()
+        self.first_request = {
+            "latency_ms": round((finished - started) * 1000, 2),
+            "since_ready_ms": round((started - (self.ready_at or self.started_at)) * 1000, 2),
+        }
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "phases_ms": dict(self.phases),
+            "boot_ms": round(sum(self.phases.values()), 2),
+            "first_request": self.first_request,
+        }
+
+
+boot_timer = BootTimer()
+
+
+class FirstRequestTimer:
+    """
+    Pure ASGI middleware that times the first HTTP request served by the worker
+    and then stays out of the way.
+    """
+
+    def __init__(self, app, timer: BootTimer = boot_timer):
+        self.app = app
+        self.timer = timer
+        self._pending = True
+
+    async def __call__(self, scope, receive, send):
+        if not self._pending or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self._pending = False
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.timer.record_first_request(started)
+
+
+class LazyAdmin:
+    """
+    ASGI app mounted at /admin that only imports SQLAdmin and builds the panel
+    when the first admin request arrives, so API-only workers never pay for it.
+    """
+
+    def __init__(self):
+        self._app = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def routes(self):
+        # Used by Starlette's url_for to resolve "admin:*" route names
+        return self._app.routes if self._app is not None else []
+
+    async def __call__(self, scope, receive, send):
+        if self._app is None:
+            async with self._lock:
+                if self._app is None:
+                    from app.api.routers.sqladmin import build_admin_app
+                    self._app = build_admin_app()
+        await self._app(scope, receive, send)
+
+
+def get_alembic_heads() -> Set[str]:
+    """Return the head revision(s) of the migration scripts shipped with the app."""
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(PROJECT_ROOT, "alembic"))
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+def _get_database_heads(sync_conn) -> Set[str]:
+    from alembic.runtime.migration import MigrationContext
+
+    return set(MigrationContext.configure(sync_conn).get_current_heads())
+
+
+async def check_alembic_head(engine: "AsyncEngine") -> None:
+    """
+    Make sure the database has been migrated to the Alembic head.
+    Raises RuntimeError so a misconfigured worker fails fast instead of serving errors.
+    """
+    expected = get_alembic_heads()
+    async with engine.connect() as conn:
+        current = await conn.run_sync(_get_database_heads)
+    if current != expected:
+        raise RuntimeError(
+            f"Database schema is at revision {sorted(current) or 'base'}, "
+            f"expected Alembic head {sorted(expected)}. Run `alembic upgrade head` first."
+        )
+
+
+async def bootstrap_schema(engine: "AsyncEngine", mode: str) -> None:
+    """
+    Prepare the schema according to SCHEMA_BOOTSTRAP:
+      - "create_all": create missing tables (development default).
+      - "check_head": only verify the Alembic revision (production).
+      - "skip": do nothing.
+    """
+    if mode == "create_all":
+        from app.db.base import Base
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    elif mode == "check_head":
+        await check_alembic_head(engine)
+    elif mode != "skip":
+        raise ValueError(f"Unknown SCHEMA_BOOTSTRAP mode: {mode}")
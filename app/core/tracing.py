@@ -0,0 +1,328 @@
+"""
+Minimal request tracing with the OpenTelemetry span data model.
+
+Spans are opened by TracingMiddleware (one server span per request), by
+functions decorated with @traced (dependencies), by classes decorated with
+@traced_methods (the CRUD objects) and by engine hooks (one span per SQL
+statement). W3C `traceparent` headers are honoured on the way in and returned
+on the way out.
+
+Only sampled requests carry a span in the context; everywhere else the
+instrumentation is a single ContextVar lookup, so leaving it enabled with a
+low TRACE_SAMPLE_RATE costs next to nothing. Finished spans are written as
+OTLP/JSON-like lines to stdout or the file named by TRACE_EXPORTER by a
+background thread. The thread is started by the first span a process exports
+(and again in a forked child, where the parent's thread does not exist), and
+its queue is bounded: spans it cannot take are dropped and counted in
+trace_spans_dropped_total.
+"""
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.metrics import registry, route_template
+
+SPAN_KIND_INTERNAL = "SPAN_KIND_INTERNAL"
+SPAN_KIND_SERVER = "SPAN_KIND_SERVER"
+SPAN_KIND_CLIENT = "SPAN_KIND_CLIENT"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str] = None,
+                 kind: str = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def child(self, name: str, kind: str = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None) -> "Span":
+        return Span(name, self.trace_id, self.span_id, kind, attributes)
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+        exporter.export(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_UNSET"},
+        }
+
+
+registry.describe("trace_spans_dropped_total", "counter", "Finished spans dropped because the export queue was full.")
+
+
+class SpanExporter:
+    """Writes finished spans as JSON lines from a daemon thread, off the event loop."""
+
+    def __init__(self, max_queue: int = 10000):
+        self.max_queue = max_queue
+        self._target: Optional[str] = None
+        self._queue: "Optional[queue.Queue[Optional[Span]]]" = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget_thread)
+
+    def configure(self, target: str, max_queue: Optional[int] = None) -> None:
+        """`target` is "stdout" or a file path. Nothing is started until a span is exported."""
+        self._target = target
+        if max_queue is not None:
+            self.max_queue = max_queue
+
+    def export(self, span: Span) -> None:
+        if self._target is None:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            registry.inc("trace_spans_dropped_total")
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._queue = queue.Queue(self.max_queue)
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def _forget_thread(self) -> None:
+        # Only the forking thread survives fork(): the child starts its own exporter on its first span
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self, spans: "queue.Queue[Optional[Span]]") -> None:
+        out = sys.stdout if self._target == "stdout" else open(self._target, "a", buffering=1)
+        while True:
+            span = spans.get()
+            if span is None:
+                break
+            out.write(json.dumps(span.to_dict()) + "\n")
+            if spans.empty():
+                out.flush()
+
+
+exporter = SpanExporter()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+# --- W3C trace context ---
+
+def parse_traceparent(header: str) -> Optional[Tuple[str, str, bool]]:
+    """Return (trace_id, parent_span_id, sampled) from a `traceparent` header."""
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    _, trace_id, span_id, flags = parts[:4]
+    if len(trace_id) != 32 or len(span_id) != 16 or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    return trace_id, span_id, sampled
+
+
+# --- Instrumentation helpers ---
+
+class _SpanScope:
+    """Context manager making a child span of the current one current."""
+
+    __slots__ = ("name", "attributes", "span", "token")
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attributes = attributes
+        self.span: Optional[Span] = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current_span.get()
+        if parent is not None:
+            self.span = parent.child(self.name, attributes=self.attributes)
+            self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.span is not None:
+            if exc is not None:
+                self.span.error = f"{exc_type.__name__}: {exc}"
+            _current_span.reset(self.token)
+            self.span.end()
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None) -> _SpanScope:
+    """`with start_span("name"):` traces the block when the request is sampled."""
+    return _SpanScope(name, attributes)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator opening a span around an async function (e.g. a FastAPI dependency)."""
+
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return await fn(*args, **kwargs)
+            with _SpanScope(span_name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def traced_methods(cls: type) -> type:
+    """
+    Class decorator tracing every public coroutine method defined on `cls`.
+    Spans are named after the runtime class, so inherited CRUDBase methods
+    show up as e.g. "CRUDBook.get".
+    """
+    for attr, fn in list(vars(cls).items()):
+        if attr.startswith("_") or not inspect.iscoroutinefunction(fn):
+            continue
+
+        def make_wrapper(fn: Callable, attr: str) -> Callable:
+            @functools.wraps(fn)
+            async def wrapper(self, *args, **kwargs):
+                if _current_span.get() is None:
+                    return await fn(self, *args, **kwargs)
+                with _SpanScope(f"{type(self).__name__}.{attr}"):
+                    return await fn(self, *args, **kwargs)
+            return wrapper
+
+        setattr(cls, attr, make_wrapper(fn, attr))
+    return cls
+
+
+# --- SQL ---
+
+def instrument_engine(engine, max_statement_length: int = 1000) -> None:
+    """One client span per SQL statement executed while a sampled span is current."""
+    from sqlalchemy import event
+
+    sync_engine = engine.sync_engine
+    system = sync_engine.dialect.name
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is not None:
+            context._trace_span = parent.child(
+                statement.split(None, 1)[0].upper() if statement else "SQL",
+                SPAN_KIND_CLIENT,
+                {"db.system": system, "db.statement": statement[:max_statement_length]},
+            )
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            context._trace_span = None
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span.attributes["db.rows"] = cursor.rowcount
+            span.end()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None) if context is not None else None
+        if span is not None:
+            context._trace_span = None
+            span.error = repr(exception_context.original_exception)
+            span.end()
+
+
+# --- HTTP ---
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware opening the server span of sampled requests.
+    Sampling is parent-based: a sampled incoming traceparent is always traced,
+    other requests are traced with probability `sample_rate`.
+    """
+
+    def __init__(self, app, sample_rate: float = 0.0):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1"))
+                break
+        if parent is not None:
+            sampled = parent[2]
+        else:
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_span_id = (parent[0], parent[1]) if parent else (os.urandom(16).hex(), None)
+        span = Span(
+            f"{scope['method']} {scope['path']}", trace_id, parent_span_id, SPAN_KIND_SERVER,
+            {"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        header = span.traceparent().encode()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                span.attributes["http.status_code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"traceparent", header)]
+            await send(message)
+
+        token = _current_span.set(span)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            span.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            _current_span.reset(token)
+            route = route_template(scope)
+            if route != "<unmatched>":
+                span.name = f"{scope['method']} {route}"
+                span.attributes["http.route"] = route
+            span.end()
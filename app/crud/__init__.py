@@ -0,0 +1,4 @@
+from .crud_book import book
+from .crud_purchase import purchase
+from .crud_recommendation import recommendation
+from .crud_user import user
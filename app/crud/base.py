@@ -2,14 +2,16 @@ from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, update as sql_update, delete as sql_delete
+from sqlalchemy import Integer, bindparam, func, update as sql_update, delete as sql_delete
 
 from app.db.base import Base
+from app.core.tracing import traced_methods
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+@traced_methods
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
         """
@@ -21,17 +23,23 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         * `schema`: A Pydantic model (schema) class
         """
         self.model = model
+        # Hot read statements are built once and executed with bound parameters,
+        # so SQLAlchemy reuses their memoized cache key and compiled form.
+        self._get_stmt = select(model).filter(model.id == bindparam("id"))
+        self._get_multi_stmt = (
+            select(model)
+            .offset(bindparam("skip", type_=Integer))
+            .limit(bindparam("limit", type_=Integer))
+        )
 
     async def get(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
-        result = await db.execute(select(self.model).filter(self.model.id == id))
+        result = await db.execute(self._get_stmt, {"id": id})
         return result.scalars().first()
 
     async def get_multi(
         self, db: AsyncSession, *, skip: int = 0, limit: int = 100
     ) -> List[ModelType]:
-        result = await db.execute(
-            select(self.model).offset(skip).limit(limit)
-        )
+        result = await db.execute(self._get_multi_stmt, {"skip": skip, "limit": limit})
         return result.scalars().all()
 
     async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
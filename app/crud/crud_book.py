@@ -1,17 +1,51 @@
-from typing import List, Optional, Tuple
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, update, delete, and_
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy import func, update, delete, and_, or_, lambda_stmt, event
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+from sqlalchemy.orm import Session, selectinload, joinedload, object_session
 
 from app.crud.base import CRUDBase
 from app.db.models.book import Book, Comment, Rating, BookAvailability
 from app.db.models.user import User
-from app.schemas import BookCreate, BookUpdate, RatingCreate # Added RatingCreate
+from app.schemas import BookCreate, BookUpdate, BookSort, CommentCreate, RatingCreate # Added RatingCreate
+from app.core.config import settings
+from app.core.metrics import record_cache
+from app.core.tracing import traced_methods
+from app.db.catalog import catalog_store
+from app.db.fuzzy import Terms, fuzzy_matcher
+from app.db.personalization import personalizer
+from app.db.sales import sales_tracker
+
+
+def _matches_terms(column, terms: Terms):
+    return and_(*[or_(*[column.ilike(f"%{word}%") for word in group]) for group in terms])
+
 
+# One lambda per sort, so each gets its own cached statement; every one of them is
+# an ordered scan of an index on books (see the model's __table_args__). Ties go by
+# id, as in the catalog snapshot, so both read engines return the same pages.
+_ORDER_BY = {
+    BookSort.TITLE: lambda s: s.order_by(Book.title, Book.id),
+    BookSort.PRICE: lambda s: s.order_by(Book.cost, Book.id),
+    BookSort.PRICE_DESC: lambda s: s.order_by(Book.cost.desc(), Book.id.desc()),
+    BookSort.NEWEST: lambda s: s.order_by(Book.publication_date.desc().nulls_last(), Book.id.desc()),
+    BookSort.RATING: lambda s: s.order_by(Book.average_rating.desc().nulls_last(), Book.id.desc()),
+}
 
+
+@traced_methods
 class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
 
+    def __init__(self, model):
+        super().__init__(model)
+        # Facet counts per filter combination: key -> (expires at, counts)
+        self._facets: "OrderedDict[tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
     async def create_book(self, db: AsyncSession, *, obj_in: BookCreate) -> Book:
         return await self.create(db=db, obj_in=obj_in)
 
@@ -26,6 +60,70 @@ class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
     async def delete_book(self, db: AsyncSession, *, book_id: int) -> Optional[Book]:
         return await self.remove(db=db, id=book_id)
 
+    def _apply_filters(
+        self,
+        stmt: StatementLambdaElement,
+        *,
+        author: Optional[str] = None,
+        genre: Optional[str] = None,
+        availability: Optional[BookAvailability] = None,
+        language: Optional[str] = None,
+        title: Optional[str] = None,
+        min_cost: Optional[float] = None,
+        max_cost: Optional[float] = None,
+        published_from: Optional[date] = None,
+        published_to: Optional[date] = None,
+        min_rating: Optional[float] = None,
+        terms: Optional[Dict[str, Terms]] = None,
+    ) -> StatementLambdaElement:
+        # Each filter is a lambda step: SQLAlchemy caches one compiled statement per
+        # combination of filters and passes the values as bound parameters.
+        model = self.model
+        terms = terms or {}
+        if author and "author" in terms:
+            author_condition = _matches_terms(model.author, terms["author"])
+            stmt += lambda s: s.filter(author_condition)
+        elif author:
+            author_pattern = f"%{author}%"
+            stmt += lambda s: s.filter(model.author.ilike(author_pattern))
+        if title and "title" in terms:
+            title_condition = _matches_terms(model.title, terms["title"])
+            stmt += lambda s: s.filter(title_condition)
+        elif title:
+            title_pattern = f"%{title}%"
+            stmt += lambda s: s.filter(model.title.ilike(title_pattern))
+        if genre:
+            genre_pattern = f"%{genre}%"
+            stmt += lambda s: s.filter(model.genre.ilike(genre_pattern))
+        if availability:
+            stmt += lambda s: s.filter(model.availability_status == availability)
+        if language:
+            language_pattern = f"%{language}%"
+            stmt += lambda s: s.filter(model.language.ilike(language_pattern))
+        if min_cost is not None:
+            stmt += lambda s: s.filter(model.cost >= min_cost)
+        if max_cost is not None:
+            stmt += lambda s: s.filter(model.cost <= max_cost)
+        if published_from is not None:
+            stmt += lambda s: s.filter(model.publication_date >= published_from)
+        if published_to is not None:
+            stmt += lambda s: s.filter(model.publication_date <= published_to)
+        if min_rating is not None:
+            stmt += lambda s: s.filter(model.average_rating >= min_rating)
+        return stmt
+
+    async def _fuzzy_terms(self, db: AsyncSession, *, author: Optional[str], title: Optional[str]) -> Dict[str, Terms]:
+        """The author and title filters with every word widened to its spelling corrections."""
+        if not author and not title:
+            return {}
+        index = await fuzzy_matcher.get(db)
+        terms = {}
+        if author:
+            terms["author"] = index.author.terms(author)
+        if title:
+            terms["title"] = index.title.terms(title)
+        return terms
+
     async def get_multi_filtered(
         self,
         db: AsyncSession,
@@ -35,80 +133,184 @@ class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
         author: Optional[str] = None,
         genre: Optional[str] = None,
         availability: Optional[BookAvailability] = None,
-        language: Optional[str] = None
+        language: Optional[str] = None,
+        title: Optional[str] = None,
+        min_cost: Optional[float] = None,
+        max_cost: Optional[float] = None,
+        published_from: Optional[date] = None,
+        published_to: Optional[date] = None,
+        min_rating: Optional[float] = None,
+        fuzzy: bool = False,
+        sort: BookSort = BookSort.TITLE,
+        user_id: Optional[int] = None,
     ) -> Tuple[List[Book], int]:
-        query = select(self.model)
-        count_query = select(func.count()).select_from(self.model)
-
-        filters = []
-        if author:
-            filters.append(self.model.author.ilike(f"%{author}%"))
-        if genre:
-            filters.append(self.model.genre.ilike(f"%{genre}%"))
-        if availability:
-            filters.append(self.model.availability_status == availability)
-        if language:
-             filters.append(self.model.language.ilike(f"%{language}%"))
-
-        if filters:
-            query = query.filter(and_(*filters))
-            count_query = count_query.filter(and_(*filters))
+        model = self.model
+        filters = dict(
+            author=author, genre=genre, availability=availability, language=language, title=title,
+            min_cost=min_cost, max_cost=max_cost, published_from=published_from, published_to=published_to,
+            min_rating=min_rating,
+        )
+        if fuzzy:
+            filters["terms"] = await self._fuzzy_terms(db, author=author, title=title)
+        if sort in (BookSort.PERSONALIZED, BookSort.BESTSELLING) or settings.CATALOG_READ_ENGINE == "snapshot":
+            return await self._get_from_snapshot(db, sort=sort, skip=skip, limit=limit, user_id=user_id, **filters)
+        query = self._apply_filters(lambda_stmt(lambda: select(model)), **filters)
+        count_query = self._apply_filters(
+            lambda_stmt(lambda: select(func.count()).select_from(model)), **filters
+        )
 
         total_count_result = await db.execute(count_query)
         total_count = total_count_result.scalar_one()
 
-        result = await db.execute(
-             query.order_by(self.model.title).offset(skip).limit(limit)
-        )
+        query += _ORDER_BY[sort]
+        query += lambda s: s.offset(skip).limit(limit)
+        result = await db.execute(query)
         books = result.scalars().all()
         return books, total_count
 
-    async def get_book_with_details(self, db: AsyncSession, *, book_id: int) -> Optional[Book]:
-        avg_rating_subquery = (
-            select(func.avg(Rating.score).label("avg_rating"))
-            .filter(Rating.book_id == book_id)
-            .scalar_subquery()
+    async def _get_from_snapshot(
+        self, db: AsyncSession, *, sort: BookSort, skip: int, limit: int, user_id: Optional[int], **filters
+    ) -> Tuple[List[Book], int]:
+        """
+        Filter and order the catalog on the worker's snapshot, then load just the
+        page: ranked by sales over the last month, for `user_id` (by popularity
+        alone for anonymous users), or in one of the column orders.
+        """
+        catalog = await catalog_store.get(db)
+        terms = filters.get("terms") or {}
+        mask = catalog.mask(**{name: terms.get(name, value) for name, value in filters.items() if name != "terms"})
+        if sort == BookSort.BESTSELLING:
+            book_ids, total_count = catalog.rank(catalog.align(*sales_tracker.arrays("month")), mask, skip, limit)
+        elif sort == BookSort.PERSONALIZED:
+            book_ids, total_count = catalog.rank(await personalizer.scores(db, catalog, user_id), mask, skip, limit)
+        else:
+            book_ids, total_count = catalog.page(sort.value, mask, skip, limit)
+        model = self.model
+        if not book_ids:
+            return [], total_count
+        # The filters again: the snapshot may be older than the rows
+        query = self._apply_filters(lambda_stmt(lambda: select(model).filter(model.id.in_(book_ids))), **filters)
+        result = await db.execute(query)
+        books = {book.id: book for book in result.scalars().all()}
+        return [books[book_id] for book_id in book_ids if book_id in books], total_count
+
+    async def get_facets(
+        self,
+        db: AsyncSession,
+        *,
+        author: Optional[str] = None,
+        genre: Optional[str] = None,
+        availability: Optional[BookAvailability] = None,
+        language: Optional[str] = None,
+        title: Optional[str] = None,
+        min_cost: Optional[float] = None,
+        max_cost: Optional[float] = None,
+        published_from: Optional[date] = None,
+        published_to: Optional[date] = None,
+        min_rating: Optional[float] = None,
+        fuzzy: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Number of books per genre, language and availability status under the
+        filters, from one grouped query: GROUPING SETS on PostgreSQL, the
+        (genre, language, availability) groups summed up per facet elsewhere.
+        Cached per filter combination for FACETS_CACHE_TTL_SECONDS; a book write
+        committed in this worker drops the cache (see _book_writes_committed).
+        """
+        filters = dict(
+            author=author, genre=genre, availability=availability, language=language, title=title,
+            min_cost=min_cost, max_cost=max_cost, published_from=published_from, published_to=published_to,
+            min_rating=min_rating,
         )
+        key = (*filters.values(), fuzzy)
+        entry = self._facets.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            self._facets.move_to_end(key)
+            record_cache("facets", True)
+            return entry[1]
+        record_cache("facets", False)
+
+        model = self.model
+        if fuzzy:
+            filters["terms"] = await self._fuzzy_terms(db, author=author, title=title)
+        grouped = db.get_bind().dialect.name == "postgresql"
+        if grouped:
+            query = self._apply_filters(lambda_stmt(lambda: select(
+                model.genre, model.language, model.availability_status,
+                func.grouping(model.genre, model.language, model.availability_status), func.count(),
+            )), **filters)
+            query += lambda s: s.group_by(func.grouping_sets(model.genre, model.language, model.availability_status))
+        else:
+            query = self._apply_filters(lambda_stmt(lambda: select(
+                model.genre, model.language, model.availability_status, func.count(),
+            )), **filters)
+            query += lambda s: s.group_by(model.genre, model.language, model.availability_status)
+        rows = (await db.execute(query)).all()
 
+        names = ("genre", "language", "availability")
+        # GROUPING() has a bit set for each column aggregated away: 0b011 is the genre set
+        grouping_sets = {0b011: (0,), 0b101: (1,), 0b110: (2,)}
+        counts: Dict[str, Dict[Optional[str], int]] = {name: {} for name in names}
+        for row in rows:
+            for position in grouping_sets[row[3]] if grouped else (0, 1, 2):
+                value = row[position].value if isinstance(row[position], BookAvailability) else row[position]
+                facet = counts[names[position]]
+                facet[value] = facet.get(value, 0) + row[-1]
+        facets: Dict[str, Any] = {
+            facet: [
+                {"value": value, "count": count}
+                for value, count in sorted(values.items(), key=lambda item: (-item[1], item[0] or ""))
+            ]
+            for facet, values in counts.items()
+        }
+        # Every book has an availability status, so that facet adds up to the total
+        facets["total"] = sum(counts["availability"].values())
+
+        self._facets[key] = (now + settings.FACETS_CACHE_TTL_SECONDS, facets)
+        self._facets.move_to_end(key)
+        while len(self._facets) > settings.FACETS_CACHE_SIZE:
+            self._facets.popitem(last=False)
+        return facets
+
+    async def get_book_with_details(self, db: AsyncSession, *, book_id: int) -> Optional[Book]:
+        # average_rating is a column kept up to date by add_or_update_rating
         result = await db.execute(
-            select(self.model, avg_rating_subquery)
-            .outerjoin(Rating, self.model.id == Rating.book_id)
+            select(self.model)
             .options(
                 selectinload(self.model.comments).options(joinedload(Comment.user, innerjoin=False)),
                 selectinload(self.model.ratings).options(joinedload(Rating.user, innerjoin=False))
              )
             .filter(self.model.id == book_id)
-            .group_by(self.model.id)
         )
-
-        row = result.first()
-        if row:
-            book_obj, avg_rating = row # Renamed book to book_obj to avoid shadowing module
-            book_obj.average_rating = float(avg_rating) if avg_rating is not None else None
-            return book_obj
-        return None
+        return result.scalars().first()
 
     async def add_favorite(self, db: AsyncSession, *, user: User, book: Book) -> None:
         if user not in db:
             user = await db.merge(user)
         if book not in db:
             book = await db.merge(book)
+        # Async sessions cannot lazy-load the collection on attribute access
+        await db.refresh(user, ["favorite_books"])
 
         if book not in user.favorite_books:
             user.favorite_books.append(book)
             db.add(user)
             await db.commit()
+            personalizer.invalidate(user.id)
 
     async def remove_favorite(self, db: AsyncSession, *, user: User, book: Book) -> None:
         if user not in db:
             user = await db.merge(user)
         if book not in db:
             book = await db.merge(book)
+        await db.refresh(user, ["favorite_books"])
 
         if book in user.favorite_books:
             user.favorite_books.remove(book)
             db.add(user)
             await db.commit()
+            personalizer.invalidate(user.id)
 
     async def get_user_favorites(
         self,
@@ -128,6 +330,30 @@ class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
         )
         return result.scalars().all()
 
+    # --- Comment Methods ---
+
+    async def add_comment(
+        self, db: AsyncSession, *, obj_in: CommentCreate, book_id: int, user_id: int
+    ) -> Comment:
+        db_comment = Comment(**obj_in.dict(), book_id=book_id, user_id=user_id)
+        db.add(db_comment)
+        await db.commit()
+        await db.refresh(db_comment, ["user"])
+        return db_comment
+
+    async def get_book_comments(
+        self, db: AsyncSession, *, book_id: int, skip: int = 0, limit: int = 100
+    ) -> List[Comment]:
+        result = await db.execute(
+            select(Comment)
+            .options(joinedload(Comment.user))
+            .filter(Comment.book_id == book_id)
+            .order_by(Comment.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
     # --- Rating Methods Re-added ---
 
     async def add_or_update_rating(
@@ -145,7 +371,18 @@ class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
             db_rating = Rating(**obj_in.dict(), book_id=book_id, user_id=user_id)
             db.add(db_rating)
 
+        # Refresh the book's rating columns in the same transaction
+        await db.flush()
+        await db.execute(
+            update(self.model)
+            .filter(self.model.id == book_id)
+            .values(
+                average_rating=select(func.avg(Rating.score)).filter(Rating.book_id == book_id).scalar_subquery(),
+                rating_count=select(func.count()).select_from(Rating).filter(Rating.book_id == book_id).scalar_subquery(),
+            )
+        )
         await db.commit()
+        catalog_store.invalidate()
         await db.refresh(db_rating, ["user"])
         return db_rating
 
@@ -170,4 +407,36 @@ class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
          return float(avg_rating) if avg_rating is not None else None
 
 
-book = CRUDBook(Book)
\ No newline at end of file
+book = CRUDBook(Book)
+
+
+# Books written through the ORM anywhere (API routes, the admin panel, scripts) are
+# noted on their session and the per-worker catalog caches told once the commit is
+# through, so a refresh running meanwhile cannot miss the change.
+@event.listens_for(Book, "after_insert")
+@event.listens_for(Book, "after_update")
+def _note_book_write(mapper, connection, target: Book) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("book_writes", set()).add("write")
+
+
+@event.listens_for(Book, "after_delete")
+def _note_book_delete(mapper, connection, target: Book) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("book_writes", set()).add("delete")
+
+
+@event.listens_for(Session, "after_commit")
+def _book_writes_committed(session: Session) -> None:
+    writes = session.info.pop("book_writes", None)
+    if writes:
+        book._facets.clear()
+        # Deleted rows leave nothing for the snapshot's updated_at refresh to find
+        catalog_store.invalidate(deleted="delete" in writes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _book_writes_rolled_back(session: Session) -> None:
+    session.info.pop("book_writes", None)
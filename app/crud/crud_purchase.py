@@ -7,7 +7,12 @@ from sqlalchemy.orm import joinedload
 from app.crud.base import CRUDBase
 from app.db.models import Purchase, PurchaseStatus, Book, User
 from app.schemas import CartItemCreate # Use specific schema if needed, else handled in logic
+from app.core.tracing import traced_methods
+from app.crud.crud_recommendation import recommendation
+from app.db.personalization import personalizer
+from app.db.sales import sales_tracker
 
+@traced_methods
 class CRUDPurchase: # Not inheriting CRUDBase as logic is more specific
 
     async def add_item_to_cart(self, db: AsyncSession, *, book: Book, user: User) -> Purchase:
@@ -39,12 +44,16 @@ class CRUDPurchase: # Not inheriting CRUDBase as logic is more specific
         )
         return result.scalars().all()
 
-    async def get_cart_item(self, db: AsyncSession, user_id: int, cart_item_id: int) -> Optional[Purchase]:
-         """ Gets a specific item from the user's cart by its ID. """
-         result = await db.execute(
-             select(Purchase)
-             .filter(Purchase.user_id == user_id, Purchase.id == cart_item_id, Purchase.status == PurchaseStatus.IN_CART)
-         )
+    async def get_cart_item(
+        self, db: AsyncSession, user_id: int, cart_item_id: Optional[int] = None, book_id: Optional[int] = None
+    ) -> Optional[Purchase]:
+         """ Gets a specific item from the user's cart by its ID or by the book it holds. """
+         query = select(Purchase).filter(Purchase.user_id == user_id, Purchase.status == PurchaseStatus.IN_CART)
+         if cart_item_id is not None:
+             query = query.filter(Purchase.id == cart_item_id)
+         if book_id is not None:
+             query = query.filter(Purchase.book_id == book_id)
+         result = await db.execute(query)
          return result.scalars().first()
 
     async def remove_item_from_cart(self, db: AsyncSession, *, cart_item: Purchase) -> None:
@@ -72,7 +81,8 @@ class CRUDPurchase: # Not inheriting CRUDBase as logic is more specific
         4. (Transaction starts)
         5. Updates purchase statuses to COMPLETED.
         6. Deducts balance from user.
-        7. (Transaction ends)
+        7. Increments the "also bought" co-purchase counts.
+        8. (Transaction ends)
         Returns the list of completed purchases.
         Raises ValueError on insufficient funds or other errors.
         """
@@ -88,16 +98,19 @@ class CRUDPurchase: # Not inheriting CRUDBase as logic is more specific
              raise ValueError(f"Insufficient balance. Required: {total_cost}, Available: {user.balance}")
 
         # --- Transaction block ---
-        async with db.begin(): # Use session.begin() for automatic commit/rollback
+        # The session has already begun a transaction (autobegin) by reading the cart,
+        # so both updates run in it and are committed (or rolled back) together.
+        try:
             # 1. Update purchase statuses
             cart_item_ids = [item.id for item in cart_items]
             update_stmt = (
                 update(Purchase)
                 .where(Purchase.id.in_(cart_item_ids), Purchase.status == PurchaseStatus.IN_CART) # Ensure status is still IN_CART
                 .values(status=PurchaseStatus.COMPLETED, purchase_date=func.now()) # Update status and timestamp
-                .execution_options(synchronize_session="fetch") # Strategy for session sync after UPDATE
+                # Updates the loaded cart items (books included) in place, so no reselect is needed
+                .returning(Purchase)
             )
-            await db.execute(update_stmt)
+            completed_purchases = (await db.execute(update_stmt)).scalars().all()
 
             # 2. Deduct balance (using crud_user helper method)
             # Note: crud_user.update_balance should *not* commit itself if used within this transaction
@@ -115,19 +128,20 @@ class CRUDPurchase: # Not inheriting CRUDBase as logic is more specific
             # Check if user balance update was successful (e.g., if optimistic lock was added)
             if result.rowcount == 0:
                  # This means the balance was already less than total_cost when the update ran
-                 # Rollback will happen automatically due to the exception
                 raise ValueError("Failed to update balance, possibly due to concurrent transaction or check failure.")
 
+            # 3. Count the new co-purchases in the same transaction (one statement)
+            await recommendation.record_checkout(db, user_id=user.id, purchases=completed_purchases)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
         # --- Transaction end ---
+        personalizer.invalidate(user.id)
 
-        # Refresh objects outside the transaction if needed (status already updated)
-        # For returning, fetch the updated items again
-        completed_purchases_result = await db.execute(
-            select(Purchase)
-            .options(joinedload(Purchase.book))
-            .filter(Purchase.id.in_(cart_item_ids))
-        )
-        completed_purchases = completed_purchases_result.scalars().all()
+        for completed in completed_purchases:
+            sales_tracker.record(completed.book_id, completed.book.genre)
 
         return completed_purchases
 
@@ -0,0 +1,175 @@
+import asyncio
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from sqlalchemy import bindparam, delete, func, literal, select, true, union, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.tracing import traced_methods
+from app.db.factorization import model_store
+from app.db.models import Book, BookCoPurchase, BookSimilarity, Purchase, PurchaseStatus, user_favorite_books_table
+from app.db.sales import sales_tracker
+from app.db.similarity import book_terms, similarity_store
+
+
+@traced_methods
+class CRUDRecommendation:
+
+    def __init__(self):
+        # Top-K neighbours of one book: a range scan of ix_book_co_purchases_book_id_score
+        self._also_bought_stmt = (
+            select(Book)
+            .join(BookCoPurchase, BookCoPurchase.other_book_id == Book.id)
+            .filter(BookCoPurchase.book_id == bindparam("book_id"))
+            .order_by(BookCoPurchase.score.desc(), BookCoPurchase.other_book_id)
+            .limit(bindparam("limit"))
+        )
+        self._similar_stmt = (
+            select(Book)
+            .join(BookSimilarity, BookSimilarity.other_book_id == Book.id)
+            .filter(BookSimilarity.book_id == bindparam("book_id"))
+            .order_by(BookSimilarity.score.desc(), BookSimilarity.other_book_id)
+            .limit(bindparam("limit"))
+        )
+
+    async def get_also_bought(self, db: AsyncSession, *, book_id: int, limit: int = 10) -> List[Book]:
+        """ Books most often bought by the buyers of `book_id`. """
+        result = await db.execute(self._also_bought_stmt, {"book_id": book_id, "limit": limit})
+        return result.scalars().all()
+
+    async def get_similar(self, db: AsyncSession, *, book_id: int, limit: int = 10) -> List[Book]:
+        """ Books closest to `book_id` by title, author, genre and description. """
+        result = await db.execute(self._similar_stmt, {"book_id": book_id, "limit": limit})
+        return result.scalars().all()
+
+    async def refresh_similar(self, db: AsyncSession, *, book: Book) -> int:
+        """
+        Recompute the similar books of a new or edited book against the published
+        index, and add it to the lists of its new neighbours. Returns the number
+        of neighbours found; 0 when no index has been built yet
+        (`python -m app.cli similar-books`).
+        """
+        index = similarity_store.get()
+        if index is None:
+            return 0
+        terms = book_terms(book.title, book.author, book.genre, book.description)
+        # Scoring walks postings of the whole catalog; keep it off the loop thread
+        other_ids, scores = await asyncio.get_running_loop().run_in_executor(
+            None, index.neighbours, terms, book.id, settings.SIMILAR_TOP_K
+        )
+        # Drop the book from the lists of its old neighbours too (primary key lookups)
+        old = await db.execute(
+            delete(BookSimilarity).filter(BookSimilarity.book_id == book.id).returning(BookSimilarity.other_book_id)
+        )
+        old_ids = old.scalars().all()
+        if old_ids:
+            await db.execute(delete(BookSimilarity).filter(
+                BookSimilarity.book_id.in_(old_ids), BookSimilarity.other_book_id == book.id
+            ))
+        if other_ids:
+            rows = [{"book_id": book.id, "other_book_id": other, "score": score} for other, score in zip(other_ids, scores)]
+            rows += [{"book_id": other, "other_book_id": book.id, "score": score} for other, score in zip(other_ids, scores)]
+            insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+            stmt = insert(BookSimilarity).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[BookSimilarity.book_id, BookSimilarity.other_book_id],
+                set_={"score": stmt.excluded.score},
+            )
+            await db.execute(stmt)
+        await db.commit()
+        return len(other_ids)
+
+    async def get_trending(
+        self, db: AsyncSession, *, window: str = "day", genre: Optional[str] = None, limit: int = 10
+    ) -> List[Book]:
+        """ Best sellers of the window (optionally of one genre), from the in-memory sales counters. """
+        book_ids = [book_id for book_id, _ in sales_tracker.ranking(window, genre, limit)]
+        if not book_ids:
+            return []
+        result = await db.execute(select(Book).filter(Book.id.in_(book_ids)))
+        books = {book.id: book for book in result.scalars().all()}
+        return [books[book_id] for book_id in book_ids if book_id in books]
+
+    async def get_for_user(self, db: AsyncSession, *, user_id: int, limit: int = 10) -> List[Book]:
+        """
+        Books with the highest predicted rating for the user from the ALS model,
+        leaving out books they bought, have in their cart or marked as favorite.
+        Users the model has not seen get the most rated books. Empty until a
+        model has been trained (`python -m app.cli train-recommender`).
+        """
+        model = model_store.get()
+        if model is None:
+            return []
+        owned = await db.execute(union(
+            select(Purchase.book_id).filter(
+                Purchase.user_id == user_id,
+                Purchase.status.in_([PurchaseStatus.COMPLETED, PurchaseStatus.PENDING, PurchaseStatus.IN_CART]),
+            ),
+            select(user_favorite_books_table.c.book_id).filter(user_favorite_books_table.c.user_id == user_id),
+        ))
+        exclude = np.array(sorted(owned.scalars().all()), dtype=np.int64)
+        book_ids = model.recommend(user_id, exclude, limit).tolist()
+        if not book_ids:
+            return []
+        result = await db.execute(select(Book).filter(Book.id.in_(book_ids)))
+        books = {book.id: book for book in result.scalars().all()}
+        return [books[book_id] for book_id in book_ids if book_id in books]
+
+    async def record_checkout(self, db: AsyncSession, *, user_id: int, purchases: Sequence[Purchase]) -> int:
+        """
+        Fold a completed checkout into the co-purchase counts: every book the user
+        did not own before is paired with the other new books and with (up to
+        ALSO_BOUGHT_MAX_BASKET of) the books bought earlier. Returns the number of
+        pairs incremented. Pairs pruned by the last rebuild restart from 1.
+
+        One INSERT ... SELECT run in the caller's transaction (checkout_cart), which
+        commits it with the checkout itself. Rows are inserted in key order, so two
+        checkouts sharing books lock their pairs in the same order and cannot deadlock.
+        """
+        checkout_ids = [p.id for p in purchases]
+        previous = (
+            select(Purchase.book_id)
+            .filter(
+                Purchase.user_id == user_id,
+                Purchase.status == PurchaseStatus.COMPLETED,
+                Purchase.id.not_in(checkout_ids),
+            )
+            .group_by(Purchase.book_id)
+            .order_by(func.max(Purchase.purchase_date).desc())
+            .limit(settings.ALSO_BOUGHT_MAX_BASKET)
+            .cte("previous_books")
+        )
+        new = (
+            select(Purchase.book_id)
+            .distinct()
+            .filter(Purchase.id.in_(checkout_ids), Purchase.book_id.not_in(select(previous.c.book_id)))
+            .cte("new_books")
+        )
+        other = new.alias("other_new_books")
+        pairs = union_all(
+            select(new.c.book_id.label("book_id"), other.c.book_id.label("other_book_id"))
+            .join_from(new, other, new.c.book_id != other.c.book_id),
+            select(new.c.book_id, previous.c.book_id).join_from(new, previous, true()),
+            select(previous.c.book_id, new.c.book_id).join_from(previous, new, true()),
+        ).subquery("pairs")
+
+        insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(BookCoPurchase).from_select(
+            ["book_id", "other_book_id", "score"],
+            # SQLite needs a WHERE to tell the upsert's ON CONFLICT from a join constraint
+            select(pairs.c.book_id, pairs.c.other_book_id, literal(1))
+            .where(true())
+            .order_by(pairs.c.book_id, pairs.c.other_book_id),
+        ).on_conflict_do_update(
+            index_elements=[BookCoPurchase.book_id, BookCoPurchase.other_book_id],
+            set_={"score": BookCoPurchase.score + 1},
+        )
+        result = await db.execute(stmt)
+        return result.rowcount
+
+
+recommendation = CRUDRecommendation()
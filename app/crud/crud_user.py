@@ -1,7 +1,7 @@
 from typing import Any, Dict, Optional, Union, List
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, update
+from sqlalchemy import bindparam, func, update
 from sqlalchemy.orm import selectinload, joinedload
 
 from app.crud.base import CRUDBase
@@ -9,10 +9,18 @@ from app.db.models.user import User
 from app.db.models.purchase import Purchase, PurchaseStatus
 from app.db.models.book import Book
 from app.schemas import UserCreate, UserUpdate
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash, get_password_hash_async, verify_password_async
+from app.core.tracing import traced_methods
 
+@traced_methods
 class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
 
+    def __init__(self, model):
+        super().__init__(model)
+        # Looked up on every login and authenticated request, see CRUDBase
+        self._get_by_email_stmt = select(model).filter(model.email == bindparam("email"))
+        self._get_by_username_stmt = select(model).filter(model.username == bindparam("username"))
+
     async def create_user(db: AsyncSession, obj_in: UserCreate):
         """
         Create a new user with a hashed password.
@@ -45,17 +53,17 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
 
     async def get_by_email(self, db: AsyncSession, *, email: str) -> Optional[User]:
         """Retrieve a user by email."""
-        result = await db.execute(select(self.model).filter(self.model.email == email))
+        result = await db.execute(self._get_by_email_stmt, {"email": email})
         return result.scalars().first()
 
     async def get_by_username(self, db: AsyncSession, *, username: str) -> Optional[User]:
         """Retrieve a user by username."""
-        result = await db.execute(select(self.model).filter(self.model.username == username))
+        result = await db.execute(self._get_by_username_stmt, {"username": username})
         return result.scalars().first()
 
     async def create(self, db: AsyncSession, *, obj_in: UserCreate) -> User:
         """Create a new user with a hashed password."""
-        hashed_password = get_password_hash(obj_in.password)
+        hashed_password = await get_password_hash_async(obj_in.password)
         # Exclude the plaintext password from the data dictionary
         user_data = obj_in.dict(exclude={"password"})
         db_obj = self.model(**user_data, hashed_password=hashed_password)
@@ -77,7 +85,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         """
         update_data = obj_in if isinstance(obj_in, dict) else obj_in.dict(exclude_unset=True)
         if "password" in update_data and update_data["password"]:
-            hashed_password = get_password_hash(update_data["password"])
+            hashed_password = await get_password_hash_async(update_data["password"])
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
         elif "password" in update_data:
@@ -95,7 +103,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         user = await self.get_by_username(db, username=username)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        if not await verify_password_async(password, user.hashed_password):
             return None
         return user
 
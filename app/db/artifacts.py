@@ -0,0 +1,72 @@
+"""
+Versioned on-disk model artifacts shared between processes.
+
+A batch job writes a set of .npy arrays to a new MODEL_DIR/<name>-<ms>
+directory and publishes it by atomically replacing MODEL_DIR/<name>.json.
+Workers memory-map the arrays, so every worker on a host shares one copy in
+the page cache, and pick up a new version once they notice the pointer change.
+"""
+import json
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+
+def publish(directory: str, name: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any], keep: int = 2) -> str:
+    """Write `arrays` to a new version directory and point <name>.json at it. Returns the version."""
+    version = f"{name}-{int(time.time() * 1000)}"
+    path = os.path.join(directory, version)
+    os.makedirs(path)
+    for key, array in arrays.items():
+        np.save(os.path.join(path, key + ".npy"), array)
+    pointer = os.path.join(directory, name + ".json")
+    with open(pointer + ".tmp", "w") as f:
+        json.dump({"version": version, **meta}, f)
+    os.replace(pointer + ".tmp", pointer)
+    # Older versions may still be mapped by workers that have not reloaded yet
+    versions = sorted(d for d in os.listdir(directory) if d.startswith(name + "-"))
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return version
+
+
+def load_arrays(path: str, *names: str) -> Dict[str, np.ndarray]:
+    return {key: np.load(os.path.join(path, key + ".npy"), mmap_mode="r") for key in names}
+
+
+class ArtifactStore(Generic[T]):
+    """
+    Loads the published version of `name` with `loader(path, meta)` and reloads
+    it when <name>.json changes (checked every `check_seconds`).
+    """
+
+    def __init__(self, directory: str, name: str, loader: Callable[[str, Dict], T], check_seconds: float = 30.0):
+        self.directory = directory
+        self.name = name
+        self.loader = loader
+        self.check_seconds = check_seconds
+        self.model: Optional[T] = None
+        self._checked = float("-inf")
+        self._mtime = 0.0
+
+    def get(self) -> Optional[T]:
+        now = time.monotonic()
+        if now - self._checked < self.check_seconds:
+            return self.model
+        self._checked = now
+        pointer = os.path.join(self.directory, self.name + ".json")
+        try:
+            mtime = os.stat(pointer).st_mtime
+        except FileNotFoundError:
+            return self.model
+        if mtime != self._mtime:
+            with open(pointer) as f:
+                meta = json.load(f)
+            self.model = self.loader(os.path.join(self.directory, meta["version"]), meta)
+            self._mtime = mtime
+        return self.model
@@ -1,11 +1,73 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from typing import Any, Dict, Optional
+from uuid import uuid4
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base
-from app.core.config import settings
+from app.core.config import Settings, settings
+from app.db.pool import InstrumentedAsyncQueuePool
 
 DATABASE_URL = settings.DATABASE_URL
 
-# echo=True is useful for debugging SQL generated by SQLAlchemy
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+
+def get_pool_options(settings: Settings, database_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Per-worker pool options. Unless DB_POOL_SIZE/DB_MAX_OVERFLOW are set, sizing is
+    derived from the global DB_CONNECTION_BUDGET: each of the WEB_CONCURRENCY workers
+    gets an equal share, three quarters of which are kept open in the pool and the
+    rest allowed as burst overflow.
+    """
+    url = make_url(database_url or settings.DATABASE_URL)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite uses a static pool that takes no sizing options
+        return {}
+
+    per_worker = max(settings.DB_CONNECTION_BUDGET // max(settings.WEB_CONCURRENCY, 1), 1)
+    pool_size = max(per_worker * 3 // 4, 1)
+    max_overflow = per_worker - pool_size
+    if settings.DB_POOL_SIZE >= 0:
+        pool_size = settings.DB_POOL_SIZE
+    if settings.DB_MAX_OVERFLOW >= 0:
+        max_overflow = settings.DB_MAX_OVERFLOW
+    return {
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def get_connect_args(settings: Settings, database_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Driver arguments for asyncpg. Behind a transaction pooler (PgBouncer) a server
+    connection is not pinned to us between transactions, so prepared statements must
+    not be cached and need unique names.
+    """
+    if make_url(database_url or settings.DATABASE_URL).get_driver_name() != "asyncpg":
+        return {}
+    if settings.DB_POOLER_MODE == "transaction":
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+
+
+def make_engine(database_url: str) -> AsyncEngine:
+    """Create an async engine with the pool and driver options from Settings."""
+    # echo=True is useful for debugging SQL generated by SQLAlchemy
+    return create_async_engine(
+        database_url,
+        echo=False,
+        future=True,
+        connect_args=get_connect_args(settings, database_url),
+        **get_pool_options(settings, database_url),
+    )
+
+
+engine = make_engine(DATABASE_URL)
 
 # expire_on_commit=False prevents attributes from being expired
 # after commit, useful in async context sometimes. Adjust as needed.
@@ -17,10 +79,7 @@ AsyncSessionLocal = async_sessionmaker(
 
 Base = declarative_base()
 
-# Dependency to get DB session
-async def get_db() -> AsyncSession:
-    async with AsyncSessionLocal() as session:
-        yield session
+# The request dependencies (get_db / get_read_db) live in app.db.routing
 
 # Function to create tables (useful for initial setup without Alembic or for tests)
 # Use Alembic for production schema management
@@ -0,0 +1,354 @@
+"""
+Columnar catalog snapshot (CATALOG_READ_ENGINE=snapshot, and the ranked orderings).
+
+Every worker keeps the filterable columns of `books` in NumPy arrays, rows in
+id order: genre, author, language and availability dictionary encoded (so a
+substring filter is one test per distinct value, not per book), cost,
+publication date and average rating (NaN/NaT where NULL, so no range filter
+matches them, as in SQL) and the titles. The lower-cased titles and
+dictionary values are also kept NUL-joined in one string, so an ILIKE
+pattern is a single regular expression scan. Each sort of the listing is an
+array of row positions computed when the snapshot is built, ties broken by id
+like the SQL ordering; a page is the sort order masked by the filters and
+sliced.
+
+The snapshot is loaded in full once and then, at most every
+CATALOG_SNAPSHOT_REFRESH_SECONDS, patched with the books whose updated_at is
+past the previous refresh (less REFRESH_OVERLAP, for transactions that
+committed late) or whose id is above the loaded ones. The patched snapshot
+is a copy, with the sort orders merged rather than recomputed, so requests
+holding the previous one are unaffected. Deletions leave no trace in
+updated_at: a book deleted through this worker forces a full reload on the
+next read, and every CATALOG_SNAPSHOT_RELOAD_SECONDS the snapshot is
+reloaded anyway. Titles sort by code point, as in SQLite and PostgreSQL's
+"C" collation.
+"""
+import asyncio
+import copy
+import re
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.fuzzy import Terms
+from app.db.models import Book, BookAvailability
+
+COLUMNS = (
+    Book.id, Book.title, Book.author, Book.genre, Book.language, Book.availability_status,
+    Book.cost, Book.publication_date, Book.average_rating, Book.updated_at,
+)
+# The sorts kept per snapshot; "price_desc" is "price" reversed
+SORTS = ("title", "price", "newest", "rating")
+REFRESH_OVERLAP = timedelta(seconds=60)
+# Patches touching more than this share of the catalog re-sort instead of merging
+MERGE_LIMIT = 0.01
+_MISSING = object()
+
+
+def _like(needle: str) -> str:
+    """Regular expression for the ILIKE pattern '%needle%' within one NUL-separated value."""
+    return "".join(
+        "[^\x00]*" if char == "%" else "[^\x00]" if char == "_" else re.escape(char) for char in needle.lower()
+    )
+
+
+def _floats(values: Sequence[Optional[float]]) -> np.ndarray:
+    return np.array([value if value is not None else np.nan for value in values], dtype=np.float64)
+
+
+def _dates(values: Sequence[Optional[date]]) -> np.ndarray:
+    return np.array(values, dtype="datetime64[D]")
+
+
+class _Text:
+    """Lower-cased strings joined by NUL, searched with one regular expression scan."""
+
+    def __init__(self, values: Sequence[Optional[str]]):
+        lowered = [value.lower() if value is not None else "" for value in values]
+        self.missing = np.array([value is None for value in values], dtype=bool)
+        self.blob = "\x00".join(lowered)
+        lengths = np.fromiter(map(len, lowered), dtype=np.int64, count=len(lowered))
+        self.starts = np.r_[0, np.cumsum(lengths + 1)[:-1]] if lowered else lengths
+
+    def matching(self, needle: Union[str, Terms]) -> np.ndarray:
+        """
+        Values containing `needle` (SQL ILIKE '%needle%'), or matching all groups
+        of fuzzy terms; NULLs never match.
+        """
+        groups = [[needle]] if isinstance(needle, str) else needle
+        selected = ~self.missing
+        for group in groups:
+            # Each match runs to the end of its value, so a value is reported once
+            pattern = re.compile("(?:" + "|".join(_like(word) for word in group) + ")[^\x00]*")
+            hits = np.fromiter((match.start() for match in pattern.finditer(self.blob)), dtype=np.int64)
+            found = np.zeros(self.starts.size, dtype=bool)
+            found[np.searchsorted(self.starts, hits, side="right") - 1] = True
+            selected &= found
+        return selected
+
+
+class _Dictionary:
+    """The distinct values of a dictionary-encoded column, in code order."""
+
+    def __init__(self, index: Dict[Any, int]):
+        self.index = index
+        self.values = list(index)
+        self.text = _Text(self.values)
+
+    @classmethod
+    def encode(cls, values: Sequence[Any], base: Optional["_Dictionary"] = None) -> Tuple["_Dictionary", np.ndarray]:
+        """Codes of `values`, with a copy of `base` extended by the values it does not have."""
+        index = base.index if base is not None else {}
+        if base is None or any(value not in index for value in values):
+            index = dict(index)
+        codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int32, count=len(values))
+        return (base if base is not None and index is base.index else cls(index)), codes
+
+
+class CatalogSnapshot:
+    """The filterable columns of the catalog, rows in id order."""
+
+    def __init__(self, rows: Sequence[tuple], watermark: Any):
+        self.loaded_at = time.monotonic()
+        self.ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        self.titles = [row[1] for row in rows]
+        self.authors, self.author = _Dictionary.encode([row[2] for row in rows])
+        self.genres, self.genre = _Dictionary.encode([row[3] for row in rows])
+        self.languages, self.language = _Dictionary.encode([row[4] for row in rows])
+        self.availabilities, self.availability = _Dictionary.encode([row[5] for row in rows])
+        self.cost = _floats([row[6] for row in rows])
+        self.published = _dates([row[7] for row in rows])
+        self.rating = _floats([row[8] for row in rows])
+        self.title_text = _Text(self.titles)
+        self.orders = {sort: self._sorted(sort) for sort in SORTS}
+        self._track(rows, watermark)
+
+    def _track(self, rows: Sequence[tuple], watermark: Any) -> None:
+        # The next refresh reads the books changed since `since`; of those, the ones
+        # already applied here (same values) are skipped. Not by updated_at alone: on
+        # SQLite it has whole seconds, so an insert and an edit within one look alike
+        self.since = watermark - REFRESH_OVERLAP
+        self.recent = {row[0]: tuple(row) for row in rows if row[9] is not None and row[9] >= self.since}
+
+    def _sort_columns(self, sort: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Ascending (primary, tie-break) keys of a numeric sort: descending sorts negated, NULLs last."""
+        if sort == "price":
+            return self.cost, self.ids
+        if sort == "newest":
+            return np.where(np.isnat(self.published), np.inf, -self.published.astype(np.float64)), -self.ids
+        return np.where(np.isnan(self.rating), np.inf, -self.rating), -self.ids
+
+    def _sort_key(self, sort: str) -> Callable[[int], tuple]:
+        if sort == "title":
+            titles, ids = self.titles, self.ids
+            return lambda position: (titles[position], ids[position])
+        primary, tie = self._sort_columns(sort)
+        return lambda position: (primary[position], tie[position])
+
+    def _sorted(self, sort: str) -> np.ndarray:
+        if sort == "title":
+            # Positions are in id order and the sort is stable, so equal titles stay in id order
+            return np.array(sorted(range(self.ids.size), key=self.titles.__getitem__), dtype=np.int64)
+        primary, tie = self._sort_columns(sort)
+        return np.lexsort((tie, primary))
+
+    def _merged(self, sort: str, order: np.ndarray, changed: np.ndarray) -> np.ndarray:
+        """`order` of the previous snapshot with the `changed` positions moved to where they sort now."""
+        key = self._sort_key(sort)
+        kept = order[~np.isin(order, changed)]
+        moved = sorted(changed.tolist(), key=key)
+        points = []
+        for position in moved:
+            target, low, high = key(position), 0, kept.size
+            while low < high:
+                middle = (low + high) // 2
+                if key(kept[middle]) < target:
+                    low = middle + 1
+                else:
+                    high = middle
+            points.append(low)
+        return np.insert(kept, points, moved)
+
+    def updated(self, rows: Sequence[tuple], watermark: Any) -> Optional["CatalogSnapshot"]:
+        """
+        A copy with `rows` (changed and new books, in id order) applied, or None
+        when it takes a full reload: a new book has an id below the loaded ones.
+        """
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        if self.ids.size:
+            positions = np.minimum(np.searchsorted(self.ids, ids), self.ids.size - 1)
+            found = self.ids[positions] == ids
+        else:
+            positions, found = np.zeros(ids.size, dtype=np.int64), np.zeros(ids.size, dtype=bool)
+        added = int(ids.size - found.sum())
+        if added and self.ids.size and ids[~found].min() < self.ids[-1]:
+            return None
+        positions[~found] = self.ids.size + np.arange(added)
+
+        def patched(column: np.ndarray, values: np.ndarray) -> np.ndarray:
+            column = np.concatenate([column, np.zeros(added, dtype=column.dtype)])
+            column[positions] = values
+            return column
+
+        snapshot = copy.copy(self)
+        snapshot.ids = np.concatenate([self.ids, ids[~found]])
+        snapshot.titles = self.titles + [None] * added
+        retitled = bool(added)
+        for position, row in zip(positions.tolist(), rows):
+            retitled = retitled or snapshot.titles[position] != row[1]
+            snapshot.titles[position] = row[1]
+        for name, plural, index in (
+            ("author", "authors", 2), ("genre", "genres", 3),
+            ("language", "languages", 4), ("availability", "availabilities", 5),
+        ):
+            dictionary, codes = _Dictionary.encode([row[index] for row in rows], getattr(self, plural))
+            setattr(snapshot, plural, dictionary)
+            setattr(snapshot, name, patched(getattr(self, name), codes))
+        snapshot.cost = patched(self.cost, _floats([row[6] for row in rows]))
+        snapshot.published = patched(self.published, _dates([row[7] for row in rows]))
+        snapshot.rating = patched(self.rating, _floats([row[8] for row in rows]))
+        if retitled:
+            snapshot.title_text = _Text(snapshot.titles)
+        merge = positions.size <= MERGE_LIMIT * snapshot.ids.size
+        snapshot.orders = {
+            sort: snapshot._merged(sort, order, positions) if merge else snapshot._sorted(sort)
+            for sort, order in self.orders.items()
+        }
+        snapshot._track(rows, watermark)
+        return snapshot
+
+    def align(self, book_ids: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Per-book `values` (for sorted `book_ids`) as a column of the snapshot, 0 for books not given."""
+        column = np.zeros(self.ids.size, dtype=np.float32)
+        if book_ids.size and self.ids.size:
+            positions = np.minimum(np.searchsorted(self.ids, book_ids), self.ids.size - 1)
+            found = self.ids[positions] == book_ids
+            column[positions[found]] = values[found]
+        return column
+
+    def mask(
+        self,
+        *,
+        author: Union[str, Terms, None] = None,
+        genre: Optional[str] = None,
+        availability: Optional[BookAvailability] = None,
+        language: Optional[str] = None,
+        title: Union[str, Terms, None] = None,
+        min_cost: Optional[float] = None,
+        max_cost: Optional[float] = None,
+        published_from: Optional[date] = None,
+        published_to: Optional[date] = None,
+        min_rating: Optional[float] = None,
+    ) -> Optional[np.ndarray]:
+        """Rows matching the catalog filters (as CRUDBook._apply_filters), or None when there are none."""
+        mask = None
+        for column, bound, lower in (
+            (self.cost, min_cost, True), (self.cost, max_cost, False),
+            (self.published, published_from, True), (self.published, published_to, False),
+            (self.rating, min_rating, True),
+        ):
+            if bound is not None:
+                if isinstance(bound, date):
+                    bound = np.datetime64(bound, "D")
+                selected = column >= bound if lower else column <= bound
+                mask = selected if mask is None else mask & selected
+        for column, dictionary, needle in (
+            (self.author, self.authors, author), (self.genre, self.genres, genre), (self.language, self.languages, language)
+        ):
+            if needle:
+                selected = dictionary.text.matching(needle)[column]
+                mask = selected if mask is None else mask & selected
+        if title:
+            selected = self.title_text.matching(title)
+            mask = selected if mask is None else mask & selected
+        if availability:
+            wanted = np.array([value == availability for value in self.availabilities.values], dtype=bool)[self.availability]
+            mask = wanted if mask is None else mask & wanted
+        return mask
+
+    def page(self, sort: str, mask: Optional[np.ndarray], skip: int, limit: int) -> Tuple[List[int], int]:
+        """Ids of rows skip..skip+limit in `sort` order, and the number of matching rows."""
+        order = self.orders["price"][::-1] if sort == "price_desc" else self.orders[sort]
+        if mask is not None:
+            order = order[mask[order]]
+        return self.ids[order[skip:skip + limit]].tolist(), int(order.size)
+
+    def rank(self, scores: np.ndarray, mask: Optional[np.ndarray], skip: int, limit: int) -> Tuple[List[int], int]:
+        """Ids of rows skip..skip+limit by descending score (ties by id), and the number of matching rows."""
+        candidates = np.flatnonzero(mask) if mask is not None else None
+        if candidates is not None:
+            scores = scores[candidates]
+        total = int(scores.size)
+        n = min(skip + limit, total)
+        if n <= 0:
+            return [], total
+        # The n best with ties at the cut-off broken by position (= by id) for stable pages
+        kth = np.partition(scores, total - n)[total - n]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[: n - above.size]
+        top = np.concatenate([above, tied])
+        top = top[np.lexsort((top, -scores[top]))][skip:]
+        positions = candidates[top] if candidates is not None else top
+        return self.ids[positions].tolist(), total
+
+
+class CatalogStore:
+    def __init__(self, refresh_seconds: float, reload_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self.reload_seconds = reload_seconds
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = float("-inf")
+        self._reload = False
+        self._writes = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self, *, deleted: bool = False) -> None:
+        """Look for changes on the next read (after a write in this worker); deletions need a full reload."""
+        self._checked_at = float("-inf")
+        self._writes += 1
+        self._reload = self._reload or deleted
+
+    async def get(self, db: AsyncSession) -> CatalogSnapshot:
+        """
+        The snapshot, brought up to date when the last check is older than the
+        refresh interval: by one request, while the others use the current one.
+        """
+        snapshot = self.snapshot
+        recent = time.monotonic() - self._checked_at < self.refresh_seconds
+        if snapshot is not None and (recent or self._lock.locked()):
+            return snapshot
+        async with self._lock:
+            if self.snapshot is not snapshot:
+                return self.snapshot
+            writes = self._writes
+            loop = asyncio.get_running_loop()
+            # The database clock, read before the rows so no change falls between the two
+            watermark = (await db.execute(select(func.now()))).scalar_one()
+            updated = None
+            if snapshot is not None and not self._reload and time.monotonic() - snapshot.loaded_at < self.reload_seconds:
+                rows = (await db.execute(
+                    select(*COLUMNS)
+                    .filter(or_(Book.updated_at >= snapshot.since, Book.id > int(snapshot.ids[-1]) if snapshot.ids.size else True))
+                    .order_by(Book.id)
+                )).all()
+                rows = [row for row in rows if snapshot.recent.get(row[0], _MISSING) != tuple(row)]
+                # Patching is CPU-bound; keep it off the loop thread
+                updated = await loop.run_in_executor(None, snapshot.updated, rows, watermark) if rows else snapshot
+            if updated is None:
+                self._reload = False
+                rows = (await db.execute(select(*COLUMNS).order_by(Book.id))).all()
+                updated = await loop.run_in_executor(None, CatalogSnapshot, rows, watermark)
+            elif updated is snapshot:
+                snapshot.since = watermark - REFRESH_OVERLAP
+            self.snapshot = updated
+            # A write during the refresh may not be in it: check again on the next read
+            self._checked_at = time.monotonic() if self._writes == writes else float("-inf")
+            return self.snapshot
+
+
+catalog_store = CatalogStore(settings.CATALOG_SNAPSHOT_REFRESH_SECONDS, settings.CATALOG_SNAPSHOT_RELOAD_SECONDS)
@@ -0,0 +1,164 @@
+"""
+Batch build of the "also bought" table (see `python -m app.cli also-bought`).
+
+The signal is the set of distinct (user, book) pairs of COMPLETED purchases.
+Baskets (one per user, capped to the user's most recent `max_basket` books)
+are expanded into book pairs with NumPy, one vectorized step per basket size,
+and counted as int64 pair keys. Only the `top_k` most co-purchased neighbours
+of each book are written; checkouts then increment pairs in place
+(crud.recommendation.record_checkout) until the next rebuild.
+"""
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Table, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.db.models import BookCoPurchase, Purchase, PurchaseStatus
+
+# Pair keys are merged once this many accumulate, to bound memory
+MERGE_THRESHOLD = 20_000_000
+
+
+def basket_pairs(users: np.ndarray, books: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Unordered book pairs (a < b) bought by the same user. `users` must be sorted
+    (grouped) and each basket free of duplicates.
+    """
+    if users.size == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    sizes = np.diff(np.r_[starts, users.size])
+    lefts, rights = [], []
+    for size in np.unique(sizes):
+        if size < 2:
+            continue
+        # All baskets of this size as one (baskets, size) matrix
+        rows = starts[sizes == size][:, None] + np.arange(size)
+        matrix = books[rows]
+        i, j = np.triu_indices(size, 1)
+        a, b = matrix[:, i].ravel(), matrix[:, j].ravel()
+        lefts.append(np.minimum(a, b))
+        rights.append(np.maximum(a, b))
+    if not lefts:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(lefts), np.concatenate(rights)
+
+
+class PairCounter:
+    """Sparse symmetric co-occurrence counts keyed by a * stride + b."""
+
+    def __init__(self, stride: int):
+        self.stride = stride
+        self.keys = np.empty(0, np.int64)
+        self.counts = np.empty(0, np.int64)
+        self._pending: List[np.ndarray] = []
+        self._pending_size = 0
+
+    def add(self, a: np.ndarray, b: np.ndarray) -> None:
+        self._pending.append(a.astype(np.int64) * self.stride + b)
+        self._pending_size += a.size
+        if self._pending_size >= MERGE_THRESHOLD:
+            self._merge()
+
+    def _merge(self) -> None:
+        if not self._pending:
+            return
+        new_keys, new_counts = np.unique(np.concatenate(self._pending), return_counts=True)
+        self._pending, self._pending_size = [], 0
+        keys = np.concatenate([self.keys, new_keys])
+        counts = np.concatenate([self.counts, new_counts])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts).astype(np.int64)
+
+    def top_k(self, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(book, neighbour, count) for the k largest counts of every book."""
+        self._merge()
+        a, b = self.keys // self.stride, self.keys % self.stride
+        # Both directions: b is a neighbour of a and a of b
+        source = np.concatenate([a, b])
+        target = np.concatenate([b, a])
+        counts = np.concatenate([self.counts, self.counts])
+        order = np.lexsort((target, -counts, source))
+        source, target, counts = source[order], target[order], counts[order]
+        group_start = np.flatnonzero(np.r_[True, source[1:] != source[:-1]])
+        rank = np.arange(source.size) - np.repeat(group_start, np.diff(np.r_[group_start, source.size]))
+        keep = rank < k
+        return source[keep], target[keep], counts[keep]
+
+
+async def _purchase_pairs(engine: AsyncEngine, max_basket: int, batch_size: int):
+    """Yield (users, books) arrays of distinct completed pairs, grouped by user, most recent first."""
+    last_purchase = func.max(Purchase.purchase_date)
+    query = (
+        select(Purchase.user_id, Purchase.book_id)
+        .filter(Purchase.status == PurchaseStatus.COMPLETED)
+        .group_by(Purchase.user_id, Purchase.book_id)
+        .order_by(Purchase.user_id, last_purchase.desc())
+    )
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=batch_size))
+        carry_users, carry_books = np.empty(0, np.int64), np.empty(0, np.int64)
+        async for partition in result.partitions(batch_size):
+            rows = np.array(partition, dtype=np.int64).reshape(-1, 2)
+            users = np.concatenate([carry_users, rows[:, 0]])
+            books = np.concatenate([carry_books, rows[:, 1]])
+            # The last user may continue in the next partition
+            cut = np.searchsorted(users, users[-1], side="left")
+            carry_users, carry_books = users[cut:], books[cut:]
+            yield _cap_baskets(users[:cut], books[:cut], max_basket)
+        yield _cap_baskets(carry_users, carry_books, max_basket)
+
+
+def _cap_baskets(users: np.ndarray, books: np.ndarray, max_basket: int) -> Tuple[np.ndarray, np.ndarray]:
+    if users.size == 0:
+        return users, books
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    position = np.arange(users.size) - np.repeat(starts, np.diff(np.r_[starts, users.size]))
+    keep = position < max_basket
+    return users[keep], books[keep]
+
+
+async def write_rows(conn: AsyncConnection, table: Table, columns: Sequence[str], rows: List[tuple]) -> None:
+    """Bulk insert `rows` (tuples in `columns` order), with COPY on PostgreSQL."""
+    if not rows:
+        return
+    if conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(table.name, records=rows, columns=list(columns))
+    else:
+        await conn.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+async def rebuild_also_bought(
+    engine: AsyncEngine, *, top_k: int, max_basket: int, batch_size: int = 200_000
+) -> Dict[str, float]:
+    """Recompute book_co_purchases from scratch. Returns counts and timings."""
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        max_book = (await conn.execute(select(func.max(Purchase.book_id)))).scalar() or 0
+    counter = PairCounter(stride=max_book + 1)
+    pairs = 0
+    async for users, books in _purchase_pairs(engine, max_basket, batch_size):
+        a, b = basket_pairs(users, books)
+        pairs += a.size
+        counter.add(a, b)
+    source, target, counts = counter.top_k(top_k)
+    computed = time.perf_counter()
+
+    table = BookCoPurchase.__table__
+    columns = ("book_id", "other_book_id", "score")
+    rows = list(zip(source.tolist(), target.tolist(), counts.tolist()))
+    # One transaction, so readers never see a half-written table
+    async with engine.begin() as conn:
+        await conn.execute(table.delete())
+        for start in range(0, len(rows), batch_size):
+            await write_rows(conn, table, columns, rows[start:start + batch_size])
+    return {
+        "pairs_counted": pairs,
+        "distinct_pairs": int(counter.keys.size),
+        "rows_written": len(rows),
+        "compute_seconds": round(computed - started, 2),
+        "write_seconds": round(time.perf_counter() - computed, 2),
+    }
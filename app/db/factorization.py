@@ -0,0 +1,155 @@
+"""
+Collaborative filtering over the `ratings` table (see `python -m app.cli train-recommender`).
+
+Ratings are centred on their global mean and factorized with alternating least
+squares (weighted-lambda regularization, so heavy raters and bestsellers are
+not over-fitted). Each half-step solves one small k x k system per user (or
+book); the Gram matrices are accumulated for a chunk of ratings at a time with
+einsum and solved together with one batched np.linalg.solve.
+
+A trained model is a directory of .npy files (float32 factors, sorted int64
+ids, books by popularity for cold-start users) published as MODEL_DIR/als.json
+(see app.db.artifacts) and memory-mapped by the workers.
+"""
+import time
+from typing import Dict
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.db.artifacts import ArtifactStore, load_arrays, publish
+from app.db.models import Rating
+
+# Memory bounds, in units of factors^2 float32 values: ratings per Gram accumulation
+# step and users/books per batched solve
+GRAM_CHUNK = 8192
+SOLVE_BLOCK = 16384
+
+
+def _solve_side(
+    rows: np.ndarray, cols: np.ndarray, values: np.ndarray, n_rows: int, other: np.ndarray, reg: float
+) -> np.ndarray:
+    """
+    One ALS half-step: for every row r, argmin_x sum (v - x . other[c])^2 + reg * n_r * |x|^2
+    over its ratings (c, v). `rows` must be sorted.
+    """
+    k = other.shape[1]
+    result = np.zeros((n_rows, k), dtype=np.float32)
+    eye = np.eye(k, dtype=np.float32)
+    bounds = np.searchsorted(rows, np.arange(0, n_rows + SOLVE_BLOCK, SOLVE_BLOCK))
+    for block, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        first = block * SOLVE_BLOCK
+        size = min(SOLVE_BLOCK, n_rows - first)
+        if size <= 0:
+            break
+        gram = np.zeros((size, k, k), dtype=np.float32)
+        rhs = np.zeros((size, k), dtype=np.float32)
+        for start in range(lo, hi, GRAM_CHUNK):
+            stop = min(start + GRAM_CHUNK, hi)
+            r = rows[start:stop] - first
+            y = other[cols[start:stop]]
+            # rows are sorted, so each row's ratings are contiguous within the chunk
+            starts = np.flatnonzero(np.r_[True, r[1:] != r[:-1]])
+            gram[r[starts]] += np.add.reduceat(np.einsum("ni,nj->nij", y, y), starts, axis=0)
+            rhs[r[starts]] += np.add.reduceat(y * values[start:stop, None], starts, axis=0)
+        counts = np.bincount(rows[lo:hi] - first, minlength=size).astype(np.float32)
+        gram += (reg * np.maximum(counts, 1))[:, None, None] * eye
+        result[first:first + size] = np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+    return result
+
+
+def train_als(
+    users: np.ndarray, books: np.ndarray, scores: np.ndarray, *,
+    factors: int = 32, reg: float = 0.05, iterations: int = 10, seed: int = 0,
+) -> Dict[str, np.ndarray]:
+    user_ids, user_idx = np.unique(users, return_inverse=True)
+    book_ids, book_idx = np.unique(books, return_inverse=True)
+    mean = float(scores.mean()) if scores.size else 0.0
+    values = (scores - mean).astype(np.float32)
+
+    rng = np.random.default_rng(seed)
+    user_factors = np.zeros((user_ids.size, factors), dtype=np.float32)
+    book_factors = (rng.standard_normal((book_ids.size, factors)) * 0.1).astype(np.float32)
+    by_user = np.argsort(user_idx, kind="stable")
+    by_book = np.argsort(book_idx, kind="stable")
+    for _ in range(iterations):
+        user_factors = _solve_side(user_idx[by_user], book_idx[by_user], values[by_user], user_ids.size, book_factors, reg)
+        book_factors = _solve_side(book_idx[by_book], user_idx[by_book], values[by_book], book_ids.size, user_factors, reg)
+
+    error = values - np.einsum("ij,ij->i", user_factors[user_idx], book_factors[book_idx])
+    return {
+        "user_ids": user_ids.astype(np.int64),
+        "user_factors": user_factors,
+        "book_ids": book_ids.astype(np.int64),
+        # Stored transposed, (factors, books): scoring is then a row vector times a
+        # contiguous matrix, about twice as fast as the (books, factors) layout
+        "book_factors_t": np.ascontiguousarray(book_factors.T),
+        # Most rated first: the fallback for users without factors
+        "popular": book_ids[np.argsort(-np.bincount(book_idx), kind="stable")].astype(np.int64),
+        "mean": np.float32(mean),
+        "rmse": np.float32(np.sqrt(np.mean(error ** 2))) if error.size else np.float32(0),
+    }
+
+
+def save_model(directory: str, model: Dict[str, np.ndarray], keep: int = 2) -> str:
+    """Publish the model arrays as a new version of als.json."""
+    arrays = {name: model[name] for name in ("user_ids", "user_factors", "book_ids", "book_factors_t", "popular")}
+    meta = {
+        "mean": float(model["mean"]), "rmse": float(model["rmse"]),
+        "users": int(model["user_ids"].size), "books": int(model["book_ids"].size),
+        "factors": int(model["book_factors_t"].shape[0]),
+    }
+    return publish(directory, "als", arrays, meta, keep=keep)
+
+
+async def train_from_ratings(engine: AsyncEngine, directory: str, **options) -> Dict[str, float]:
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        result = await conn.execute(select(Rating.user_id, Rating.book_id, Rating.score))
+        data = np.array(result.all(), dtype=np.int64).reshape(-1, 3)
+    loaded = time.perf_counter()
+    model = train_als(data[:, 0], data[:, 1], data[:, 2].astype(np.float32), **options)
+    trained = time.perf_counter()
+    version = save_model(directory, model)
+    return {
+        "version": version,
+        "ratings": int(data.shape[0]),
+        "users": int(model["user_ids"].size),
+        "books": int(model["book_ids"].size),
+        "train_rmse": round(float(model["rmse"]), 4),
+        "load_seconds": round(loaded - started, 2),
+        "train_seconds": round(trained - loaded, 2),
+    }
+
+
+class FactorModel:
+    """A trained model memory-mapped from disk."""
+
+    def __init__(self, path: str, meta: Dict):
+        self.version = meta["version"]
+        arrays = load_arrays(path, "user_ids", "user_factors", "book_ids", "book_factors_t", "popular")
+        self.user_ids = arrays["user_ids"]
+        self.user_factors = arrays["user_factors"]
+        self.book_ids = arrays["book_ids"]
+        self.book_factors_t = arrays["book_factors_t"]
+        self.popular = arrays["popular"]
+
+    def recommend(self, user_id: int, exclude: np.ndarray, limit: int) -> np.ndarray:
+        """Book ids with the highest predicted score for `user_id`, excluding `exclude`."""
+        position = np.searchsorted(self.user_ids, user_id)
+        if position >= self.user_ids.size or self.user_ids[position] != user_id:
+            candidates = self.popular[: limit + exclude.size]
+            return candidates[~np.isin(candidates, exclude)][:limit]
+        scores = np.asarray(self.user_factors[position] @ self.book_factors_t)
+        if exclude.size and self.book_ids.size:
+            positions = np.minimum(np.searchsorted(self.book_ids, exclude), self.book_ids.size - 1)
+            scores[positions[self.book_ids[positions] == exclude]] = -np.inf
+        n = min(limit, scores.size)
+        top = np.argpartition(scores, scores.size - n)[-n:] if n else np.empty(0, np.int64)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.book_ids[top[np.isfinite(scores[top])]]
+
+
+model_store: ArtifactStore[FactorModel] = ArtifactStore(settings.MODEL_DIR, "als", FactorModel)
@@ -0,0 +1,165 @@
+"""
+Typo-tolerant catalog filters (GET /books/?author=tolstoi&fuzzy=true).
+
+Every worker keeps the vocabulary of words used in titles and in author
+names, with a character-trigram inverted index over it (trigrams as in
+pg_trgm: the accent-free word padded with two spaces in front and one
+behind). A query word is corrected in two steps:
+
+1. candidates: the words found in the postings of its trigrams that share
+   enough of them and have a compatible length to be within max_edits, at
+   most CANDIDATES of them by Jaccard similarity of the trigram sets;
+2. re-ranking: the optimal string alignment distance (edit distance with
+   transpositions) of each candidate, keeping those within max_edits of the
+   word, closest and then most frequent first.
+
+The filter then becomes "every query word, or one of its corrections, occurs
+in the value", which the database evaluates with the usual ILIKE. The
+original word is always one of the alternatives, so a fuzzy filter matches
+everything the exact one does. The vocabulary is reloaded every
+FUZZY_VOCABULARY_TTL_SECONDS; words of newer books only match exactly until
+then.
+"""
+import asyncio
+import re
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import Book
+from app.db.suggest import normalize
+
+_WORD = re.compile(r"[^\W_]+")
+CANDIDATES = 50
+MAX_CORRECTIONS = 5
+
+# All of the groups must match; a group matches when any of its strings occurs in the value
+Terms = List[List[str]]
+
+
+def words(text: Optional[str]) -> List[str]:
+    """Distinct lower-cased words of `text`, in order."""
+    return list(dict.fromkeys(_WORD.findall(text.lower()))) if text else []
+
+
+def max_edits(length: int) -> int:
+    """Edits tolerated in a word of `length` characters."""
+    if length < 3:
+        return 0
+    return 1 if length <= 5 else 2
+
+
+def _trigrams(form: str) -> List[str]:
+    padded = f"  {form} "
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(len(padded) - 2)))
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions and
+    adjacent transpositions), or limit + 1 as soon as it must exceed `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class Vocabulary:
+    """The words of a set of texts with a trigram index over their accent-free forms."""
+
+    def __init__(self, texts: Iterable[Optional[str]]):
+        counts: Dict[str, int] = {}
+        for text in texts:
+            for word in words(text):
+                counts[word] = counts.get(word, 0) + 1
+        self.words = list(counts)
+        self.frequency = np.fromiter(counts.values(), dtype=np.int32, count=len(counts))
+        self.forms = [normalize(word) for word in self.words]
+        self.lengths = np.fromiter((len(form) for form in self.forms), dtype=np.int32, count=len(self.forms))
+        self.trigram_ids: Dict[str, int] = {}
+        owners: List[int] = []
+        grams: List[int] = []
+        for position, form in enumerate(self.forms):
+            for gram in _trigrams(form):
+                grams.append(self.trigram_ids.setdefault(gram, len(self.trigram_ids)))
+                owners.append(position)
+        owner_array = np.array(owners, dtype=np.int32)
+        gram_array = np.array(grams, dtype=np.int32)
+        self.gram_counts = np.bincount(owner_array, minlength=len(self.words))
+        self.postings = owner_array[np.argsort(gram_array, kind="stable")]
+        self.ptr = np.r_[0, np.cumsum(np.bincount(gram_array, minlength=len(self.trigram_ids)))]
+
+    def corrections(self, word: str) -> List[str]:
+        """Vocabulary words within max_edits of `word`, closest and most frequent first."""
+        form = normalize(word)
+        edits = max_edits(len(form))
+        query = [self.trigram_ids[gram] for gram in _trigrams(form) if gram in self.trigram_ids]
+        if not edits or not query:
+            return []
+        postings = np.concatenate([self.postings[self.ptr[gram]:self.ptr[gram + 1]] for gram in query])
+        candidates, shared = np.unique(postings, return_counts=True)
+        # An edit (a transposition included) changes at most four trigrams: closer words share at least this many
+        keep = (shared >= len(_trigrams(form)) - 4 * edits) & (np.abs(self.lengths[candidates] - len(form)) <= edits)
+        candidates, shared = candidates[keep], shared[keep]
+        if candidates.size > CANDIDATES:
+            similarity = shared / (len(_trigrams(form)) + self.gram_counts[candidates] - shared)
+            candidates = candidates[np.argpartition(-similarity, CANDIDATES - 1)[:CANDIDATES]]
+        ranked = []
+        for position in candidates.tolist():
+            distance = edit_distance(form, self.forms[position], edits)
+            if distance <= edits:
+                ranked.append((distance, -int(self.frequency[position]), self.words[position]))
+        return [item[2] for item in sorted(ranked)[:MAX_CORRECTIONS]]
+
+    def terms(self, text: str) -> Terms:
+        """The fuzzy form of a substring filter on `text`: each word with its corrections."""
+        groups = [[word] + [other for other in self.corrections(word) if other != word] for word in words(text)]
+        return groups or [[text]]
+
+
+class FuzzyIndex:
+    def __init__(self, titles: Iterable[Optional[str]], authors: Iterable[Optional[str]]):
+        self.loaded_at = time.monotonic()
+        self.title = Vocabulary(titles)
+        self.author = Vocabulary(authors)
+
+
+class FuzzyMatcher:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.index: Optional[FuzzyIndex] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self, db: AsyncSession) -> FuzzyIndex:
+        """The vocabularies, reloaded once older than the TTL by one request while the others use the old ones."""
+        index = self.index
+        fresh = index is not None and time.monotonic() - index.loaded_at < self.ttl
+        if fresh or (index is not None and self._lock.locked()):
+            return index
+        async with self._lock:
+            if self.index is not index:
+                return self.index
+            titles = (await db.execute(select(Book.title))).scalars().all()
+            authors = (await db.execute(select(Book.author).distinct())).scalars().all()
+            # Tokenizing the catalog is CPU-bound; keep it off the loop thread
+            self.index = await asyncio.get_running_loop().run_in_executor(None, FuzzyIndex, titles, authors)
+            return self.index
+
+
+fuzzy_matcher = FuzzyMatcher(settings.FUZZY_VOCABULARY_TTL_SECONDS)
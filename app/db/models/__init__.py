@@ -0,0 +1,6 @@
+from .association_tables import user_favorite_books_table
+from .book import Book, BookAvailability, Comment, Rating
+from .purchase import Purchase, PurchaseStatus
+from .recommendation import BookCoPurchase, BookSimilarity
+from .sales import BookSales, BookSalesTotal
+from .user import User
@@ -1,7 +1,7 @@
 import enum
 from sqlalchemy import (
     Column, Integer, String, Text, Float, Enum as SQLEnum, ForeignKey,
-    Date, DateTime, UniqueConstraint, event # <--- Import event
+    Date, DateTime, Index, UniqueConstraint, event # <--- Import event
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -39,7 +39,24 @@ class Book(Base):
     )
     publication_date = Column(Date, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set on insert too: the catalog snapshot finds new books by it (app.db.catalog)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # Kept up to date by CRUDBook.add_or_update_rating, for rating filters and sorts
+    average_rating = Column(Float, nullable=True)
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Catalog sorts (CRUDBook.get_multi_filtered) are ordered index scans, ties broken by id.
+    # "Newest" and "rating" put books without a value last: PostgreSQL needs that spelled
+    # out in the index, SQLite sorts NULLs lowest and does not accept it.
+    __table_args__ = (
+        Index("ix_books_cost_id", cost, id),
+        Index("ix_books_publication_date_id", publication_date.desc().nulls_last(), id.desc()).ddl_if(dialect="postgresql"),
+        Index("ix_books_publication_date_id", publication_date.desc(), id.desc()).ddl_if(dialect="sqlite"),
+        Index("ix_books_average_rating_id", average_rating.desc().nulls_last(), id.desc()).ddl_if(dialect="postgresql"),
+        Index("ix_books_average_rating_id", average_rating.desc(), id.desc()).ddl_if(dialect="sqlite"),
+        # Incremental refresh of the catalog snapshot (app.db.catalog)
+        Index("ix_books_updated_at", updated_at),
+    )
 
     # Relationships
     purchases = relationship("Purchase", back_populates="book")
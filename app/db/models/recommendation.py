@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Float, Integer, ForeignKey, Index
+
+from app.db.base import Base
+
+
+class BookCoPurchase(Base):
+    """
+    "Customers who bought this also bought": one row per (book, other book)
+    with the number of users who completed purchases of both. Rebuilt in batch
+    (keeping the top neighbours of each book) and incremented on checkout.
+    """
+    __tablename__ = "book_co_purchases"
+    __table_args__ = (
+        # Serves the top-K lookup of a book as one index range scan
+        Index("ix_book_co_purchases_book_id_score", "book_id", "score"),
+    )
+
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    other_book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Integer, nullable=False, default=0)
+
+
+class BookSimilarity(Base):
+    """
+    "Similar books" by content: one row per (book, other book) with the cosine
+    similarity of their TF-IDF vectors. Rebuilt in batch (keeping the top
+    neighbours of each book) and refreshed when a book's text changes.
+    """
+    __tablename__ = "book_similarities"
+    __table_args__ = (
+        Index("ix_book_similarities_book_id_score", "book_id", "score"),
+    )
+
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    other_book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
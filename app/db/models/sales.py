@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, ForeignKey, Index
+
+from app.db.base import Base
+
+
+class BookSales(Base):
+    """
+    Completed sales of a book per hour (hours since the Unix epoch), written by
+    the workers' sales trackers. Only the last month of hours is kept.
+    """
+    __tablename__ = "book_sales"
+    __table_args__ = (
+        # Loading recent hours and pruning old ones are range scans on hour
+        Index("ix_book_sales_hour", "hour"),
+    )
+
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class BookSalesTotal(Base):
+    """All-time completed sales of a book."""
+    __tablename__ = "book_sales_totals"
+
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,166 @@
+"""
+Personalized catalog ordering (GET /books/?sort=personalized).
+
+Ranking runs over the worker's catalog snapshot (app.db.catalog), with a
+normalized popularity per book (all time sales from app.db.sales) and the
+books grouped by author, recomputed for every new snapshot and every
+PERSONALIZATION_CATALOG_TTL_SECONDS. A user's affinity is the share of their
+completed purchases and favorites per genre and per author, cached per user
+for PERSONALIZATION_AFFINITY_TTL_SECONDS. Ranking a request is then a handful
+of NumPy operations over the snapshot:
+
+    score = GENRE_WEIGHT * genre affinity + AUTHOR_WEIGHT * author affinity
+            + POPULARITY_WEIGHT * popularity
+
+with the filters applied by the snapshot and a partial sort for the page. Only
+the page itself is read from the database, with the filters applied again so
+books that changed since the snapshot are dropped rather than shown wrongly.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import record_cache
+from app.db.catalog import CatalogSnapshot
+from app.db.models import Book, Purchase, PurchaseStatus, user_favorite_books_table
+from app.db.sales import ALL_TIME, sales_tracker
+
+GENRE_WEIGHT = 0.5
+AUTHOR_WEIGHT = 0.3
+POPULARITY_WEIGHT = 0.2
+# A favorite counts like this many purchases
+FAVORITE_WEIGHT = 2.0
+
+
+class PersonalizationFeatures:
+    """What the scores need on top of a catalog snapshot, rows in the same order."""
+
+    def __init__(self, catalog: CatalogSnapshot, popularity: Tuple[np.ndarray, np.ndarray]):
+        self.catalog = catalog
+        self.loaded_at = time.monotonic()
+        # Book positions grouped by author, for scattering author affinity
+        self.by_author = np.argsort(catalog.author, kind="stable")
+        self.author_ptr = np.r_[0, np.cumsum(np.bincount(catalog.author, minlength=len(catalog.authors.values)))]
+        counts = catalog.align(*popularity)
+        self.popularity = np.log1p(counts) / max(float(np.log1p(counts.max(initial=0))), 1.0)
+
+    def scores(self, affinity: Optional["Affinity"]) -> np.ndarray:
+        catalog = self.catalog
+        scores = POPULARITY_WEIGHT * self.popularity
+        if affinity is None:
+            return scores
+        genre_vector = np.zeros(len(catalog.genres.values), dtype=np.float32)
+        for genre, weight in affinity.genres.items():
+            code = catalog.genres.index.get(genre)
+            if code is not None:
+                genre_vector[code] = weight
+        scores = scores + GENRE_WEIGHT * genre_vector[catalog.genre]
+        author_index = catalog.authors.index
+        codes = [(author_index[author], weight) for author, weight in affinity.authors.items() if author in author_index]
+        if codes:
+            starts = np.array([self.author_ptr[code] for code, _ in codes])
+            lengths = np.array([self.author_ptr[code + 1] - self.author_ptr[code] for code, _ in codes])
+            positions = self.by_author[np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())]
+            scores[positions] += AUTHOR_WEIGHT * np.repeat([weight for _, weight in codes], lengths).astype(np.float32)
+        return scores
+
+
+class Affinity:
+    """A user's genre and author preferences, each scaled so the favourite is 1."""
+
+    def __init__(self, genres: Dict[str, float], authors: Dict[str, float]):
+        top_genre = max(genres.values(), default=1.0)
+        top_author = max(authors.values(), default=1.0)
+        self.genres = {genre: weight / top_genre for genre, weight in genres.items()}
+        self.authors = {author: weight / top_author for author, weight in authors.items()}
+
+
+async def _load_affinity(db: AsyncSession, user_id: int) -> Affinity:
+    activity = union_all(
+        select(Purchase.book_id, func.count().label("weight"))
+        .filter(Purchase.user_id == user_id, Purchase.status == PurchaseStatus.COMPLETED)
+        .group_by(Purchase.book_id),
+        select(user_favorite_books_table.c.book_id, func.count() * FAVORITE_WEIGHT)
+        .filter(user_favorite_books_table.c.user_id == user_id)
+        .group_by(user_favorite_books_table.c.book_id),
+    ).subquery()
+    result = await db.execute(
+        select(Book.genre, Book.author, func.sum(activity.c.weight))
+        .join(activity, activity.c.book_id == Book.id)
+        .group_by(Book.genre, Book.author)
+    )
+    genres: Dict[str, float] = {}
+    authors: Dict[str, float] = {}
+    for genre, author, weight in result.all():
+        if genre:
+            genres[genre] = genres.get(genre, 0.0) + float(weight)
+        authors[author] = authors.get(author, 0.0) + float(weight)
+    return Affinity(genres, authors)
+
+
+class Personalizer:
+    def __init__(self, popularity_ttl: float, affinity_ttl: float, max_users: int):
+        self.popularity_ttl = popularity_ttl
+        self.affinity_ttl = affinity_ttl
+        self.max_users = max_users
+        self.features: Optional[PersonalizationFeatures] = None
+        self.affinities: "OrderedDict[int, Tuple[float, Affinity]]" = OrderedDict()
+        self._features_lock = asyncio.Lock()
+
+    async def get_features(self, catalog: CatalogSnapshot) -> PersonalizationFeatures:
+        """
+        The features of `catalog`, rebuilt for a new snapshot and once the
+        popularity is older than the TTL. One request recomputes stale
+        popularity while the others keep using the previous one.
+        """
+        features = self.features
+        if features is not None and features.catalog is catalog:
+            fresh = time.monotonic() - features.loaded_at < self.popularity_ttl
+            if fresh or self._features_lock.locked():
+                return features
+        async with self._features_lock:
+            features = self.features
+            if features is None or features.catalog is not catalog or time.monotonic() - features.loaded_at >= self.popularity_ttl:
+                popularity = sales_tracker.arrays(ALL_TIME)
+                # Grouping the catalog by author is CPU-bound; keep it off the loop thread
+                features = await asyncio.get_running_loop().run_in_executor(None, PersonalizationFeatures, catalog, popularity)
+                self.features = features
+            return features
+
+    async def scores(self, db: AsyncSession, catalog: CatalogSnapshot, user_id: Optional[int]) -> np.ndarray:
+        """Scores of the rows of `catalog` for `user_id`, by popularity alone for anonymous users."""
+        features = await self.get_features(catalog)
+        affinity = await self.get_affinity(db, user_id) if user_id is not None else None
+        return features.scores(affinity)
+
+    async def get_affinity(self, db: AsyncSession, user_id: int) -> Affinity:
+        entry = self.affinities.get(user_id)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            self.affinities.move_to_end(user_id)
+            record_cache("affinity", True)
+            return entry[1]
+        record_cache("affinity", False)
+        affinity = await _load_affinity(db, user_id)
+        self.affinities[user_id] = (now + self.affinity_ttl, affinity)
+        self.affinities.move_to_end(user_id)
+        while len(self.affinities) > self.max_users:
+            self.affinities.popitem(last=False)
+        return affinity
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget a user's affinity (after a checkout or favorite change in this worker)."""
+        self.affinities.pop(user_id, None)
+
+
+personalizer = Personalizer(
+    settings.PERSONALIZATION_CATALOG_TTL_SECONDS,
+    settings.PERSONALIZATION_AFFINITY_TTL_SECONDS,
+    settings.PERSONALIZATION_AFFINITY_CACHE_SIZE,
+)
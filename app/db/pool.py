@@ -0,0 +1,73 @@
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Sequence
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+# Upper bounds (in seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PoolStats:
+    """
+    Checkout counters and wait-time histogram for the connection pool of this worker.
+    """
+
+    def __init__(self, buckets: Sequence[float] = WAIT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.wait_counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.wait_seconds_sum = 0.0
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def observe_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds_sum += seconds
+        self.wait_counts[bisect_left(self.buckets, seconds)] += 1
+
+    def wait_histogram(self) -> Dict[str, int]:
+        """Cumulative bucket counts keyed by upper bound, Prometheus style."""
+        histogram, running = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.wait_counts):
+            running += count
+            histogram["+Inf" if bound == float("inf") else str(bound)] = running
+        return histogram
+
+    def snapshot(self, pool: Pool) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "pool_class": type(pool).__name__,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_sum": round(self.wait_seconds_sum, 6),
+            "wait_histogram": self.wait_histogram(),
+        }
+        if isinstance(pool, QueuePool):
+            data.update(
+                pool_size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                # QueuePool counts overflow from -pool_size; only connections above pool_size matter here
+                overflow=max(pool.overflow(), 0),
+            )
+        return data
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that records how long every checkout waited
+    (including pre-ping and opening new connections) in `pool_stats`.
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.observe_wait(time.perf_counter() - started)
@@ -0,0 +1,151 @@
+"""
+pg_stat_statements-style statistics collected in the application, so they
+work on SQLite as well as PostgreSQL.
+
+Every statement is reduced to a fingerprint (literals and bind parameters
+replaced by `?`, IN-lists collapsed) and aggregated per fingerprint and
+calling route: calls, total/mean/max time and rows (as reported by the
+driver's rowcount, so mostly for writes). Statements slower than
+SLOW_QUERY_MS are logged with the shape of their parameters, never the values.
+"""
+import logging
+import re
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import settings
+from app.core.metrics import current_scope, route_template
+
+logger = logging.getLogger("app.db.slow_queries")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.$])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PARAM = re.compile(r"\$\d+|%\(\w+\)s|%s|:\w+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"\bVALUES\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+OVERFLOW = "<other statements>"
+ORDER_KEYS = {
+    "total_time": "total_time_ms", "mean_time": "mean_time_ms", "max_time": "max_time_ms",
+    "calls": "calls", "rows": "rows",
+}
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize a SQL statement so that executions differing only in values match."""
+    text = _STRING.sub("?", statement)
+    text = _PARAM.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _IN_LIST.sub("IN (...)", text)
+    text = _VALUES_LIST.sub(r"VALUES \1, ...", text)
+    return _SPACE.sub(" ", text).strip()
+
+
+def _shape(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> Any:
+    """Types (and lengths) of the bound parameters, safe to log."""
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = parameters[0] if parameters else None
+        return {"rows": len(parameters), "each": parameter_shape(first) if first is not None else None}
+    if isinstance(parameters, dict):
+        return {key: _shape(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_shape(value) for value in parameters]
+    return _shape(parameters)
+
+
+class QueryStats:
+    """Per-worker statistics keyed by (fingerprint, route)."""
+
+    def __init__(self, max_entries: int = 5000, slow_ms: float = 200.0):
+        self.max_entries = max_entries
+        self.slow_seconds = slow_ms / 1000
+        # (fingerprint, route) -> [calls, total seconds, max seconds, rows]
+        self.entries: Dict[Tuple[str, str], List[float]] = {}
+        # Compiled statements repeat, so normalizing each distinct string once is enough
+        self._fingerprints: Dict[str, str] = {}
+        self.since = time.time()
+
+    def fingerprint(self, statement: str) -> str:
+        cached = self._fingerprints.get(statement)
+        if cached is None:
+            cached = fingerprint(statement)
+            if len(self._fingerprints) < self.max_entries * 4:
+                self._fingerprints[statement] = cached
+        return cached
+
+    def record(self, statement: str, route: str, elapsed: float, rows: int) -> str:
+        key = (self.fingerprint(statement), route)
+        entry = self.entries.get(key)
+        if entry is None:
+            if len(self.entries) >= self.max_entries:
+                key = (OVERFLOW, route)
+                entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [0, 0.0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+        entry[3] += max(rows, 0)
+        return key[0]
+
+    def top(self, limit: int = 20, order_by: str = "total_time") -> List[Dict[str, Any]]:
+        rows = [
+            {
+                "fingerprint": fp,
+                "route": route,
+                "calls": int(calls),
+                "total_time_ms": round(total * 1000, 3),
+                "mean_time_ms": round(total / calls * 1000, 3) if calls else 0.0,
+                "max_time_ms": round(max_time * 1000, 3),
+                "rows": int(rows_),
+            }
+            for (fp, route), (calls, total, max_time, rows_) in self.entries.items()
+        ]
+        rows.sort(key=lambda row: row[ORDER_KEYS[order_by]], reverse=True)
+        return rows[:limit]
+
+    def reset(self) -> None:
+        self.entries.clear()
+        self.since = time.time()
+
+
+query_stats = QueryStats(settings.QUERY_STATS_MAX_ENTRIES, settings.SLOW_QUERY_MS)
+
+
+def instrument_engine(engine, stats: QueryStats = query_stats) -> None:
+    """Time every statement on `engine` into `stats` and log the slow ones."""
+    from sqlalchemy import event
+
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        scope = current_scope.get()
+        route = route_template(scope) if scope else "<background>"
+        rows = cursor.rowcount if cursor.rowcount is not None else -1
+        fp = stats.record(statement, route, elapsed, rows)
+        if elapsed >= stats.slow_seconds:
+            logger.warning(
+                "Slow query %.1fms on %s: %s", elapsed * 1000, route, fp,
+                extra={"duration_ms": round(elapsed * 1000, 3), "route": route,
+                       "params": parameter_shape(parameters, executemany)},
+            )
@@ -0,0 +1,141 @@
+import itertools
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core import security
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal, make_engine
+
+
+class ReplicaSet:
+    """
+    Round-robin over read replicas. A replica that fails at the connection level is
+    ejected for `eject_seconds` and reads fall back to the remaining ones (or the primary).
+    """
+
+    def __init__(self, urls: List[str], eject_seconds: float):
+        self.eject_seconds = eject_seconds
+        self.session_makers = [
+            async_sessionmaker(make_engine(url), class_=AsyncSession, expire_on_commit=False)
+            for url in urls
+        ]
+        self.ejected_until = [0.0] * len(urls)
+        self._next = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.session_makers)
+
+    def choose(self) -> Optional[Tuple[int, async_sessionmaker]]:
+        """Return the next healthy replica as (index, session maker), or None if none is usable."""
+        now = time.monotonic()
+        for _ in range(len(self.session_makers)):
+            index = next(self._next) % len(self.session_makers)
+            if self.ejected_until[index] <= now:
+                return index, self.session_makers[index]
+        return None
+
+    def eject(self, index: int) -> None:
+        self.ejected_until[index] = time.monotonic() + self.eject_seconds
+
+
+class RecentWrites:
+    """
+    Remembers which users committed a write in the last `window_seconds`,
+    so their reads can be pinned to the primary (read-your-writes).
+    The markers are kept per worker process.
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._until: Dict[str, float] = {}
+
+    def mark(self, subject: str) -> None:
+        now = time.monotonic()
+        if len(self._until) > 10000:
+            self._until = {s: until for s, until in self._until.items() if until > now}
+        self._until[subject] = now + self.window_seconds
+
+    def is_recent(self, subject: Optional[str]) -> bool:
+        if subject is None:
+            return False
+        until = self._until.get(subject)
+        return until is not None and until > time.monotonic()
+
+    def __bool__(self) -> bool:
+        return bool(self._until)
+
+
+replicas = ReplicaSet(
+    [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()],
+    eject_seconds=settings.REPLICA_EJECT_SECONDS,
+)
+recent_writes = RecentWrites(settings.READ_YOUR_WRITES_SECONDS)
+
+
+@event.listens_for(Session, "after_commit")
+def _flag_committed(session: Session) -> None:
+    session.info["committed"] = True
+
+
+def get_request_subject(request: Request) -> Optional[str]:
+    """Username from the bearer token of the request, if any (not verified against the DB)."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = security.decode_access_token(token)
+    return payload.get("sub") if payload else None
+
+
+# Dependency to get a DB session on the primary
+async def get_db(request: Request) -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as session:
+        yield session
+        if session.info.get("committed") and replicas:
+            subject = get_request_subject(request)
+            if subject:
+                recent_writes.mark(subject)
+
+
+# Errors that mean the replica itself is unusable, rather than the query being wrong
+CONNECTION_ERRORS = (OperationalError, InterfaceError, OSError)
+
+
+# Dependency for read-only endpoints: a replica session unless none is configured/healthy
+# or the caller wrote recently, in which case the primary is used.
+async def get_read_db(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    The session is connected before it is handed out, so a replica that cannot
+    be reached is ejected and the read moves on to the next healthy replica, and
+    finally to the primary, without the request noticing. A replica failing in
+    the middle of the request's queries is ejected too, but that request fails:
+    its session has already been used and cannot be replayed elsewhere.
+    """
+    if replicas and not (recent_writes and recent_writes.is_recent(get_request_subject(request))):
+        for _ in range(len(replicas)):
+            choice = replicas.choose()
+            if choice is None:
+                break
+            index, session_maker = choice
+            session = session_maker()
+            try:
+                await session.connection()
+            except CONNECTION_ERRORS:
+                replicas.eject(index)
+                await session.close()
+                continue
+            async with session:
+                try:
+                    yield session
+                except CONNECTION_ERRORS:
+                    replicas.eject(index)
+                    raise
+            return
+
+    async with AsyncSessionLocal() as session:
+        yield session
@@ -0,0 +1,369 @@
+"""
+Trending and bestseller rankings (GET /books/trending, GET /books/?sort=bestselling).
+
+Every worker counts completed sales in memory: a ring of RING_HOURS hourly
+buckets ({book: sales}) and running totals per window (last day, week and
+month, plus all time). A new hour subtracts the bucket that falls out of each
+window. Each (window, genre) keeps a top-K heap that checkouts update in place;
+a heap is rebuilt from its window's totals only after counts went down.
+Serving a ranking is a read of one heap, never a query over purchases.
+
+Workers share their counts through the database: every TRENDING_SYNC_SECONDS
+a worker adds its unflushed sales to book_sales (per book and hour) and
+book_sales_totals, then reloads the last two hours from book_sales to pick up
+the other workers' sales. The whole state is reloaded once an hour, which
+also bounds any drift. `python -m app.cli backfill-sales` rebuilds both
+tables from purchases.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.cooccurrence import write_rows
+from app.db.models import Book, BookSales, BookSalesTotal, Purchase, PurchaseStatus
+
+logger = logging.getLogger(__name__)
+
+RING_HOURS = 720
+WINDOWS = {"day": 24, "week": 168, "month": 720}
+ALL_TIME = "all"
+
+
+def current_hour() -> int:
+    """Hours since the Unix epoch, the bucket key shared by all workers."""
+    return int(time.time() // 3600)
+
+
+def genre_key(genre: Optional[str]) -> str:
+    return (genre or "").strip().lower()
+
+
+class TopK:
+    """
+    The k books with the highest counts, as a min-heap of (count, -book_id)
+    with stale entries skipped lazily. Counts offered must only grow.
+    """
+
+    def __init__(self, k: int, items: Iterable[Tuple[int, int]] = ()):
+        self.k = k
+        self.counts: Dict[int, int] = dict(heapq.nlargest(k, items, key=lambda item: (item[1], -item[0])))
+        self._heap = [(count, -book_id) for book_id, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def offer(self, book_id: int, count: int) -> None:
+        if book_id not in self.counts and len(self.counts) >= self.k:
+            weakest = self._weakest()
+            if (count, -book_id) <= weakest:
+                return
+            heapq.heappop(self._heap)
+            del self.counts[-weakest[1]]
+        self.counts[book_id] = count
+        heapq.heappush(self._heap, (count, -book_id))
+        if len(self._heap) > 4 * self.k + 64:
+            self._heap = [(count, -book_id) for book_id, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _weakest(self) -> Tuple[int, int]:
+        while self.counts.get(-self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0]
+
+    def ranked(self) -> List[Tuple[int, int]]:
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+class SalesCounters:
+    """Hourly ring buffer, per-window totals and top-K heaps of one worker."""
+
+    def __init__(self, top_k: int, hour: int):
+        self.top_k = top_k
+        self.hour = hour
+        self.ring: List[Dict[int, int]] = [{} for _ in range(RING_HOURS)]
+        self.totals: Dict[str, Dict[int, int]] = {window: {} for window in (*WINDOWS, ALL_TIME)}
+        self.genres: Dict[int, str] = {}
+        self.top: Dict[Tuple[str, Optional[str]], TopK] = {}
+        # Windows whose heaps missed a decrement and must be rebuilt before use
+        self.stale: Set[str] = set(self.totals)
+        self.version = 0
+
+    def add(self, book_id: int, genre: str, hour: int, delta: int, all_time: bool = True) -> None:
+        if hour > self.hour:
+            self.advance(hour)
+        self.genres[book_id] = genre
+        if hour > self.hour - RING_HOURS:
+            bucket = self.ring[hour % RING_HOURS]
+            bucket[book_id] = bucket.get(book_id, 0) + delta
+        for window, length in WINDOWS.items():
+            if hour > self.hour - length:
+                self._bump(window, book_id, genre, delta)
+        if all_time:
+            self._bump(ALL_TIME, book_id, genre, delta)
+        self.version += 1
+
+    def _bump(self, window: str, book_id: int, genre: str, delta: int) -> None:
+        totals = self.totals[window]
+        count = totals.get(book_id, 0) + delta
+        if count > 0:
+            totals[book_id] = count
+        else:
+            totals.pop(book_id, None)
+        if delta < 0:
+            self.stale.add(window)
+        elif window not in self.stale:
+            for key in ((window, None), (window, genre)):
+                top = self.top.get(key)
+                if top is None:
+                    top = self.top[key] = TopK(self.top_k)
+                top.offer(book_id, count)
+
+    def set_hour(self, hour: int, counts: Dict[int, int], genres: Dict[int, str]) -> None:
+        """Replace one hour's bucket (with the database's view of it), adjusting every total."""
+        if hour <= self.hour - RING_HOURS:
+            return
+        if hour > self.hour:
+            self.advance(hour)
+        old = self.ring[hour % RING_HOURS]
+        for book_id in set(old) | set(counts):
+            delta = counts.get(book_id, 0) - old.get(book_id, 0)
+            if delta:
+                self.add(book_id, genres.get(book_id, self.genres.get(book_id, "")), hour, delta)
+
+    def advance(self, hour: int) -> None:
+        """Move to `hour`, dropping the buckets that leave each window."""
+        if hour <= self.hour:
+            return
+        for h in range(max(self.hour + 1, hour - RING_HOURS + 1), hour + 1):
+            for window, length in WINDOWS.items():
+                leaving = self.ring[(h - length) % RING_HOURS]
+                if not leaving:
+                    continue
+                totals = self.totals[window]
+                for book_id, count in leaving.items():
+                    remaining = totals.get(book_id, 0) - count
+                    if remaining > 0:
+                        totals[book_id] = remaining
+                    else:
+                        totals.pop(book_id, None)
+                self.stale.add(window)
+            self.ring[h % RING_HOURS] = {}
+        if hour - self.hour >= RING_HOURS:
+            for window in WINDOWS:
+                self.totals[window] = {}
+                self.stale.add(window)
+        self.hour = hour
+        self.version += 1
+
+    def _rebuild(self, window: str) -> None:
+        by_genre: Dict[Optional[str], List[Tuple[int, int]]] = {None: []}
+        for book_id, count in self.totals[window].items():
+            by_genre[None].append((book_id, count))
+            by_genre.setdefault(self.genres.get(book_id, ""), []).append((book_id, count))
+        for key in [key for key in self.top if key[0] == window]:
+            del self.top[key]
+        for genre, items in by_genre.items():
+            self.top[(window, genre)] = TopK(self.top_k, items)
+        self.stale.discard(window)
+
+    def ranking(self, window: str, genre: Optional[str], limit: int) -> List[Tuple[int, int]]:
+        """(book_id, sales) of the best sellers in `window`, optionally of one genre."""
+        self.advance(current_hour())
+        if window in self.stale:
+            self._rebuild(window)
+        top = self.top.get((window, None if genre is None else genre_key(genre)))
+        return top.ranked()[:limit] if top else []
+
+
+class SalesTracker:
+    def __init__(self, top_k: int):
+        self.counters = SalesCounters(top_k, current_hour())
+        # Sales not yet written to the database: (book_id, hour) -> count, and their genres
+        self.pending: Dict[Tuple[int, int], int] = {}
+        self.pending_genres: Dict[int, str] = {}
+        self.loaded_hour: Optional[int] = None
+        # Set once the counters have been loaded from the database
+        self.ready = asyncio.Event()
+        self._arrays: Dict[str, Tuple[int, np.ndarray, np.ndarray]] = {}
+
+    def record(self, book_id: int, genre: Optional[str], count: int = 1) -> None:
+        """Count a completed sale (called after a checkout commits)."""
+        hour = current_hour()
+        key = genre_key(genre)
+        self.counters.add(book_id, key, hour, count)
+        self.pending[(book_id, hour)] = self.pending.get((book_id, hour), 0) + count
+        self.pending_genres[book_id] = key
+
+    def ranking(self, window: str, genre: Optional[str] = None, limit: int = 10) -> List[Tuple[int, int]]:
+        return self.counters.ranking(window, genre, limit)
+
+    def arrays(self, window: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(sorted book ids, sales) of every book sold in `window`, cached until the counts change."""
+        self.counters.advance(current_hour())
+        cached = self._arrays.get(window)
+        if cached is None or cached[0] != self.counters.version:
+            totals = self.counters.totals[window]
+            book_ids = np.fromiter(totals.keys(), dtype=np.int64, count=len(totals))
+            counts = np.fromiter(totals.values(), dtype=np.float32, count=len(totals))
+            order = np.argsort(book_ids)
+            cached = self._arrays[window] = (self.counters.version, book_ids[order], counts[order])
+        return cached[1], cached[2]
+
+    async def flush(self, db: AsyncSession) -> None:
+        """
+        Add the sales recorded since the last flush to the database. Sales of books
+        that no longer exist are dropped; a failed batch is kept for the next flush,
+        which drops whatever book was deleted in between.
+        """
+        batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        # Sales of books deleted since would fail the whole batch on the foreign key, on every sync
+        book_ids = {book_id for book_id, _ in batch}
+        existing = set((await db.execute(select(Book.id).filter(Book.id.in_(book_ids)))).scalars())
+        if len(existing) < len(book_ids):
+            logger.info("Dropping unflushed sales of %s deleted books", len(book_ids - existing))
+            batch = {key: count for key, count in batch.items() if key[0] in existing}
+        totals: Dict[int, int] = {}
+        for (book_id, _), count in batch.items():
+            totals[book_id] = totals.get(book_id, 0) + count
+        insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        try:
+            rows = [{"book_id": book_id, "hour": hour, "count": count} for (book_id, hour), count in batch.items()]
+            for start in range(0, len(rows), 2000):
+                stmt = insert(BookSales).values(rows[start:start + 2000])
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=[BookSales.book_id, BookSales.hour], set_={"count": BookSales.count + stmt.excluded.count}
+                ))
+            rows = [{"book_id": book_id, "count": count} for book_id, count in totals.items()]
+            for start in range(0, len(rows), 2000):
+                stmt = insert(BookSalesTotal).values(rows[start:start + 2000])
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=[BookSalesTotal.book_id], set_={"count": BookSalesTotal.count + stmt.excluded.count}
+                ))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            for key, count in batch.items():
+                self.pending[key] = self.pending.get(key, 0) + count
+            raise
+        self.pending_genres = {book_id: self.pending_genres[book_id] for book_id, _ in self.pending}
+
+    async def _load(self, db: AsyncSession, hour: int) -> None:
+        """Rebuild the counters from the database (plus the sales still pending)."""
+        hours = (await db.execute(
+            select(BookSales.book_id, BookSales.hour, BookSales.count, Book.genre)
+            .join(Book, Book.id == BookSales.book_id)
+            .filter(BookSales.hour > hour - RING_HOURS)
+        )).all()
+        totals = (await db.execute(
+            select(BookSalesTotal.book_id, BookSalesTotal.count, Book.genre)
+            .join(Book, Book.id == BookSalesTotal.book_id)
+        )).all()
+
+        def build() -> SalesCounters:
+            counters = SalesCounters(self.counters.top_k, hour)
+            for book_id, count, genre in totals:
+                counters.add(book_id, genre_key(genre), hour - RING_HOURS, count)
+            for book_id, book_hour, count, genre in hours:
+                counters.add(book_id, genre_key(genre), book_hour, count, all_time=False)
+            return counters
+
+        counters = await asyncio.get_running_loop().run_in_executor(None, build)
+        # Sales recorded while the rows were read and the counters built
+        for (book_id, book_hour), count in self.pending.items():
+            counters.add(book_id, self.pending_genres.get(book_id, ""), book_hour, count)
+        self.counters = counters
+        self.loaded_hour = hour
+        self.ready.set()
+
+    async def _refresh_recent(self, db: AsyncSession, hour: int) -> None:
+        """Take the database's counts for the last two hours, which hold the other workers' new sales."""
+        rows = (await db.execute(
+            select(BookSales.book_id, BookSales.hour, BookSales.count, Book.genre)
+            .join(Book, Book.id == BookSales.book_id)
+            .filter(BookSales.hour >= hour - 1)
+        )).all()
+        by_hour: Dict[int, Dict[int, int]] = {hour - 1: {}, hour: {}}
+        genres: Dict[int, str] = {}
+        for book_id, book_hour, count, genre in rows:
+            by_hour.setdefault(book_hour, {})[book_id] = count
+            genres[book_id] = genre_key(genre)
+        for (book_id, book_hour), count in self.pending.items():
+            if book_hour in by_hour:
+                by_hour[book_hour][book_id] = by_hour[book_hour].get(book_id, 0) + count
+        for book_hour, counts in by_hour.items():
+            self.counters.set_hour(book_hour, counts, genres)
+
+    async def sync(self, db: AsyncSession) -> None:
+        """Write this worker's new sales and read everyone else's."""
+        await self.flush(db)
+        hour = current_hour()
+        if self.loaded_hour != hour:
+            if self.loaded_hour is not None:
+                await db.execute(delete(BookSales).filter(BookSales.hour <= hour - RING_HOURS))
+                await db.commit()
+            await self._load(db, hour)
+        else:
+            await self._refresh_recent(db, hour)
+
+    async def run(self, session_factory: async_sessionmaker, interval: float) -> None:
+        while True:
+            try:
+                async with session_factory() as db:
+                    await self.sync(db)
+            except Exception:
+                logger.exception("Sales counters sync failed")
+            await asyncio.sleep(interval)
+
+
+async def backfill_sales(engine: AsyncEngine, *, batch_size: int = 200_000) -> Dict[str, float]:
+    """Rebuild book_sales and book_sales_totals from completed purchases."""
+    started = time.perf_counter()
+    first_hour = current_hour() - RING_HOURS + 1
+    totals: Dict[int, int] = {}
+    hourly: Dict[Tuple[int, int], int] = {}
+    purchases = 0
+    query = select(Purchase.book_id, Purchase.purchase_date).filter(Purchase.status == PurchaseStatus.COMPLETED)
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions(batch_size):
+            for book_id, purchased_at in partition:
+                purchases += 1
+                totals[book_id] = totals.get(book_id, 0) + 1
+                if purchased_at is None:
+                    continue
+                if purchased_at.tzinfo is None:
+                    purchased_at = purchased_at.replace(tzinfo=timezone.utc)
+                hour = int(purchased_at.timestamp() // 3600)
+                if hour >= first_hour:
+                    hourly[(book_id, hour)] = hourly.get((book_id, hour), 0) + 1
+    counted = time.perf_counter()
+
+    async with engine.begin() as conn:
+        await conn.execute(BookSales.__table__.delete())
+        await conn.execute(BookSalesTotal.__table__.delete())
+        rows = [(book_id, hour, count) for (book_id, hour), count in hourly.items()]
+        for start in range(0, len(rows), batch_size):
+            await write_rows(conn, BookSales.__table__, ("book_id", "hour", "count"), rows[start:start + batch_size])
+        rows = list(totals.items())
+        for start in range(0, len(rows), batch_size):
+            await write_rows(conn, BookSalesTotal.__table__, ("book_id", "count"), rows[start:start + batch_size])
+    return {
+        "purchases": purchases,
+        "books": len(totals),
+        "hourly_rows": len(hourly),
+        "count_seconds": round(counted - started, 2),
+        "write_seconds": round(time.perf_counter() - counted, 2),
+    }
+
+
+sales_tracker = SalesTracker(settings.TRENDING_TOP_K)
@@ -0,0 +1,410 @@
+"""
+Synthetic data at production-like volumes (see `python -m app.cli seed --help`).
+
+Rows are generated with NumPy in chunks. Each chunk draws from its own random
+generator seeded with (seed, table, chunk index), so the output only depends on
+the seed and the requested volumes, not on how many workers produced it.
+Book popularity and user activity follow Zipf distributions: a few bestsellers
+and heavy buyers account for most purchases, ratings, comments and favorites.
+"""
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Table, func, select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.db.models import (
+    Book, BookCoPurchase, BookSales, BookSalesTotal, BookSimilarity, Comment, Purchase, Rating, User,
+    user_favorite_books_table,
+)
+
+SEED_PASSWORD = "seed-password"
+
+GENRES = np.array([
+    "Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Horror", "History",
+    "Biography", "Poetry", "Children", "Travel", "Cooking", "Science", "Philosophy", "Business",
+])
+LANGUAGES = np.array(["en", "en", "en", "en", "de", "fr", "es", "it", "pl", "uk"])
+WORDS = np.array([
+    "shadow", "river", "empire", "garden", "silent", "winter", "golden", "secret", "last", "city",
+    "night", "storm", "glass", "iron", "lost", "star", "house", "ocean", "memory", "fire",
+    "stone", "paper", "forest", "queen", "journey", "broken", "hidden", "north", "light", "song",
+])
+COMMENTS = np.array([
+    "Loved it, could not put it down.", "Slow start but worth it.", "Not my cup of tea.",
+    "A classic for a reason.", "The ending was a letdown.", "Beautifully written.",
+    "Great gift idea.", "Would read again.", "Too long for what it says.", "Recommended by a friend, not disappointed.",
+])
+# Purchase status mix: mostly completed orders, a little of everything else
+PURCHASE_STATUSES = np.array(["COMPLETED", "IN_CART", "PENDING", "FAILED", "CANCELLED"])
+PURCHASE_STATUS_P = np.array([0.92, 0.03, 0.01, 0.02, 0.02])
+
+# Stable per-table stream ids for the random generators
+_STREAMS = {"order": 0, "users": 1, "books": 2, "activity": 3, "purchases": 4, "ratings": 5, "comments": 6, "favorites": 7}
+
+
+def parse_count(value: str) -> int:
+    """Parse "20M", "200k", "1.5m" or "5000" into an int."""
+    value = value.strip().lower().replace("_", "")
+    multiplier = {"k": 1_000, "m": 1_000_000, "b": 1_000_000_000}.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+@dataclass(frozen=True)
+class SeedPlan:
+    books: int
+    users: int
+    purchases: int
+    ratings: int
+    comments: int
+    favorites: int
+    seed: int = 42
+    zipf_exponent: float = 1.1
+    chunk_size: int = 50_000
+    end_date: date = date(2025, 1, 1)  # purchases span the two years before this day
+
+    def rng(self, stream: str, chunk: int = 0) -> np.random.Generator:
+        return np.random.default_rng([self.seed, _STREAMS[stream], chunk])
+
+
+def zipf_cdf(n: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+@lru_cache(maxsize=2)
+def book_popularity(plan: SeedPlan) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (cdf, order): popularity rank r is book id order[r]. The order is shuffled
+    so that bestsellers are spread over the id range instead of being ids 1..k.
+    """
+    order = plan.rng("order").permutation(plan.books).astype(np.int64) + 1
+    return zipf_cdf(plan.books, plan.zipf_exponent), order
+
+
+def sample_books(plan: SeedPlan, rng: np.random.Generator, size: int) -> np.ndarray:
+    cdf, order = book_popularity(plan)
+    ranks = np.minimum(np.searchsorted(cdf, rng.random(size)), plan.books - 1)
+    return order[ranks]
+
+
+def user_activity(plan: SeedPlan, total: int, stream: str) -> np.ndarray:
+    """How many of `total` events each user produces (index 0 is user id 1)."""
+    rng = plan.rng("activity", _STREAMS[stream])
+    weights = 1.0 / np.arange(1, plan.users + 1, dtype=np.float64) ** plan.zipf_exponent
+    weights = rng.permutation(weights)
+    return rng.multinomial(total, weights / weights.sum())
+
+
+def book_cost(book_ids: np.ndarray) -> np.ndarray:
+    """Deterministic price per book id, so purchases can quote it without a lookup."""
+    return np.round(4.99 + (book_ids * 2654435761 % 4500) / 100.0, 2)
+
+
+def book_quality(book_ids: np.ndarray) -> np.ndarray:
+    """Hidden 1..5 "quality" that ratings of a book gather around."""
+    return 1.0 + 4.0 * ((book_ids * 0.6180339887) % 1.0)
+
+
+def _aware(timestamps: np.ndarray) -> List[datetime]:
+    return [ts.replace(tzinfo=timezone.utc) for ts in timestamps.astype("datetime64[us]").tolist()]
+
+
+def _event_times(plan: SeedPlan, rng: np.random.Generator, size: int) -> List[datetime]:
+    end = np.datetime64(plan.end_date, "s")
+    offsets = rng.integers(0, 730 * 86400, size=size)
+    return _aware(end - offsets.astype("timedelta64[s]"))
+
+
+# --- Row generators: (plan, chunk index, arguments) -> list of tuples ---
+
+def user_rows(plan: SeedPlan, chunk: int, start: int, stop: int, hashed_password: str) -> List[tuple]:
+    rng = plan.rng("users", chunk)
+    ids = np.arange(start, stop)
+    balances = np.round(rng.gamma(2.0, 50.0, size=ids.size), 2).tolist()
+    first = WORDS[rng.integers(0, WORDS.size, size=ids.size)]
+    last = WORDS[rng.integers(0, WORDS.size, size=ids.size)]
+    return [
+        (i, f"user{i}", f"user{i}@example.com", hashed_password, f"{a.title()} {b.title()}", bal, True, False, False)
+        for i, a, b, bal in zip(ids.tolist(), first.tolist(), last.tolist(), balances)
+    ]
+
+
+USER_COLUMNS = ("id", "username", "email", "hashed_password", "full_name", "balance", "is_active", "is_superuser", "is_book_manager")
+
+
+def book_rows(plan: SeedPlan, chunk: int, start: int, stop: int) -> List[tuple]:
+    rng = plan.rng("books", chunk)
+    ids = np.arange(start, stop, dtype=np.int64)
+    n = ids.size
+    title_words = WORDS[rng.integers(0, WORDS.size, size=(n, 3))]
+    genres = GENRES[rng.integers(0, GENRES.size, size=n)].tolist()
+    languages = LANGUAGES[rng.integers(0, LANGUAGES.size, size=n)].tolist()
+    pages = rng.integers(60, 1200, size=n).tolist()
+    counts = rng.poisson(12, size=n)
+    # Some titles are out of stock or announced but not yet shipping
+    state = rng.random(n)
+    counts[state < 0.05] = 0
+    status = np.where(counts == 0, "NOT_AVAILABLE", np.where(state > 0.98, "IN_PROGRESS", "AVAILABLE")).tolist()
+    published = (np.datetime64("1950-01-01") + rng.integers(0, 27000, size=n).astype("timedelta64[D]")).tolist()
+    costs = book_cost(ids).tolist()
+    # Prolific authors write many books: ids are Zipf-distributed over the author pool
+    authors = (rng.zipf(1.3, size=n) % max(plan.books // 8, 1) + 1).tolist()
+    return [
+        (
+            i, " ".join(words).title() + f" {i}", f"Author {author}", genre, page,
+            f"A {genre.lower()} book about the {words[0]} {words[1]}.", cost, language, count, state_, pub,
+        )
+        for i, words, genre, page, cost, language, count, state_, pub, author in zip(
+            ids.tolist(), title_words.tolist(), genres, pages, costs, languages, counts.tolist(), status, published, authors
+        )
+    ]
+
+
+BOOK_COLUMNS = (
+    "id", "title", "author", "genre", "pages", "description", "cost", "language",
+    "book_count", "availability_status", "publication_date",
+)
+
+
+def _user_ids(first_user: int, counts: np.ndarray) -> np.ndarray:
+    return np.repeat(np.arange(first_user, first_user + counts.size, dtype=np.int64), counts)
+
+
+def _unique_pairs(plan: SeedPlan, rng: np.random.Generator, users: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    One book per entry of `users` without repeating a (user, book) pair. Heavy users
+    keep drawing the same bestsellers, so duplicates are redrawn a few times, and
+    whatever is still missing then is topped up by `_top_up`. Fewer pairs only come
+    back when the users' books run out. Chunks cover disjoint user ranges, so
+    uniqueness within a chunk is enough.
+    """
+    stride = plan.books + 1
+    keys = np.unique(users * stride + sample_books(plan, rng, users.size))
+    for _ in range(8):
+        missing = users.size - keys.size
+        if missing <= 0:
+            break
+        extra_users = rng.choice(users, size=missing)
+        keys = np.unique(np.concatenate([keys, extra_users * stride + sample_books(plan, rng, missing)]))
+    if keys.size < users.size:
+        keys = _top_up(plan, users, keys)
+    return keys // stride, keys % stride
+
+
+def _top_up(plan: SeedPlan, users: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """
+    Add the pairs that random draws did not find: users short of their own count
+    first, then any user with books left, each taking the most popular books it
+    is not paired with yet.
+    """
+    stride = plan.books + 1
+    _, order = book_popularity(plan)
+    ids, counts = np.unique(users, return_counts=True)
+    paired = keys // stride
+    short = counts - (np.searchsorted(paired, ids, side="right") - np.searchsorted(paired, ids, side="left"))
+    queue = [(int(ids[i]), int(short[i])) for i in np.argsort(-short, kind="stable") if short[i] > 0]
+    queue += [(int(user), plan.books) for user in ids]
+    missing = users.size - keys.size
+    added: Dict[int, List[np.ndarray]] = {}
+    for user, wanted in queue:
+        if missing <= 0:
+            break
+        taken = np.concatenate([keys[paired == user] % stride, *added.get(user, [])])
+        books = order[~np.isin(order, taken)][:min(wanted, missing)]
+        added.setdefault(user, []).append(books)
+        missing -= books.size
+    return np.unique(np.concatenate([keys, *(user * stride + books for user, parts in added.items() for books in parts)]))
+
+
+def purchase_rows(plan: SeedPlan, chunk: int, first_user: int, counts: np.ndarray) -> List[tuple]:
+    rng = plan.rng("purchases", chunk)
+    users = _user_ids(first_user, counts)
+    books = sample_books(plan, rng, users.size)
+    statuses = PURCHASE_STATUSES[rng.choice(PURCHASE_STATUSES.size, size=users.size, p=PURCHASE_STATUS_P)].tolist()
+    return list(zip(users.tolist(), books.tolist(), _event_times(plan, rng, users.size), statuses, book_cost(books).tolist()))
+
+
+PURCHASE_COLUMNS = ("user_id", "book_id", "purchase_date", "status", "cost_at_purchase")
+
+
+def rating_rows(plan: SeedPlan, chunk: int, first_user: int, counts: np.ndarray) -> List[tuple]:
+    rng = plan.rng("ratings", chunk)
+    users, books = _unique_pairs(plan, rng, _user_ids(first_user, counts))
+    scores = np.clip(np.rint(book_quality(books) + rng.normal(0, 0.8, size=books.size)), 1, 5).astype(int)
+    return list(zip(scores.tolist(), _event_times(plan, rng, books.size), users.tolist(), books.tolist()))
+
+
+RATING_COLUMNS = ("score", "created_at", "user_id", "book_id")
+
+
+def comment_rows(plan: SeedPlan, chunk: int, first_user: int, counts: np.ndarray) -> List[tuple]:
+    rng = plan.rng("comments", chunk)
+    users = _user_ids(first_user, counts)
+    books = sample_books(plan, rng, users.size)
+    texts = COMMENTS[rng.integers(0, COMMENTS.size, size=users.size)].tolist()
+    return list(zip(texts, _event_times(plan, rng, users.size), users.tolist(), books.tolist()))
+
+
+COMMENT_COLUMNS = ("text", "created_at", "user_id", "book_id")
+
+
+def favorite_rows(plan: SeedPlan, chunk: int, first_user: int, counts: np.ndarray) -> List[tuple]:
+    rng = plan.rng("favorites", chunk)
+    users, books = _unique_pairs(plan, rng, _user_ids(first_user, counts))
+    return list(zip(users.tolist(), books.tolist()))
+
+
+FAVORITE_COLUMNS = ("user_id", "book_id")
+
+
+def split_by_activity(counts: np.ndarray, chunk_size: int) -> List[Tuple[int, int]]:
+    """Split users into ranges [start, stop) (0-based) of roughly `chunk_size` events each."""
+    cumulative = np.cumsum(counts)
+    total = int(cumulative[-1]) if cumulative.size else 0
+    bounds = np.searchsorted(cumulative, np.arange(chunk_size, total, chunk_size), side="left") + 1
+    edges = [0] + sorted(set(bounds.tolist())) + [counts.size]
+    return [(a, b) for a, b in zip(edges, edges[1:]) if b > a]
+
+
+# --- Writing ---
+
+async def write_rows(engine: AsyncEngine, table: Table, columns: Sequence[str], rows: List[tuple]) -> None:
+    """COPY on asyncpg, executemany INSERT elsewhere."""
+    if not rows:
+        return
+    async with engine.connect() as conn:
+        if engine.dialect.driver == "asyncpg":
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(table.name, records=rows, columns=list(columns))
+        else:
+            await conn.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+            await conn.commit()
+
+
+async def _ensure_empty(engine: AsyncEngine, truncate: bool) -> None:
+    # Children first: SQLite deletes them one by one
+    tables = [
+        user_favorite_books_table, Comment.__table__, Rating.__table__, Purchase.__table__,
+        BookSales.__table__, BookSalesTotal.__table__, BookCoPurchase.__table__, BookSimilarity.__table__,
+        Book.__table__, User.__table__,
+    ]
+    async with engine.begin() as conn:
+        if truncate:
+            if engine.dialect.name == "postgresql":
+                names = ", ".join(t.name for t in tables)
+                await conn.execute(text(f"TRUNCATE {names} RESTART IDENTITY CASCADE"))
+            else:
+                for table in tables:
+                    await conn.execute(table.delete())
+            return
+        for table in (User.__table__, Book.__table__):
+            if (await conn.execute(select(func.count()).select_from(table))).scalar_one():
+                raise RuntimeError(f"Table {table.name} is not empty; pass --truncate to replace its data.")
+
+
+async def _backfill_book_ratings(engine: AsyncEngine) -> Dict[str, float]:
+    # Ratings are inserted directly, so the columns add_or_update_rating maintains are filled here
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        result = await conn.execute(text(
+            "UPDATE books SET average_rating = totals.average, rating_count = totals.count"
+            " FROM (SELECT book_id, avg(score) AS average, count(*) AS count FROM ratings GROUP BY book_id) AS totals"
+            " WHERE books.id = totals.book_id"
+        ))
+    return {"rows": result.rowcount, "seconds": round(time.perf_counter() - started, 2)}
+
+
+async def _reset_sequences(engine: AsyncEngine) -> None:
+    # Users and books are written with explicit ids, which does not advance their sequences
+    if engine.dialect.name != "postgresql":
+        return
+    async with engine.begin() as conn:
+        for table in ("users", "books", "purchases", "ratings", "comments"):
+            await conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+            ))
+
+
+async def seed_database(
+    engine: AsyncEngine,
+    plan: SeedPlan,
+    *,
+    workers: int = 4,
+    truncate: bool = False,
+    hashed_password: Optional[str] = None,
+    progress: Callable[[str], None] = lambda message: None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Fill the tables according to `plan`. Chunks are generated in a process pool
+    and written over up to `workers` connections at once (one for SQLite, which
+    has a single writer). Returns rows written and seconds spent per table, the
+    shortfall of tables that could not reach their count, and the time spent
+    filling books.average_rating and rating_count from the ratings.
+    """
+    if hashed_password is None:
+        from app.core.security import get_password_hash
+        hashed_password = get_password_hash(SEED_PASSWORD)
+
+    await _ensure_empty(engine, truncate)
+    writers = asyncio.Semaphore(1 if engine.dialect.name == "sqlite" else workers)
+    in_flight = asyncio.Semaphore(workers * 2)  # bounds memory held by generated chunks
+    loop = asyncio.get_running_loop()
+    stats: Dict[str, Dict[str, float]] = {}
+
+    async def run_chunk(pool, name: str, table: Table, columns, generate, *args) -> None:
+        async with in_flight:
+            rows = await loop.run_in_executor(pool, generate, plan, *args)
+            async with writers:
+                await write_rows(engine, table, columns, rows)
+            stats[name]["rows"] += len(rows)
+
+    async def run_table(pool, name: str, table: Table, columns, generate, chunk_args: List[tuple], total: int) -> None:
+        stats[name] = {"rows": 0, "seconds": 0.0}
+        started = time.perf_counter()
+        await asyncio.gather(*(run_chunk(pool, name, table, columns, generate, i, *a) for i, a in enumerate(chunk_args)))
+        stats[name]["seconds"] = round(time.perf_counter() - started, 2)
+        progress(f"{name}: {stats[name]['rows']} rows in {stats[name]['seconds']}s")
+        # Unique (user, book) tables run short when the users asked for more books than exist
+        if stats[name]["rows"] < total:
+            stats[name]["shortfall"] = total - stats[name]["rows"]
+            progress(f"{name}: {stats[name]['shortfall']} rows short of {total}")
+
+    def ranges(total: int) -> List[Tuple[int, int]]:
+        return [(start, min(start + plan.chunk_size, total + 1)) for start in range(1, total + 1, plan.chunk_size)]
+
+    def activity_chunks(total: int, stream: str) -> List[tuple]:
+        counts = user_activity(plan, total, stream)
+        return [(start + 1, counts[start:stop]) for start, stop in split_by_activity(counts, plan.chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Parents first: the event tables reference users and books
+        await asyncio.gather(
+            run_table(pool, "users", User.__table__, USER_COLUMNS, user_rows,
+                      [(a, b, hashed_password) for a, b in ranges(plan.users)], plan.users),
+            run_table(pool, "books", Book.__table__, BOOK_COLUMNS, book_rows, ranges(plan.books), plan.books),
+        )
+        for name, table, columns, generate, total in (
+            ("purchases", Purchase.__table__, PURCHASE_COLUMNS, purchase_rows, plan.purchases),
+            ("ratings", Rating.__table__, RATING_COLUMNS, rating_rows, plan.ratings),
+            ("comments", Comment.__table__, COMMENT_COLUMNS, comment_rows, plan.comments),
+            ("favorites", user_favorite_books_table, FAVORITE_COLUMNS, favorite_rows, plan.favorites),
+        ):
+            await run_table(pool, name, table, columns, generate, activity_chunks(total, name), total)
+
+    stats["book_ratings"] = await _backfill_book_ratings(engine)
+    progress(f"book_ratings: {stats['book_ratings']['rows']} books in {stats['book_ratings']['seconds']}s")
+    await _reset_sequences(engine)
+    if engine.dialect.name == "postgresql":
+        async with engine.begin() as conn:
+            await conn.execute(text("ANALYZE"))
+    return stats
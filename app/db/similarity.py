@@ -0,0 +1,226 @@
+"""
+Content-based "similar books" (see `python -m app.cli similar-books`).
+
+Every book becomes a sparse TF-IDF vector over hashed terms (crc32 into
+N_FEATURES buckets, so no vocabulary has to be stored or shared): title words
+and word bigrams, the author's full name, the genre and description words,
+each weighted by its field. Vectors are L2-normalized, so a dot product is
+the cosine similarity.
+
+The batch job publishes the index (idf and an inverted index of postings) to
+MODEL_DIR/similar.json (see app.db.artifacts) and writes the top_k
+neighbours of every book to book_similarities. Scores for a block of books
+are accumulated from the postings into one dense (block, books) matrix with
+np.bincount. Terms shared by more than MAX_POSTINGS books are skipped: they
+are too common to tell books apart and would dominate the cost.
+
+A book created or edited through the API is scored against the published
+index and its rows (and the reverse rows of its new neighbours) are
+rewritten in place (crud.recommendation.refresh_similar); books created
+since the last rebuild are only found as neighbours of each other after it.
+"""
+import re
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.db.artifacts import ArtifactStore, load_arrays, publish
+from app.db.cooccurrence import write_rows
+from app.db.models import Book, BookSimilarity
+
+N_FEATURES = 1 << 20
+FIELD_WEIGHTS = {"title": 2.0, "author": 3.0, "genre": 1.5, "description": 1.0}
+TEXT_FIELDS = frozenset(FIELD_WEIGHTS)
+MAX_POSTINGS = 20_000
+# Size of the dense score matrix of one block, in float64 cells
+BLOCK_CELLS = 1 << 24
+
+_WORD = re.compile(r"[^\W_]{2,}")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def _words(text: Optional[str]) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS] if text else []
+
+
+def book_terms(title: Optional[str], author: Optional[str], genre: Optional[str],
+               description: Optional[str]) -> Dict[int, float]:
+    """Hashed term -> field-weighted count for one book."""
+    terms: Dict[int, float] = {}
+
+    def add(term: str, weight: float) -> None:
+        feature = zlib.crc32(term.encode()) & (N_FEATURES - 1)
+        terms[feature] = terms.get(feature, 0.0) + weight
+
+    title_words = _words(title)
+    for word in title_words:
+        add("w:" + word, FIELD_WEIGHTS["title"])
+    for first, second in zip(title_words, title_words[1:]):
+        add(f"b:{first} {second}", FIELD_WEIGHTS["title"])
+    if author and author.strip():
+        add("a:" + " ".join(_WORD.findall(author.lower())), FIELD_WEIGHTS["author"])
+    if genre and genre.strip():
+        add("g:" + genre.strip().lower(), FIELD_WEIGHTS["genre"])
+    for word in _words(description):
+        add("w:" + word, FIELD_WEIGHTS["description"])
+    return terms
+
+
+def _weigh(ptr: np.ndarray, features: np.ndarray, counts: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    """Sublinear tf times idf, L2-normalized per document."""
+    weights = (np.log1p(counts) * idf[features]).astype(np.float32)
+    norms = np.zeros(ptr.size - 1, dtype=np.float32)
+    sizes = np.diff(ptr)
+    if weights.size:
+        norms[sizes > 0] = np.sqrt(np.add.reduceat(weights ** 2, ptr[:-1][sizes > 0]))
+    return weights / np.repeat(np.maximum(norms, 1e-12), sizes)
+
+
+def build_index(book_ids: np.ndarray, ptr: np.ndarray, features: np.ndarray,
+                counts: np.ndarray) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """The published index arrays and the weights of the documents' own terms."""
+    n_docs = book_ids.size
+    df = np.bincount(features, minlength=N_FEATURES)
+    idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+    weights = _weigh(ptr, features, counts, idf)
+    docs = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(ptr))
+    order = np.argsort(features, kind="stable")
+    index = {
+        "book_ids": book_ids.astype(np.int64),
+        "idf": idf,
+        "postings_ptr": np.r_[0, np.cumsum(df)].astype(np.int64),
+        "postings_doc": docs[order],
+        "postings_weight": weights[order],
+    }
+    return index, weights
+
+
+def block_scores(ptr: np.ndarray, features: np.ndarray, weights: np.ndarray, index: Dict[str, np.ndarray]) -> np.ndarray:
+    """Cosine similarity of each of the ptr.size - 1 query vectors with every indexed book."""
+    n_docs = index["book_ids"].size
+    postings_ptr = index["postings_ptr"]
+    query = np.repeat(np.arange(ptr.size - 1), np.diff(ptr))
+    starts = postings_ptr[features]
+    lengths = postings_ptr[features + 1] - starts
+    keep = (lengths > 0) & (lengths <= MAX_POSTINGS)
+    query, starts, weights, lengths = query[keep], starts[keep], weights[keep], lengths[keep]
+    # Ragged arange: one entry per (query term, posting) pair
+    entry = np.repeat(np.arange(lengths.size), lengths)
+    positions = starts[entry] + np.arange(entry.size) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cells = query[entry] * n_docs + index["postings_doc"][positions]
+    products = weights[entry] * index["postings_weight"][positions]
+    return np.bincount(cells, weights=products, minlength=(ptr.size - 1) * n_docs).reshape(-1, n_docs)
+
+
+def top_neighbours(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column positions and scores of the k best (positive) scores of every row, best first."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(k), scores.shape).copy()
+    values = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+class SimilarityIndex:
+    """A published index memory-mapped from disk, for scoring books one at a time."""
+
+    def __init__(self, path: str, meta: Dict):
+        self.version = meta["version"]
+        self.arrays = load_arrays(path, "book_ids", "idf", "postings_ptr", "postings_doc", "postings_weight")
+        self.book_ids = self.arrays["book_ids"]
+
+    def neighbours(self, terms: Dict[int, float], book_id: int, k: int) -> Tuple[List[int], List[float]]:
+        """The k indexed books most similar to a book with `terms` (never `book_id` itself)."""
+        if not terms or not self.book_ids.size:
+            return [], []
+        features = np.fromiter(terms.keys(), dtype=np.int64, count=len(terms))
+        counts = np.fromiter(terms.values(), dtype=np.float32, count=len(terms))
+        ptr = np.array([0, features.size])
+        scores = block_scores(ptr, features, _weigh(ptr, features, counts, self.arrays["idf"]), self.arrays)
+        position = np.searchsorted(self.book_ids, book_id)
+        if position < self.book_ids.size and self.book_ids[position] == book_id:
+            scores[0, position] = 0
+        top, values = top_neighbours(scores, k)
+        found = values[0] > 0
+        return self.book_ids[top[0][found]].tolist(), values[0][found].tolist()
+
+
+async def _load_terms(engine: AsyncEngine, batch_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(book_ids, ptr, features, counts) of every book, in id order."""
+    book_ids: List[int] = []
+    sizes: List[int] = []
+    features: List[int] = []
+    counts: List[float] = []
+    query = select(Book.id, Book.title, Book.author, Book.genre, Book.description).order_by(Book.id)
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions(batch_size):
+            for book_id, title, author, genre, description in partition:
+                terms = book_terms(title, author, genre, description)
+                book_ids.append(book_id)
+                sizes.append(len(terms))
+                features.extend(terms.keys())
+                counts.extend(terms.values())
+    return (
+        np.array(book_ids, dtype=np.int64),
+        np.r_[0, np.cumsum(sizes, dtype=np.int64)],
+        np.array(features, dtype=np.int64),
+        np.array(counts, dtype=np.float32),
+    )
+
+
+def _neighbour_rows(index: Dict[str, np.ndarray], ptr: np.ndarray, features: np.ndarray,
+                    weights: np.ndarray, top_k: int) -> Iterable[List[Tuple[int, int, float]]]:
+    book_ids = index["book_ids"]
+    block = max(1, BLOCK_CELLS // max(book_ids.size, 1))
+    for first in range(0, book_ids.size, block):
+        last = min(first + block, book_ids.size)
+        lo, hi = ptr[first], ptr[last]
+        scores = block_scores(ptr[first:last + 1] - lo, features[lo:hi], weights[lo:hi], index)
+        scores[np.arange(last - first), np.arange(first, last)] = 0
+        top, values = top_neighbours(scores, top_k)
+        rows, cols = np.nonzero(values > 0)
+        yield list(zip(
+            book_ids[first + rows].tolist(), book_ids[top[rows, cols]].tolist(), values[rows, cols].tolist()
+        ))
+
+
+async def rebuild_similar_books(
+    engine: AsyncEngine, directory: str, *, top_k: int, batch_size: int = 50_000
+) -> Dict[str, float]:
+    """Rebuild and publish the index, then recompute book_similarities. Returns counts and timings."""
+    started = time.perf_counter()
+    book_ids, ptr, features, counts = await _load_terms(engine, batch_size)
+    index, weights = build_index(book_ids, ptr, features, counts)
+    version = publish(directory, "similar", index, {"books": int(book_ids.size)})
+    indexed = time.perf_counter()
+
+    table = BookSimilarity.__table__
+    written = 0
+    # One transaction, so readers never see a half-written table
+    async with engine.begin() as conn:
+        await conn.execute(table.delete())
+        for rows in _neighbour_rows(index, ptr, features, weights, top_k):
+            await write_rows(conn, table, ("book_id", "other_book_id", "score"), rows)
+            written += len(rows)
+    return {
+        "version": version,
+        "books": int(book_ids.size),
+        "terms": int(features.size),
+        "rows_written": written,
+        "index_seconds": round(indexed - started, 2),
+        "neighbour_seconds": round(time.perf_counter() - indexed, 2),
+    }
+
+
+similarity_store: ArtifactStore[SimilarityIndex] = ArtifactStore(settings.MODEL_DIR, "similar", SimilarityIndex)
@@ -0,0 +1,326 @@
+"""
+Typeahead suggestions over titles and authors (GET /books/suggest).
+
+Titles and author names are normalized (accents stripped, case folded,
+punctuation collapsed to single spaces) and indexed as fixed-width byte keys
+in one sorted NumPy array: a book's full title plus the title from each of
+its next few words, so "potter" finds "Harry Potter", and an author's full
+name plus the name from each later word, so "tolkien" finds "J. R. R.
+Tolkien". A prefix is two binary searches (np.searchsorted) and the matches
+are ranked by popularity (all-time sales). Keys are cut to SUGGEST_KEY_BYTES;
+longer prefixes are checked against the full text. Display strings live in
+one UTF-8 blob with offsets, so the index costs a few dozen bytes per key and
+SUGGEST_MAX_MEMORY_MB caps it (least popular keys are left out first).
+
+The index is built from `books` at startup and rebuilt every
+SUGGEST_REFRESH_SECONDS. Catalog writes in between are applied to a small
+sorted overlay (added keys) and a set of removed books, so a new or renamed
+book can be suggested by the worker that saved it right away.
+"""
+import asyncio
+import bisect
+import logging
+import re
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import record_cache
+from app.db.models import Book
+from app.db.sales import ALL_TIME, sales_tracker
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r"[\W_]+")
+_STOPWORDS = frozenset("a an and at by for in of on or the to".split())
+# Ranges with more matches than this have their top results cached per prefix
+CACHE_MIN_RANGE = 2048
+CACHE_MAX_PREFIXES = 10_000
+
+
+def normalize(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_NON_WORD.sub(" ", stripped.casefold()).split())
+
+
+def _word_starts(normalized: str, max_starts: int, skip_stopwords: bool) -> List[str]:
+    """The text from each of its first `max_starts` words on (always including the full text)."""
+    words = normalized.split(" ")
+    keys = [normalized] if normalized else []
+    for position in range(1, min(len(words), max_starts + 1)):
+        if skip_stopwords and words[position] in _STOPWORDS:
+            continue
+        keys.append(" ".join(words[position:]))
+    return keys
+
+
+def _blob(texts: List[str]) -> Tuple[bytes, np.ndarray]:
+    encoded = [text.encode() for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return b"".join(encoded), offsets
+
+
+class _Base:
+    """The immutable part of the index, built in one go."""
+
+    def __init__(self, rows: List[tuple], popularity: Tuple[np.ndarray, np.ndarray],
+                 key_bytes: int, max_bytes: int, max_starts: int):
+        self.key_bytes = key_bytes
+        self.book_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        weights = np.zeros(self.book_ids.size, dtype=np.float32)
+        sold_ids, sold = popularity
+        if sold_ids.size and self.book_ids.size:
+            positions = np.minimum(np.searchsorted(self.book_ids, sold_ids), self.book_ids.size - 1)
+            found = self.book_ids[positions] == sold_ids
+            weights[positions[found]] = sold[found]
+        self.book_weights = weights
+
+        author_positions: Dict[str, int] = {}
+        author_names: List[str] = []
+        author_weights: List[float] = []
+        keys: List[bytes] = []
+        owners: List[int] = []
+        primary: List[bool] = []
+        for position, (_, title, author) in enumerate(rows):
+            for number, key in enumerate(_word_starts(normalize(title), max_starts, True)):
+                keys.append(key.encode())
+                owners.append(position)
+                primary.append(number == 0)
+            if author:
+                author_position = author_positions.get(author)
+                if author_position is None:
+                    author_position = author_positions[author] = len(author_names)
+                    author_names.append(author)
+                    author_weights.append(0.0)
+                    for number, key in enumerate(_word_starts(normalize(author), max_starts, False)):
+                        keys.append(key.encode())
+                        # Authors are owners -1, -2, ...
+                        owners.append(-author_position - 1)
+                        primary.append(number == 0)
+                author_weights[author_position] += float(weights[position])
+        self.author_index = author_positions
+        self.author_weights = np.array(author_weights, dtype=np.float32)
+        self.titles, self.title_offsets = _blob([row[1] or "" for row in rows])
+        self.authors, self.author_offsets = _blob(author_names)
+
+        owner_array = np.array(owners, dtype=np.int32)
+        entry_weights = np.where(
+            owner_array >= 0,
+            self.book_weights[np.maximum(owner_array, 0)],
+            self.author_weights[np.maximum(-owner_array - 1, 0)] if self.author_weights.size else 0,
+        ).astype(np.float32)
+        # Stay within the memory budget: primary keys before word-start keys, popular first
+        fixed = len(self.titles) + len(self.authors) + self.title_offsets.nbytes + self.author_offsets.nbytes
+        fixed += self.book_ids.nbytes + self.book_weights.nbytes + self.author_weights.nbytes
+        capacity = max((max_bytes - fixed) // (key_bytes + 8), 0)
+        self.dropped = max(len(keys) - capacity, 0)
+        keep = np.arange(len(keys))
+        if self.dropped:
+            keep = np.lexsort((-entry_weights, ~np.array(primary)))[:capacity]
+        key_array = np.array([keys[i] for i in keep], dtype=f"S{key_bytes}")
+        order = np.argsort(key_array, kind="stable")
+        self.keys = key_array[order]
+        self.owners = owner_array[keep][order]
+        self.weights = entry_weights[keep][order]
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.keys.nbytes + self.owners.nbytes + self.weights.nbytes + len(self.titles) + len(self.authors)
+            + self.title_offsets.nbytes + self.author_offsets.nbytes + self.book_ids.nbytes
+            + self.book_weights.nbytes + self.author_weights.nbytes
+        )
+
+    def book_position(self, book_id: int) -> Optional[int]:
+        position = int(np.searchsorted(self.book_ids, book_id))
+        if position < self.book_ids.size and self.book_ids[position] == book_id:
+            return position
+        return None
+
+    def item(self, owner: int) -> Dict[str, Any]:
+        if owner >= 0:
+            start, end = self.title_offsets[owner], self.title_offsets[owner + 1]
+            return {"text": self.titles[start:end].decode(), "kind": "title", "book_id": int(self.book_ids[owner])}
+        start, end = self.author_offsets[-owner - 1], self.author_offsets[-owner]
+        return {"text": self.authors[start:end].decode(), "kind": "author", "book_id": None}
+
+    def range(self, key: bytes) -> Tuple[int, int]:
+        """Positions of the keys starting with `key` (already cut to key_bytes)."""
+        lo = int(np.searchsorted(self.keys, key, side="left"))
+        if len(key) == self.key_bytes:
+            # key + b"\xff" would be cut back to key by the array's dtype
+            return lo, int(np.searchsorted(self.keys, key, side="right"))
+        # UTF-8 never contains 0xff, so this sorts after every key with the prefix
+        return lo, int(np.searchsorted(self.keys, key + b"\xff", side="left"))
+
+
+class SuggestIndex:
+    def __init__(self, key_bytes: int, max_bytes: int, max_starts: int = 3):
+        self.key_bytes = key_bytes
+        self.max_bytes = max_bytes
+        self.max_starts = max_starts
+        self.base: Optional[_Base] = None
+        self.built_at: Optional[float] = None
+        # Catalog writes since the last build: added keys (sorted) and removed base books
+        self._added_keys: List[bytes] = []
+        self._added: List[Tuple[float, Dict[str, Any]]] = []
+        self._removed: Set[int] = set()
+        self._added_authors: Set[str] = set()
+        # Writes made while a rebuild reads the catalog, replayed on the new index
+        self._replay: Optional[List[Tuple[str, tuple]]] = None
+        self._cache: Dict[str, Tuple[int, List[Dict[str, Any]]]] = {}
+        self.version = 0
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Up to `limit` titles and authors starting (at a word) with `prefix`, most popular first."""
+        normalized = normalize(prefix)
+        base = self.base
+        if not normalized or base is None:
+            return []
+        cached = self._cache.get(normalized)
+        if cached is not None and cached[0] == self.version and len(cached[1]) >= limit:
+            record_cache("suggest", True)
+            return cached[1][:limit]
+
+        encoded = normalized.encode()
+        key = encoded[: self.key_bytes]
+        lo, hi = base.range(key)
+        # A few spare candidates for removed books and duplicates of one book
+        wanted = limit * 2 + 4
+        if hi - lo > wanted:
+            weights = base.weights[lo:hi]
+            top = np.argpartition(-weights, wanted - 1)[:wanted]
+            positions = lo + top[np.argsort(-weights[top], kind="stable")]
+        else:
+            positions = lo + np.argsort(-base.weights[lo:hi], kind="stable")
+
+        candidates: List[Tuple[float, Dict[str, Any]]] = []
+        for position in positions.tolist():
+            owner = int(base.owners[position])
+            if owner >= 0 and int(base.book_ids[owner]) in self._removed:
+                continue
+            item = base.item(owner)
+            if len(encoded) > self.key_bytes and (" " + normalized) not in (" " + normalize(item["text"])):
+                continue
+            candidates.append((float(base.weights[position]), item))
+        start = bisect.bisect_left(self._added_keys, encoded)
+        end = bisect.bisect_left(self._added_keys, encoded + b"\xff")
+        candidates.extend(self._added[start:end])
+
+        candidates.sort(key=lambda candidate: -candidate[0])
+        seen = set()
+        results = []
+        for _, item in candidates:
+            identity = (item["kind"], item["book_id"] if item["kind"] == "title" else item["text"])
+            if identity in seen:
+                continue
+            seen.add(identity)
+            results.append(item)
+            if len(results) == limit:
+                break
+        if hi - lo > CACHE_MIN_RANGE:
+            record_cache("suggest", False)
+            if len(self._cache) >= CACHE_MAX_PREFIXES:
+                self._cache.clear()
+            self._cache[normalized] = (self.version, results)
+        return results
+
+    def upsert(self, book_id: int, title: str, author: str) -> None:
+        """Make a new or edited book suggestible in this worker."""
+        if self._replay is not None:
+            self._replay.append(("upsert", (book_id, title, author)))
+        self._remove(book_id)
+        base = self.base
+        position = base.book_position(book_id) if base is not None else None
+        weight = float(base.book_weights[position]) if position is not None else 0.0
+        item = {"text": title, "kind": "title", "book_id": book_id}
+        for key in _word_starts(normalize(title), self.max_starts, True):
+            self._add(key.encode(), weight, item)
+        if author and author not in self._added_authors and (base is None or author not in base.author_index):
+            self._added_authors.add(author)
+            author_item = {"text": author, "kind": "author", "book_id": None}
+            for key in _word_starts(normalize(author), self.max_starts, False):
+                self._add(key.encode(), 0.0, author_item)
+        self.version += 1
+
+    def remove(self, book_id: int) -> None:
+        """Stop suggesting a deleted book in this worker."""
+        if self._replay is not None:
+            self._replay.append(("remove", (book_id,)))
+        self._remove(book_id)
+        self.version += 1
+
+    def _remove(self, book_id: int) -> None:
+        self._removed.add(book_id)
+        keep = [i for i, (_, item) in enumerate(self._added) if item["book_id"] != book_id]
+        if len(keep) != len(self._added):
+            self._added_keys = [self._added_keys[i] for i in keep]
+            self._added = [self._added[i] for i in keep]
+
+    def _add(self, key: bytes, weight: float, item: Dict[str, Any]) -> None:
+        position = bisect.bisect_right(self._added_keys, key)
+        self._added_keys.insert(position, key)
+        self._added.insert(position, (weight, item))
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        started = time.perf_counter()
+        self._replay = []
+        try:
+            rows = (await db.execute(select(Book.id, Book.title, Book.author).order_by(Book.id))).all()
+            popularity = sales_tracker.arrays(ALL_TIME)
+            base = await asyncio.get_running_loop().run_in_executor(
+                None, _Base, rows, popularity, self.key_bytes, self.max_bytes, self.max_starts
+            )
+            replay = self._replay
+        finally:
+            self._replay = None
+        self.base = base
+        self.built_at = time.time()
+        self._added_keys, self._added, self._removed, self._added_authors = [], [], set(), set()
+        self.version += 1
+        for operation, args in replay:
+            getattr(self, operation)(*args)
+        if base.dropped:
+            logger.warning("Suggest index over its memory budget: %s keys left out", base.dropped)
+        logger.info(
+            "Suggest index built: %s keys, %.1f MB in %.2fs", base.keys.size, base.nbytes / 2 ** 20,
+            time.perf_counter() - started,
+        )
+
+    async def run(self, session_factory: async_sessionmaker, interval: float) -> None:
+        # Popularity comes from the sales counters; give them a moment to load first
+        try:
+            await asyncio.wait_for(sales_tracker.ready.wait(), timeout=30)
+        except asyncio.TimeoutError:
+            logger.warning("Building the suggest index before sales counts were loaded")
+        while True:
+            try:
+                async with session_factory() as db:
+                    await self.rebuild(db)
+            except Exception:
+                logger.exception("Suggest index build failed")
+            await asyncio.sleep(interval)
+
+    def status(self) -> Dict[str, Any]:
+        base = self.base
+        return {
+            "built_at": self.built_at,
+            "keys": int(base.keys.size) if base else 0,
+            "dropped_keys": base.dropped if base else 0,
+            "bytes": base.nbytes if base else 0,
+            "max_bytes": self.max_bytes,
+            "added_keys": len(self._added_keys),
+            "removed_books": len(self._removed),
+        }
+
+
+suggest_index = SuggestIndex(settings.SUGGEST_KEY_BYTES, settings.SUGGEST_MAX_MEMORY_MB * 2 ** 20)
@@ -1,10 +1,24 @@
+from app.core.startup import boot_timer, bootstrap_schema, FirstRequestTimer, LazyAdmin
+
 import asyncio
+import logging
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 
-from app.db.base import engine, Base
-from app.api.routers import auth, books, purchases, users
+from app.core import logs, loopmonitor, memprofile, metrics, profiling, tracing
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal, engine
+from app.db import querystats, sales, suggest
+from app.api.routers import auth, books, metrics as metrics_router, ops, purchases, users
+
+boot_timer.mark("import")
+logs.configure_logging(
+    settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_QUEUE_SIZE,
+    settings.LOG_SAMPLING, settings.LOG_REQUEST_BUDGET,
+)
+logger = logging.getLogger(__name__)
 
 # Create the main FastAPI application instance
 app = FastAPI(
@@ -24,22 +38,86 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(FirstRequestTimer)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(
+        profiling.ProfilingMiddleware,
+        sampler=profiling.sampler,
+        store=profiling.profile_store,
+        sample_rate=settings.PROFILE_SAMPLE_RATE,
+        sample_paths=tuple(p for p in settings.PROFILE_SAMPLE_PATHS.split(",") if p),
+    )
+if settings.TRACING_ENABLED:
+    app.add_middleware(tracing.TracingMiddleware, sample_rate=settings.TRACE_SAMPLE_RATE)
+    tracing.instrument_engine(engine)
+    tracing.exporter.configure(settings.TRACE_EXPORTER, settings.TRACE_QUEUE_SIZE)
+if settings.QUERY_STATS_ENABLED:
+    querystats.instrument_engine(engine)
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(engine)
+# Outermost, so that every log record of the request carries its id
+app.add_middleware(logs.RequestContextMiddleware)
 
 # Startup event to initialize the database and the SQLAdmin panel
 @app.on_event("startup")
 async def startup():
-    # Create database tables if they do not exist
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    # Initialize the SQLAdmin panel
-    from app.api.routers.sqladmin import init_admin
-    init_admin(app)
+    # create_all in development, Alembic head check in production (see SCHEMA_BOOTSTRAP)
+    await bootstrap_schema(engine, settings.SCHEMA_BOOTSTRAP)
+    boot_timer.mark("engine")
+    # Initialize the SQLAdmin panel (lazy/off modes are handled at import time below)
+    if settings.ADMIN_MOUNT == "eager":
+        from app.api.routers.sqladmin import init_admin
+        init_admin(app)
+        boot_timer.mark("admin")
+    if settings.METRICS_ENABLED and settings.METRICS_DIR:
+        app.state.metrics_flusher = asyncio.create_task(
+            metrics.flush_periodically(settings.METRICS_DIR, settings.METRICS_FLUSH_SECONDS)
+        )
+    app.state.sales_sync = asyncio.create_task(
+        sales.sales_tracker.run(AsyncSessionLocal, settings.TRENDING_SYNC_SECONDS)
+    )
+    app.state.suggest_refresh = asyncio.create_task(
+        suggest.suggest_index.run(AsyncSessionLocal, settings.SUGGEST_REFRESH_SECONDS)
+    )
+    if settings.LOOP_MONITOR_ENABLED:
+        loopmonitor.loop_monitor.start()
+    # Only a worker explicitly given slot 0 is the canary, never every worker of an unslotted server
+    if settings.TRACEMALLOC_PERIODIC_SECONDS > 0 and os.getenv("WORKER_SLOT") == "0":
+        memprofile.memory_profiler.start_periodic(
+            settings.TRACEMALLOC_PERIODIC_SECONDS, settings.TRACEMALLOC_PERIODIC_FRAMES,
+        )
+    boot_timer.mark_ready()
+    logger.info("Worker boot report: %s", boot_timer.report())
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Stop the background jobs started above, so none is mid-sync during the final flush
+    tasks = [
+        task for task in (getattr(app.state, name, None) for name in ("sales_sync", "suggest_refresh", "metrics_flusher"))
+        if task is not None
+    ]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Sales counted since the last sync would otherwise be lost with the worker
+    try:
+        async with AsyncSessionLocal() as db:
+            await sales.sales_tracker.flush(db)
+    except Exception:
+        logger.exception("Could not flush sales counters")
 
 # Include your API routers
 app.include_router(auth.router, prefix="/api/v1", tags=["Auth"])
 app.include_router(books.router, prefix="/api/v1/books", tags=["Books"])
 app.include_router(purchases.router, prefix="/api/v1/purchases", tags=["Purchases"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["Users"])
+app.include_router(ops.router, prefix="/api/v1/ops", tags=["Ops"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics_router.router)
+
+if settings.ADMIN_MOUNT == "lazy":
+    app.mount("/admin", LazyAdmin(), name="admin")
 
 def custom_openapi():
     if app.openapi_schema:
@@ -62,6 +140,7 @@ def custom_openapi():
     return app.openapi_schema
     
 app.openapi = custom_openapi
+boot_timer.mark("routes")
 
 
 @app.get("/", tags=["Root"])
@@ -1,6 +1,6 @@
 # Make schemas easily importable
 from .token import Token, TokenData
 from .user import User, UserCreate, UserUpdate, UserProfile, UserStats
-from .book import Book, BookCreate, BookUpdate, BookDetail, Comment, CommentCreate, Rating, RatingCreate
+from .book import Book, BookCreate, BookUpdate, BookDetail, BookFacets, BookPage, BookSort, Comment, CommentCreate, Rating, RatingCreate, SalesWindow, Suggestion
 from .purchase import Purchase, CartItemCreate, Cart, CartItem, PurchaseStatus
 from .common import Message, PaginationParams
\ No newline at end of file
@@ -1,9 +1,27 @@
+import enum
 from pydantic import BaseModel, Field, constr
 from typing import Optional, List
 from datetime import date, datetime
 from decimal import Decimal # Import Decimal
 from app.db.models.book import BookAvailability # Keep this for read schemas
 
+class BookSort(str, enum.Enum):
+    """Orderings offered by the catalog listing."""
+    TITLE = "title"
+    PRICE = "price" # cheapest first
+    PRICE_DESC = "price_desc"
+    NEWEST = "newest" # latest publication date first, undated books last
+    RATING = "rating" # highest average rating first, unrated books last
+    PERSONALIZED = "personalized" # genre/author affinity of the current user plus popularity
+    BESTSELLING = "bestselling" # sales over the last 30 days
+
+class SalesWindow(str, enum.Enum):
+    """Periods of the trending/bestseller rankings."""
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    ALL = "all"
+
 # --- Base Schema (Common fields for creation/reading, excluding auto-managed ones) ---
 class BookBase(BaseModel):
     title: str = Field(..., min_length=1, max_length=200)
@@ -81,7 +99,8 @@ class Book(BaseModel): # Don't inherit BookBase if it omits fields needed for re
     publication_date: Optional[date] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
-    average_rating: Optional[float] = None # Keep calculated field
+    average_rating: Optional[float] = None
+    rating_count: int = 0
 
     class Config:
         orm_mode = True
@@ -106,4 +125,27 @@ class BookUpdate(BaseModel):
     language: Optional[str] = Field(None, max_length=50)
     # User can update book_count
     book_count: Optional[int] = Field(None, ge=0)
-    publication_date: Optional[date] = None
\ No newline at end of file
+    publication_date: Optional[date] = None
+
+
+class FacetCount(BaseModel):
+    value: Optional[str] = None # None for books without a genre/language
+    count: int
+
+class BookFacets(BaseModel):
+    total: int
+    genre: List[FacetCount] = []
+    language: List[FacetCount] = []
+    availability: List[FacetCount] = []
+
+class BookPage(BaseModel):
+    """The catalog listing with its facet counts (GET /books/?facets=true)."""
+    items: List[Book]
+    total: int
+    facets: BookFacets
+
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str # "title" or "author"
+    book_id: Optional[int] = None # set for titles
@@ -6,4 +6,5 @@ class Token(BaseModel):
     token_type: str = "bearer"
 
 class TokenData(BaseModel):
+    username: Optional[str] = None
     email: Optional[str] = None
\ No newline at end of file
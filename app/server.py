@@ -0,0 +1,218 @@
+"""
+Production server entry point.
+
+    python -m app.server [--workers N] [--host HOST] [--port PORT] [--no-preload]
+
+Runs uvicorn with uvloop/httptools. With several workers and SERVER_PRELOAD
+enabled the application is imported once in the master process and the
+workers are forked from it, so imported code is shared copy-on-write.
+Every knob defaults to the matching field in `Settings`.
+"""
+import argparse
+import atexit
+import gc
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from typing import Dict
+
+import uvicorn
+
+from app.core import logs
+from app.core.config import settings
+
+logger = logging.getLogger("app.server")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.server", description="Run the Book Shop API.")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.WEB_CONCURRENCY)
+    parser.add_argument("--loop", default=settings.SERVER_LOOP)
+    parser.add_argument("--http", default=settings.SERVER_HTTP)
+    parser.add_argument("--preload", action=argparse.BooleanOptionalAction, default=settings.SERVER_PRELOAD)
+    return parser.parse_args(argv)
+
+
+def build_config(app, args: argparse.Namespace) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=args.host,
+        port=args.port,
+        loop=args.loop,
+        http=args.http,
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE_TIMEOUT,
+        access_log=settings.SERVER_ACCESS_LOG,
+        proxy_headers=True,
+        # uvicorn's loggers propagate to the root logger set up by app.core.logs
+        log_config=None,
+    )
+
+
+def _run_worker(config: uvicorn.Config, sock, slot: int) -> None:
+    from app.core.startup import boot_timer
+    from app.db.base import engine
+
+    # The "engine" phase is timed from here, not from the master's last mark
+    boot_timer.mark_forked()
+    # Lets per-worker features (e.g. the tracemalloc canary) pick one worker
+    os.environ["WORKER_SLOT"] = str(slot)
+    # Connections inherited from the master must not be shared with it
+    engine.sync_engine.dispose(close=False)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def restart_delay(failures: int) -> float:
+    """Seconds before restarting a worker that died young `failures` times in a row."""
+    if failures <= 0:
+        return 0.0
+    return min(settings.SERVER_RESTART_BACKOFF_SECONDS * 2 ** (failures - 1), settings.SERVER_RESTART_MAX_BACKOFF_SECONDS)
+
+
+def run_preforked(args: argparse.Namespace) -> int:
+    """
+    Import the app in the master, bind the socket once and fork `args.workers`
+    children serving it. Dead workers are replaced until SIGTERM/SIGINT, with
+    a growing delay while they keep dying soon after starting (e.g. the
+    database is down). The exit code is 1 when a worker failed
+    SERVER_RESTART_MAX_FAILURES times in a row and the server gave up.
+    """
+    from app.main import app
+
+    config = build_config(app, args)
+    config.load()
+    sock = config.bind_socket()
+    # Move everything imported so far out of the GC's reach so that collections
+    # in the workers do not touch (and un-share) those pages.
+    gc.freeze()
+
+    workers: Dict[int, int] = {}
+    started: Dict[int, float] = {}
+    failures: Dict[int, int] = {}
+    # Slots waiting to be restarted -> when
+    pending: Dict[int, float] = {}
+    stopping = False
+    gave_up = False
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(config, sock, slot)
+                code = 0
+            except Exception:
+                logger.exception("Worker %s crashed", os.getpid())
+                code = 1
+            # os._exit skips atexit, so drain the log queue first
+            logs.shutdown_logging()
+            os._exit(code)
+        workers[pid] = slot
+        started[slot] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(args.workers):
+        spawn(slot)
+    logger.info("Master %s serving %s:%s with %s preforked workers", os.getpid(), args.host, args.port, args.workers)
+
+    while workers or (pending and not stopping):
+        now = time.monotonic()
+        for slot, due in list(pending.items()):
+            if stopping:
+                pending.clear()
+            elif due <= now:
+                del pending[slot]
+                spawn(slot)
+        try:
+            if pending:
+                # Wake up for the next restart even if no worker exits meanwhile
+                pid, status = os.waitpid(-1, os.WNOHANG) if workers else (0, 0)
+                if pid == 0:
+                    time.sleep(max(0.0, min(min(pending.values()) - time.monotonic(), 0.5)))
+                    continue
+            else:
+                pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = workers.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        if time.monotonic() - started[slot] < settings.SERVER_RESTART_HEALTHY_SECONDS:
+            failures[slot] = failures.get(slot, 0) + 1
+        else:
+            failures[slot] = 0
+        if failures[slot] >= settings.SERVER_RESTART_MAX_FAILURES:
+            logger.error(
+                "Worker slot %s died %s times in a row within %ss of starting, shutting down",
+                slot, failures[slot], settings.SERVER_RESTART_HEALTHY_SECONDS,
+            )
+            gave_up = True
+            stop(signal.SIGTERM, None)
+            continue
+        delay = restart_delay(failures[slot])
+        logger.warning("Worker %s exited with status %s, restarting in %.1fs", pid, status, delay)
+        pending[slot] = time.monotonic() + delay
+    sock.close()
+    return 1 if gave_up else 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logs.configure_logging(
+        settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_QUEUE_SIZE,
+        settings.LOG_SAMPLING, settings.LOG_REQUEST_BUDGET,
+    )
+    # Pool sizing in app.db.base divides the connection budget by the worker count,
+    # so it has to be known before the app is imported (here or in spawned workers).
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    settings.WEB_CONCURRENCY = args.workers
+    if args.workers > 1 and settings.METRICS_ENABLED and not settings.METRICS_DIR:
+        # Workers publish metric snapshots here so /metrics can merge them
+        os.environ["METRICS_DIR"] = settings.METRICS_DIR = tempfile.mkdtemp(prefix="bookshop-metrics-")
+        atexit.register(shutil.rmtree, settings.METRICS_DIR, True)
+
+    if args.workers > 1 and args.preload and hasattr(os, "fork"):
+        return run_preforked(args)
+    if args.workers == 1:
+        # The only worker is the canary (uvicorn's own workers get no slot, so none is)
+        os.environ["WORKER_SLOT"] = "0"
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE_TIMEOUT,
+        access_log=settings.SERVER_ACCESS_LOG,
+        proxy_headers=True,
+        # uvicorn's loggers propagate to the root logger set up by app.core.logs
+        log_config=None,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Shared test setup.
+
+Settings are read when app modules are imported, so the environment is set
+here first: the primary database is a throwaway SQLite file, there are no
+replicas, and nothing runs that reaches outside the process.
+
+    python -m pytest app/tests
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="bookshop-tests-")
+atexit.register(shutil.rmtree, TEST_DIR, True)
+PRIMARY_PATH = os.path.join(TEST_DIR, "primary.db")
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{PRIMARY_PATH}",
+    "DATABASE_REPLICA_URLS": "",
+    "SCHEMA_BOOTSTRAP": "create_all",
+    "ADMIN_MOUNT": "off",
+    "MODEL_DIR": os.path.join(TEST_DIR, "models"),
+    "METRICS_DIR": "",
+    "LOOP_MONITOR_ENABLED": "false",
+    "TRACEMALLOC_PERIODIC_SECONDS": "0",
+    "LOG_LEVEL": "WARNING",
+})
+
+import pytest_asyncio  # noqa: E402
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+
+@pytest_asyncio.fixture
+async def engine():
+    """The primary engine; its pool is emptied after each test, whose event loop it is bound to."""
+    from app.db.base import engine
+
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def client(engine):
+    """An API client on empty tables, with the app's startup and shutdown run around it."""
+    from app.crud.crud_book import book as crud_book
+    from app.db.base import Base
+    from app.db.catalog import catalog_store
+    from app.main import app
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    # Per-worker caches would otherwise carry rows of the previous test's tables
+    catalog_store.snapshot = None
+    crud_book._facets.clear()
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as http:
+            yield http
+
+
+@pytest_asyncio.fixture
+async def admin_headers(client):
+    """Authorization header of a superuser."""
+    from app.core.security import create_access_token
+    from app.crud.crud_user import user as crud_user
+    from app.db.base import AsyncSessionLocal
+    from app.schemas import UserCreate
+
+    async with AsyncSessionLocal() as db:
+        await crud_user.create(db, obj_in=UserCreate(
+            username="admin", email="admin@example.com", password="admin-password", is_superuser=True,
+        ))
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'admin'})}"}
+
+
+@pytest_asyncio.fixture
+async def user_headers(client):
+    """Authorization header of a regular user, registered through the API."""
+    from app.core.security import create_access_token
+
+    response = await client.post("/api/v1/", json={
+        "username": "reader", "email": "reader@example.com", "password": "reader-password",
+    })
+    assert response.status_code == 201, response.text
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'reader'})}"}
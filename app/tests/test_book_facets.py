@@ -0,0 +1,42 @@
+"""Facet counts (GET /books/facets) against the books written through the API."""
+import pytest
+
+pytestmark = pytest.mark.asyncio
+
+
+async def facets(client, **params):
+    response = await client.get("/api/v1/books/facets", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def test_facets_follow_writes(client, admin_headers):
+    ids = []
+    for title in ("Novel A", "Novel B", "Novel C"):
+        response = await client.post("/api/v1/books/", json={
+            "title": title, "author": "Someone", "genre": "novel", "cost": "10.00", "language": "en", "book_count": 1,
+        }, headers=admin_headers)
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+    counts = await facets(client)
+    assert counts["genre"] == [{"value": "novel", "count": 3}]
+    assert counts["language"] == [{"value": "en", "count": 3}]
+    assert counts["total"] == 3
+    # Served from the cache until a write
+    assert await facets(client) == counts
+
+    response = await client.delete(f"/api/v1/books/{ids[0]}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    response = await client.post("/api/v1/books/", json={
+        "title": "Poems", "author": "Someone", "genre": "poetry", "cost": "5.00", "language": "fr", "book_count": 0,
+    }, headers=admin_headers)
+    assert response.status_code == 201, response.text
+    counts = await facets(client)
+    assert counts["genre"] == [{"value": "novel", "count": 2}, {"value": "poetry", "count": 1}]
+    assert counts["language"] == [{"value": "en", "count": 2}, {"value": "fr", "count": 1}]
+
+    response = await client.put(f"/api/v1/books/{ids[1]}", json={"book_count": 4}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    counts = await facets(client)
+    assert counts["availability"] == [{"value": "not_available", "count": 2}, {"value": "available", "count": 1}]
+    assert (await facets(client, genre="novel"))["total"] == 2
@@ -0,0 +1,53 @@
+"""
+What readers leave on a book: comments, listed with their author, and
+favorites, which show up in the reader's own list.
+"""
+import pytest
+
+pytestmark = pytest.mark.asyncio
+
+
+async def create_book(client, headers, title):
+    response = await client.post("/api/v1/books/", json={
+        "title": title, "author": "Someone", "genre": "Novel", "cost": "10.00", "book_count": 1,
+    }, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+async def test_comments(client, admin_headers, user_headers):
+    book_id = await create_book(client, admin_headers, "A")
+    for text in ("First!", "Second"):
+        response = await client.post(f"/api/v1/books/{book_id}/comments", json={"text": text}, headers=user_headers)
+        assert response.status_code == 201, response.text
+        assert response.json()["user"]["username"] == "reader"
+
+    response = await client.get(f"/api/v1/books/{book_id}/comments")
+    assert response.status_code == 200, response.text
+    assert sorted(comment["text"] for comment in response.json()) == ["First!", "Second"]
+    assert {comment["user"]["username"] for comment in response.json()} == {"reader"}
+    response = await client.get(f"/api/v1/books/{book_id}/comments", params={"limit": 1})
+    assert len(response.json()) == 1
+
+    response = await client.post("/api/v1/books/999/comments", json={"text": "Lost"}, headers=user_headers)
+    assert response.status_code == 404, response.text
+
+
+async def test_favorites(client, admin_headers, user_headers):
+    a, b = [await create_book(client, admin_headers, title) for title in ("A", "B")]
+
+    async def favorites():
+        response = await client.get("/api/v1/me/favorites", headers=user_headers)
+        assert response.status_code == 200, response.text
+        return sorted(book["id"] for book in response.json())
+
+    for book_id in (a, b, a):
+        response = await client.post(f"/api/v1/books/{book_id}/favorite", headers=user_headers)
+        assert response.status_code == 201, response.text
+    assert await favorites() == [a, b]
+
+    response = await client.delete(f"/api/v1/books/{a}/favorite", headers=user_headers)
+    assert response.status_code == 200, response.text
+    assert await favorites() == [b]
+    response = await client.get("/api/v1/me", headers=user_headers)
+    assert [book["id"] for book in response.json()["favorite_books"]] == [b]
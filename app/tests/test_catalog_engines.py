@@ -0,0 +1,123 @@
+"""
+The catalog listing on both read engines (CATALOG_READ_ENGINE): the same
+pages and totals through the API, and books created, edited or deleted
+through the API showing up at once on either.
+"""
+import pytest
+from sqlalchemy import text
+
+from app.core.config import settings
+
+pytestmark = pytest.mark.asyncio
+
+BOOKS = [
+    {"title": "Anna Karenina", "author": "Leo Tolstoy", "genre": "Novel", "cost": "12.50",
+     "language": "ru", "book_count": 3, "publication_date": "1878-01-01"},
+    {"title": "War and Peace", "author": "Leo Tolstoy", "genre": "Novel", "cost": "20.00",
+     "language": "ru", "book_count": 0, "publication_date": "1869-01-01"},
+    {"title": "Leaves of Grass", "author": "Walt Whitman", "genre": "Poetry", "cost": "8.00",
+     "language": "en", "book_count": 5, "publication_date": "1855-07-04"},
+    {"title": "Dubliners", "author": "James Joyce", "genre": "Short stories", "cost": "9.99",
+     "language": "en", "book_count": 1},
+    {"title": "Anna Karenina", "author": "Leo Tolstoy", "genre": "Novel", "cost": "12.50",
+     "language": "en", "book_count": 2, "publication_date": "2001-05-01"},
+]
+QUERIES = [
+    {}, {"sort": "price"}, {"sort": "price_desc"}, {"sort": "newest"}, {"sort": "rating"},
+    {"author": "tolstoy"}, {"title": "an"}, {"title": "a_n%a"}, {"genre": "nov", "sort": "price_desc"},
+    {"language": "en", "sort": "newest"}, {"availability": "available"}, {"min_cost": 9, "max_cost": 15},
+    {"published_from": "1860-01-01", "published_to": "1900-12-31"}, {"author": "tolstoi", "fuzzy": "true"},
+    {"skip": 1, "limit": 2, "sort": "price"}, {"skip": 10},
+]
+
+
+async def listing(client, query):
+    response = await client.get("/api/v1/books/", params={"limit": 100, **query})
+    assert response.status_code == 200, response.text
+    return [(book["id"], book["title"]) for book in response.json()]
+
+
+async def all_listings(client, monkeypatch):
+    """Every query on each engine: {engine: [page per query]}."""
+    pages = {}
+    for read_engine in ("database", "snapshot"):
+        monkeypatch.setattr(settings, "CATALOG_READ_ENGINE", read_engine)
+        pages[read_engine] = [await listing(client, query) for query in QUERIES]
+    return pages
+
+
+async def create(client, headers, book):
+    response = await client.post("/api/v1/books/", json=book, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+@pytest.mark.parametrize("read_engine", ["database", "snapshot"])
+async def test_listing_follows_writes(client, admin_headers, monkeypatch, read_engine):
+    monkeypatch.setattr(settings, "CATALOG_READ_ENGINE", read_engine)
+    ids = [await create(client, admin_headers, book) for book in BOOKS]
+    anna, war, leaves, dubliners, anna_en = ids
+    assert [title for _, title in await listing(client, {})] == [
+        "Anna Karenina", "Anna Karenina", "Dubliners", "Leaves of Grass", "War and Peace",
+    ]
+    assert [book_id for book_id, _ in await listing(client, {"sort": "price"})] == [leaves, dubliners, anna, anna_en, war]
+
+    response = await client.delete(f"/api/v1/books/{war}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    fresh = await create(client, admin_headers, {
+        "title": "Book X", "author": "Nobody", "genre": "Novel", "cost": "15.00", "book_count": 1,
+    })
+    response = await client.put(f"/api/v1/books/{dubliners}", json={"cost": "30.00", "title": "The Dubliners"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    assert await listing(client, {}) == [
+        (anna, "Anna Karenina"), (anna_en, "Anna Karenina"), (fresh, "Book X"),
+        (leaves, "Leaves of Grass"), (dubliners, "The Dubliners"),
+    ]
+    assert [book_id for book_id, _ in await listing(client, {"sort": "price_desc"})] == [dubliners, fresh, anna_en, anna, leaves]
+    assert [book_id for book_id, _ in await listing(client, {"genre": "novel"})] == [anna, anna_en, fresh]
+    assert await listing(client, {"title": "dubliners", "max_cost": 20}) == []
+
+
+async def test_engines_agree(client, admin_headers, monkeypatch):
+    ids = [await create(client, admin_headers, book) for book in BOOKS]
+    pages = await all_listings(client, monkeypatch)
+    assert pages["snapshot"] == pages["database"]
+
+    # A delete and a create right after it: the snapshot must drop the one and show the other
+    response = await client.delete(f"/api/v1/books/{ids[0]}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    await create(client, admin_headers, {"title": "Anna's Book", "author": "Leo Tolstoy", "cost": "1.00", "book_count": 0})
+    pages = await all_listings(client, monkeypatch)
+    assert pages["snapshot"] == pages["database"]
+    assert "Anna's Book" in [title for _, title in pages["snapshot"][0]]
+    assert ids[0] not in [book_id for book_id, _ in pages["snapshot"][0]]
+
+    for book_id, change in ((ids[2], {"book_count": 0}), (ids[3], {"publication_date": "1914-06-15"}), (ids[4], {"language": "de"})):
+        response = await client.put(f"/api/v1/books/{book_id}", json=change, headers=admin_headers)
+        assert response.status_code == 200, response.text
+    response = await client.post(f"/api/v1/books/{ids[1]}/rate", json={"score": 4}, headers=admin_headers)
+    assert response.status_code in (200, 201), response.text
+    pages = await all_listings(client, monkeypatch)
+    assert pages["snapshot"] == pages["database"]
+    assert pages["snapshot"][QUERIES.index({"sort": "rating"})][0][0] == ids[1]
+
+
+async def test_snapshot_finds_late_committed_insert(client, admin_headers, engine, monkeypatch):
+    from app.db.catalog import catalog_store
+
+    monkeypatch.setattr(settings, "CATALOG_READ_ENGINE", "snapshot")
+    first = await create(client, admin_headers, BOOKS[0])
+    insert = text(
+        "INSERT INTO books (id, title, author, cost, book_count, availability_status, rating_count) "
+        "VALUES (:id, :title, 'Someone', 1.0, 0, 'NOT_AVAILABLE', 0)"
+    )
+    # Another worker's insert commits before one that took a lower id
+    async with engine.begin() as conn:
+        await conn.execute(insert, {"id": first + 10, "title": "Committed first"})
+    assert sorted(book_id for book_id, _ in await listing(client, {})) == [first, first + 10]
+    async with engine.begin() as conn:
+        await conn.execute(insert, {"id": first + 5, "title": "Committed late"})
+    # The refresh interval is over
+    catalog_store.invalidate()
+    assert sorted(book_id for book_id, _ in await listing(client, {})) == [first, first + 5, first + 10]
@@ -0,0 +1,132 @@
+"""
+The cart and checkout: a book goes into the cart once, and the co-purchase
+counts behind "also bought" are updated in the checkout's own transaction,
+without extra round trips.
+"""
+import pytest
+from sqlalchemy import event, update
+
+pytestmark = pytest.mark.asyncio
+
+
+async def create_books(client, headers, titles):
+    ids = []
+    for title in titles:
+        response = await client.post("/api/v1/books/", json={
+            "title": title, "author": "Someone", "genre": "Novel", "cost": "10.00", "book_count": 5,
+        }, headers=headers)
+        assert response.status_code == 201, response.text
+        ids.append(response.json()["id"])
+        # Books start out not available; any edit with copies in stock makes them available
+        response = await client.put(f"/api/v1/books/{ids[-1]}", json={"book_count": 5}, headers=headers)
+        assert response.status_code == 200, response.text
+    return ids
+
+
+async def checkout(client, headers, book_ids, engine):
+    for book_id in book_ids:
+        response = await client.post("/api/v1/purchases/cart/items", json={"book_id": book_id}, headers=headers)
+        assert response.status_code == 201, response.text
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        response = await client.post("/api/v1/purchases/checkout", headers=headers)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+    assert response.status_code == 200, response.text
+    assert sorted(purchase["book_id"] for purchase in response.json()) == sorted(book_ids)
+    return statements
+
+
+async def also_bought(client, book_id):
+    response = await client.get(f"/api/v1/books/{book_id}/also-bought")
+    assert response.status_code == 200, response.text
+    return sorted(book["id"] for book in response.json())
+
+
+async def test_checkout_records_co_purchases(client, admin_headers, engine):
+    from app.db.base import AsyncSessionLocal
+    from app.db.models import User
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(User).values(balance=1000))
+        await db.commit()
+    a, b, c, d = await create_books(client, admin_headers, ["A", "B", "C", "D"])
+
+    await checkout(client, admin_headers, [a, b], engine)
+    assert await also_bought(client, a) == [b]
+    assert await also_bought(client, b) == [a]
+
+    # Session user, balance, cart, purchases update, balance update, co-purchase upsert
+    statements = await checkout(client, admin_headers, [c, d], engine)
+    assert len(statements) == 6, statements
+    assert await also_bought(client, a) == [b, c, d]
+    assert await also_bought(client, c) == [a, b, d]
+
+
+async def test_book_goes_into_the_cart_once(client, admin_headers):
+    a, b = await create_books(client, admin_headers, ["A", "B"])
+    response = await client.post("/api/v1/purchases/cart/items", json={"book_id": a}, headers=admin_headers)
+    assert response.status_code == 201, response.text
+    item_id = response.json()["id"]
+    response = await client.post("/api/v1/purchases/cart/items", json={"book_id": a}, headers=admin_headers)
+    assert response.status_code == 400, response.text
+    response = await client.post("/api/v1/purchases/cart/items", json={"book_id": b}, headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+    response = await client.delete(f"/api/v1/purchases/cart/items/{item_id}", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    response = await client.delete(f"/api/v1/purchases/cart/items/{item_id}", headers=admin_headers)
+    assert response.status_code == 404, response.text
+
+
+async def test_cart_shows_its_books(client, admin_headers):
+    a, b = await create_books(client, admin_headers, ["A", "B"])
+    response = await client.post("/api/v1/purchases/cart/items", json={"book_id": a}, headers=admin_headers)
+    assert response.status_code == 201, response.text
+    assert response.json()["book"]["title"] == "A"
+    response = await client.post("/api/v1/purchases/cart/items", json={"book_id": b}, headers=admin_headers)
+    assert response.status_code == 201, response.text
+
+    response = await client.get("/api/v1/purchases/cart", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    cart = response.json()
+    assert sorted((item["book_id"], item["book"]["title"]) for item in cart["items"]) == [(a, "A"), (b, "B")]
+    assert cart["total_cost"] == 20.0
+
+
+async def test_checkout_charges_the_balance_once(client, admin_headers, user_headers):
+    from app.db.base import AsyncSessionLocal
+    from app.db.models import User
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(User).where(User.username == "reader").values(balance=15))
+        await db.commit()
+    a, b = await create_books(client, admin_headers, ["A", "B"])
+    item_ids = []
+    for book_id in (a, b):
+        response = await client.post("/api/v1/purchases/cart/items", json={"book_id": book_id}, headers=user_headers)
+        assert response.status_code == 201, response.text
+        item_ids.append(response.json()["id"])
+
+    # Short of money: nothing changes
+    response = await client.post("/api/v1/purchases/checkout", headers=user_headers)
+    assert response.status_code == 400, response.text
+    response = await client.get("/api/v1/purchases/cart", headers=user_headers)
+    assert len(response.json()["items"]) == 2
+
+    response = await client.delete(f"/api/v1/purchases/cart/items/{item_ids[1]}", headers=user_headers)
+    assert response.status_code == 200, response.text
+    response = await client.post("/api/v1/purchases/checkout", headers=user_headers)
+    assert response.status_code == 200, response.text
+    assert [purchase["book_id"] for purchase in response.json()] == [a]
+    response = await client.get("/api/v1/me", headers=user_headers)
+    assert response.json()["balance"] == 5.0
+    response = await client.get("/api/v1/purchases/cart", headers=user_headers)
+    assert response.json()["items"] == []
+    response = await client.post("/api/v1/purchases/checkout", headers=user_headers)
+    assert response.status_code == 400, response.text
@@ -0,0 +1,55 @@
+"""
+The loop monitor against interpreters whose asyncio and executor internals
+differ from the ones it reads: it reports less, but keeps running.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core import loopmonitor
+from app.core.loopmonitor import LoopMonitor
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_samples_default_executor():
+    monitor = LoopMonitor(interval=0.01, stall_threshold=1.0)
+    monitor._loop = asyncio.get_running_loop()
+    await monitor._loop.run_in_executor(None, time.sleep, 0)
+    monitor._sample_threadpools()
+    assert set(monitor.threadpools) == {"anyio", "default_executor"}
+    # The thread that ran the call may not be back to idle yet
+    assert monitor.threadpools["default_executor"]["busy"] <= 1
+    assert monitor.threadpools["default_executor"]["capacity"] == monitor._loop._default_executor._max_workers
+
+
+async def test_missing_executor_internals_leave_the_pool_out(monkeypatch):
+    class Executor(ThreadPoolExecutor):
+        def __init__(self):
+            super().__init__(max_workers=2)
+            del self._idle_semaphore
+
+    loop = asyncio.get_running_loop()
+    executor = Executor()
+    monkeypatch.setattr(loop, "_default_executor", executor)
+    monitor = LoopMonitor(interval=0.01, stall_threshold=1.0)
+    monitor._loop = loop
+    monitor._sample_threadpools()
+    monitor._sample_threadpools()
+    assert set(monitor.threadpools) == {"anyio"}
+    executor.shutdown()
+
+
+async def test_stall_without_current_tasks(monkeypatch):
+    monkeypatch.delattr(loopmonitor.asyncio_tasks, "_current_tasks")
+    monitor = LoopMonitor(interval=0.01, stall_threshold=0.05)
+    monitor.start()
+    try:
+        time.sleep(0.2)  # blocks the loop
+        await asyncio.sleep(0.05)
+        assert monitor.report()["stalls"][0]["task"] is None
+        assert monitor.report()["stalls"][0]["stack"]
+    finally:
+        monitor._task.cancel()
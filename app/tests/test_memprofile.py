@@ -0,0 +1,71 @@
+"""
+Periodic tracemalloc mode: traced all along with few frames, so periodic
+snapshots show growth between them, and never in a worker that was not
+explicitly made the canary.
+"""
+import asyncio
+import tracemalloc
+
+import pytest
+
+from app.core.memprofile import MemoryProfiler, compare
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_periodic_snapshots_show_growth_between_them():
+    profiler = MemoryProfiler(frames=16, max_snapshots=8)
+    profiler.start_periodic(interval=0.1, frames=1)
+    try:
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_traceback_limit() == 1
+        await asyncio.sleep(0.15)
+        assert [snapshot["label"] for snapshot in profiler.store.list()] == ["periodic"]
+        # Allocated between the first and the second snapshot
+        held = [bytearray(1000) for _ in range(1000)]
+        for _ in range(50):
+            if len(profiler.store.list()) == 2:
+                break
+            await asyncio.sleep(0.02)
+        assert tracemalloc.is_tracing()
+        (_, first), (_, second) = profiler.store.get(None, 0), profiler.store.get(None, 1)
+        rows = compare(first, second, "lineno", limit=10)
+        assert any("test_memprofile.py" in row["location"] and row["size_diff"] >= 1_000_000 for row in rows), rows
+        del held
+    finally:
+        profiler.stop()
+    assert not tracemalloc.is_tracing()
+
+
+async def test_tracing_on_demand_gets_the_frames_it_asks_for():
+    profiler = MemoryProfiler(frames=4, max_snapshots=8)
+    profiler.start_periodic(interval=0.1, frames=1)
+    try:
+        profiler.start(8)
+        assert tracemalloc.get_traceback_limit() == 8
+        # Fewer frames than tracing already has: left as it is
+        profiler.start()
+        assert tracemalloc.get_traceback_limit() == 8
+        await asyncio.sleep(0.15)
+        assert len(profiler.store.list()) == 1
+    finally:
+        profiler.stop()
+
+
+@pytest.mark.parametrize("slot, canary", [(None, False), ("1", False), ("0", True)])
+async def test_only_slot_zero_is_the_canary(monkeypatch, engine, slot, canary):
+    from app.core import memprofile
+    from app.core.config import settings
+    from app.main import app
+
+    if slot is None:
+        monkeypatch.delenv("WORKER_SLOT", raising=False)
+    else:
+        monkeypatch.setenv("WORKER_SLOT", slot)
+    monkeypatch.setattr(settings, "TRACEMALLOC_PERIODIC_SECONDS", 60.0)
+    monkeypatch.setattr(memprofile, "memory_profiler", MemoryProfiler(frames=16, max_snapshots=8))
+    try:
+        async with app.router.lifespan_context(app):
+            assert (memprofile.memory_profiler.periodic_task is not None) is canary
+    finally:
+        memprofile.memory_profiler.stop()
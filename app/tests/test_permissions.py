@@ -0,0 +1,53 @@
+"""
+Who may do what: a login token stands for its user, and catalog writes and
+the ops reports are for superusers only, whatever token a regular user sends.
+"""
+import pytest
+
+pytestmark = pytest.mark.asyncio
+
+BOOK = {"title": "Dubliners", "author": "James Joyce", "genre": "Short stories", "cost": "9.99", "book_count": 1}
+
+
+async def test_login_token_identifies_the_user(client, user_headers):
+    response = await client.post("/api/v1/login", data={"username": "reader", "password": "reader-password"})
+    assert response.status_code == 200, response.text
+    token = response.json()["token"]
+    response = await client.get("/api/v1/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["username"] == "reader"
+
+    response = await client.get("/api/v1/me", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401, response.text
+
+
+async def test_regular_user_cannot_write_the_catalog(client, admin_headers, user_headers):
+    response = await client.post("/api/v1/books/", json=BOOK, headers=user_headers)
+    assert response.status_code == 403, response.text
+
+    response = await client.post("/api/v1/books/", json=BOOK, headers=admin_headers)
+    assert response.status_code == 201, response.text
+    book_id = response.json()["id"]
+    response = await client.put(f"/api/v1/books/{book_id}", json={"cost": "0.01"}, headers=user_headers)
+    assert response.status_code == 403, response.text
+    response = await client.delete(f"/api/v1/books/{book_id}", headers=user_headers)
+    assert response.status_code == 403, response.text
+
+    response = await client.get(f"/api/v1/books/{book_id}")
+    assert response.status_code == 200, response.text
+    assert response.json()["cost"] == "9.99"
+
+
+async def test_anonymous_user_cannot_write_the_catalog(client):
+    response = await client.post("/api/v1/books/", json=BOOK)
+    assert response.status_code == 401, response.text
+
+
+@pytest.mark.parametrize("path", ["/api/v1/ops/startup", "/api/v1/ops/pool"])
+async def test_ops_reports_are_for_superusers(client, admin_headers, user_headers, path):
+    response = await client.get(path)
+    assert response.status_code == 401, response.text
+    response = await client.get(path, headers=user_headers)
+    assert response.status_code == 403, response.text
+    response = await client.get(path, headers=admin_headers)
+    assert response.status_code == 200, response.text
@@ -0,0 +1,38 @@
+"""
+Query statistics are attributed to the route that issued them through the
+request scope RequestContextMiddleware publishes, with or without metrics.
+"""
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.logs import RequestContextMiddleware
+from app.db.querystats import QueryStats, instrument_engine
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_queries_are_attributed_to_the_route(tmp_path):
+    # An engine of its own: instrumenting adds listeners that cannot be taken off again
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}")
+    stats = QueryStats()
+    instrument_engine(engine, stats)
+    app = FastAPI()
+    app.add_middleware(RequestContextMiddleware)
+
+    @app.get("/books/{book_id}")
+    async def read(book_id: int):
+        async with engine.connect() as conn:
+            return {"value": (await conn.execute(text("SELECT :v"), {"v": book_id})).scalar_one()}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        assert (await client.get("/books/7")).json() == {"value": 7}
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    await engine.dispose()
+
+    routes = {row["route"] for row in stats.top(limit=100)}
+    assert "/books/{book_id}" in routes
+    assert "<background>" in routes
@@ -0,0 +1,139 @@
+"""
+Read routing (app.db.routing) with SQLite files standing in for the primary
+and the replicas. Every database has a one-row `whoami` table naming it, so a
+read shows which one served it.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.db import routing
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_database(path: str, name: str) -> None:
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS whoami (name TEXT)")
+        conn.execute("DELETE FROM whoami")
+        conn.execute("INSERT INTO whoami VALUES (?)", (name,))
+
+
+def request_for(username=None) -> Request:
+    headers = []
+    if username:
+        headers.append((b"authorization", f"Bearer {create_access_token({'sub': username})}".encode()))
+    return Request({"type": "http", "headers": headers})
+
+
+async def served_by(request: Request) -> str:
+    dependency = routing.get_read_db(request)
+    session = await dependency.__anext__()
+    try:
+        return (await session.execute(text("SELECT name FROM whoami"))).scalar_one()
+    finally:
+        await dependency.aclose()
+
+
+@pytest_asyncio.fixture
+async def use_replicas(tmp_path, monkeypatch, engine):
+    """Install a ReplicaSet over the given (path, name) pairs; name None leaves the file missing."""
+    make_database(make_url(settings.DATABASE_URL).database, "primary")
+    created = []
+
+    def install(databases, eject_seconds=30.0):
+        urls = []
+        for path, name in databases:
+            if name is not None:
+                make_database(path, name)
+            urls.append(f"sqlite+aiosqlite:///{path}")
+        replicas = routing.ReplicaSet(urls, eject_seconds=eject_seconds)
+        created.append(replicas)
+        monkeypatch.setattr(routing, "replicas", replicas)
+        return replicas
+
+    monkeypatch.setattr(routing, "recent_writes", routing.RecentWrites(60))
+    yield install
+    for replicas in created:
+        for session_maker in replicas.session_makers:
+            await session_maker.kw["bind"].dispose()
+
+
+async def test_reads_rotate_over_replicas(tmp_path, use_replicas):
+    use_replicas([(str(tmp_path / "a.db"), "a"), (str(tmp_path / "b.db"), "b")])
+    assert [await served_by(request_for()) for _ in range(4)] == ["a", "b", "a", "b"]
+
+
+async def test_unreachable_replica_is_ejected_and_skipped(tmp_path, use_replicas):
+    missing = str(tmp_path / "gone" / "a.db")
+    replicas = use_replicas([(missing, None), (str(tmp_path / "b.db"), "b")])
+    # The first read lands on the broken replica and moves on without failing
+    assert [await served_by(request_for()) for _ in range(3)] == ["b", "b", "b"]
+    assert replicas.ejected_until[0] > time.monotonic()
+    assert replicas.ejected_until[1] == 0.0
+
+
+async def test_reads_fall_back_to_primary_without_healthy_replicas(tmp_path, use_replicas):
+    replicas = use_replicas([(str(tmp_path / "gone" / "a.db"), None), (str(tmp_path / "gone" / "b.db"), None)])
+    assert await served_by(request_for()) == "primary"
+    assert all(until > time.monotonic() for until in replicas.ejected_until)
+    # Both are ejected now: straight to the primary
+    assert replicas.choose() is None
+    assert await served_by(request_for()) == "primary"
+
+
+async def test_ejected_replica_recovers(tmp_path, use_replicas):
+    directory = tmp_path / "later"
+    replicas = use_replicas([(str(directory / "a.db"), None)], eject_seconds=0.05)
+    assert await served_by(request_for()) == "primary"
+    assert replicas.ejected_until[0] > time.monotonic()
+    os.mkdir(directory)
+    make_database(str(directory / "a.db"), "a")
+    # Still ejected: the primary serves
+    assert await served_by(request_for()) == "primary"
+    await asyncio.sleep(0.1)
+    assert await served_by(request_for()) == "a"
+
+
+async def test_replica_failing_mid_request_is_ejected(tmp_path, use_replicas):
+    replicas = use_replicas([(str(tmp_path / "a.db"), "a")])
+    dependency = routing.get_read_db(request_for())
+    await dependency.__anext__()
+    with pytest.raises(OperationalError):
+        await dependency.athrow(OperationalError("SELECT 1", {}, Exception("connection lost")))
+    assert replicas.ejected_until[0] > time.monotonic()
+
+
+async def test_recent_writer_reads_from_primary(tmp_path, use_replicas, monkeypatch):
+    use_replicas([(str(tmp_path / "a.db"), "a")])
+    monkeypatch.setattr(routing, "recent_writes", routing.RecentWrites(0.2))
+    # A committed write through get_db marks the writer
+    dependency = routing.get_db(request_for("alice"))
+    session = await dependency.__anext__()
+    await session.execute(text("UPDATE whoami SET name = name"))
+    await session.commit()
+    with pytest.raises(StopAsyncIteration):
+        await dependency.__anext__()
+
+    assert await served_by(request_for("alice")) == "primary"
+    assert await served_by(request_for("bob")) == "a"
+    assert await served_by(request_for()) == "a"
+    # Reads that do not commit leave no marker
+    dependency = routing.get_db(request_for("bob"))
+    await dependency.__anext__()
+    with pytest.raises(StopAsyncIteration):
+        await dependency.__anext__()
+    assert await served_by(request_for("bob")) == "a"
+    # Once the window is over the writer goes back to the replicas
+    await asyncio.sleep(0.25)
+    assert await served_by(request_for("alice")) == "a"
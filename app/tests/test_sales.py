@@ -0,0 +1,49 @@
+"""
+Sales counters flushed to the database with foreign keys enforced, as on
+PostgreSQL: a sale of a book deleted since must not block the others.
+"""
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.db.base import Base
+from app.db.models import Book, BookSales, BookSalesTotal
+from app.db.sales import SalesTracker
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'sales.db'}")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Book), [
+            {"id": book_id, "title": f"Book {book_id}", "author": "Someone", "genre": "Novel", "cost": 10}
+            for book_id in (1, 2)
+        ])
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def test_sales_of_deleted_books_are_dropped(session_maker):
+    tracker = SalesTracker(top_k=10)
+    tracker.record(1, "Novel")
+    tracker.record(2, "Novel", count=2)
+    async with session_maker() as db:
+        await db.delete(await db.get(Book, 1))
+        await db.commit()
+
+    for _ in range(3):
+        async with session_maker() as db:
+            await tracker.sync(db)
+    assert tracker.pending == {}
+    async with session_maker() as db:
+        assert (await db.execute(select(BookSales.book_id, BookSales.count))).all() == [(2, 2)]
+        assert (await db.execute(select(BookSalesTotal.book_id, BookSalesTotal.count))).all() == [(2, 2)]
@@ -0,0 +1,30 @@
+"""
+Seeding over existing data (python -m app.cli seed --truncate).
+"""
+import pytest
+from sqlalchemy import func, insert, select
+
+from app.db.base import Base
+from app.db.models import Book, BookCoPurchase, BookSales, BookSalesTotal, BookSimilarity
+from app.db.seed import _ensure_empty
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_truncate_clears_the_derived_book_tables(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Book), [{"id": 1, "title": "A", "author": "X", "cost": 1.0},
+                                          {"id": 2, "title": "B", "author": "X", "cost": 1.0}])
+        await conn.execute(insert(BookSales), [{"book_id": 1, "hour": 1, "count": 1}])
+        await conn.execute(insert(BookSalesTotal), [{"book_id": 1, "count": 1}])
+        await conn.execute(insert(BookCoPurchase), [{"book_id": 1, "other_book_id": 2, "score": 1}])
+        await conn.execute(insert(BookSimilarity), [{"book_id": 1, "other_book_id": 2, "score": 0.5}])
+
+    with pytest.raises(RuntimeError):
+        await _ensure_empty(engine, truncate=False)
+    await _ensure_empty(engine, truncate=True)
+    async with engine.connect() as conn:
+        for model in (Book, BookSales, BookSalesTotal, BookCoPurchase, BookSimilarity):
+            assert (await conn.execute(select(func.count()).select_from(model))).scalar_one() == 0, model
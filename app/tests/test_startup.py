@@ -0,0 +1,28 @@
+"""
+The worker boot report (app.core.startup.BootTimer).
+"""
+import subprocess
+import sys
+import time
+
+from app.core.startup import PROJECT_ROOT, BootTimer
+
+
+def test_forked_worker_phase_starts_at_the_fork():
+    timer = BootTimer()
+    timer.mark("routes")
+    # The master idles until it forks the worker
+    time.sleep(0.2)
+    timer.mark_forked()
+    timer.mark("engine")
+    assert timer.phases["engine"] < 100
+    assert set(timer.report()["phases_ms"]) == {"routes", "engine"}
+
+
+def test_timer_starts_before_heavy_imports():
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, app.core.startup; print(sorted(sys.modules))"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    assert "sqlalchemy" not in loaded
+    assert "fastapi" not in loaded
@@ -0,0 +1,52 @@
+"""
+The span exporter in preforked workers: each process writes its own spans,
+and a full queue drops spans instead of growing.
+"""
+import os
+import time
+
+from app.core.metrics import registry
+from app.core.tracing import Span, SpanExporter
+
+
+def spans_in(path: str, expected: int, timeout: float = 5.0) -> list:
+    deadline = time.monotonic() + timeout
+    while True:
+        lines = []
+        if os.path.exists(path):
+            with open(path) as f:
+                lines = f.read().splitlines()
+        if len(lines) >= expected or time.monotonic() > deadline:
+            return lines
+        time.sleep(0.01)
+
+
+def test_forked_child_exports_its_spans(tmp_path):
+    path = str(tmp_path / "spans.jsonl")
+    exporter = SpanExporter()
+    exporter.configure(path)
+    exporter.export(Span("before fork", "1" * 32))
+    assert len(spans_in(path, 1)) == 1
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            exporter.export(Span("in child", "2" * 32))
+            ok = len(spans_in(path, 2)) == 2
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert len(spans_in(path, 2)) == 2
+
+
+def test_full_queue_drops_spans(tmp_path, monkeypatch):
+    exporter = SpanExporter(max_queue=2)
+    exporter.configure(str(tmp_path / "spans.jsonl"))
+    # A writer that never takes anything off the queue
+    monkeypatch.setattr(exporter, "_run", lambda spans: None)
+    dropped = registry.counters.get(("trace_spans_dropped_total", ()), 0)
+    for _ in range(5):
+        exporter.export(Span("span", "3" * 32))
+    assert exporter._queue.qsize() == 2
+    assert registry.counters[("trace_spans_dropped_total", ())] - dropped == 3
@@ -0,0 +1,138 @@
+"""
+The catalog listing on both read engines: same pages, and how long each takes.
+
+    python -m benchmarks.catalog_engines [--books 200000] [--repeat 5] [--updates 100] [--output report.json]
+    python -m benchmarks.catalog_engines --database-url postgresql+asyncpg://... --reset-database
+
+Seeds a catalog as benchmarks.catalog_sorts does, then calls
+CRUDBook.get_multi_filtered for every sort and filter shape of that benchmark
+(plus title and author substrings) with CATALOG_READ_ENGINE=database and
+=snapshot, and reports the median time of each. It then edits --updates books
+through CRUDBook.update_book, as the API does, and reports the time of the
+snapshot's full load and of the incremental refresh that picks the edits up,
+comparing both engines once more.
+
+The exit code is 1 when the engines disagree on any page or total.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.catalog_sorts import FILTERS as SORT_FILTERS, SORTS, seed
+from benchmarks.load import _configure_environment
+
+FILTERS: Dict[str, Dict[str, Any]] = {
+    **SORT_FILTERS,
+    "title": {"title": "12"},
+    "author": {"author": "author 7"},
+    "author_price": {"author": "author 1", "max_cost": 40.0},
+}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.catalog_engines", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database-url", help="Async SQLAlchemy URL to benchmark against (default: temporary SQLite file)")
+    parser.add_argument("--reset-database", action="store_true", help="Allow dropping and reseeding --database-url")
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls of each shape per engine")
+    parser.add_argument("--updates", type=int, default=100, help="Books changed before the incremental refresh")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    return parser.parse_args(argv)
+
+
+async def compare(db, repeat: int) -> Dict[str, Any]:
+    from app.core.config import settings
+    from app.crud.crud_book import book as crud_book
+    from app.db.models.book import BookAvailability
+    from app.schemas import BookSort
+
+    shapes: Dict[str, Any] = {}
+    for sort in SORTS:
+        for name, filters in FILTERS.items():
+            filters = dict(filters)
+            if "availability" in filters:
+                filters["availability"] = BookAvailability(filters["availability"])
+            pages, timings = {}, {}
+            for read_engine in ("database", "snapshot"):
+                settings.CATALOG_READ_ENGINE = read_engine
+                runs: List[float] = []
+                for _ in range(repeat):
+                    begin = time.perf_counter()
+                    books, total = await crud_book.get_multi_filtered(db, skip=40, limit=20, sort=BookSort(sort), **filters)
+                    runs.append(time.perf_counter() - begin)
+                pages[read_engine] = ([book.id for book in books], total)
+                timings[read_engine] = round(statistics.median(runs) * 1000, 3)
+            shapes[f"{sort}/{name}"] = {
+                "same": pages["database"] == pages["snapshot"],
+                "total": pages["database"][1],
+                "database_p50_ms": timings["database"],
+                "snapshot_p50_ms": timings["snapshot"],
+            }
+    settings.CATALOG_READ_ENGINE = "database"
+    return shapes
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from sqlalchemy import func, select
+
+    from app.crud.crud_book import book as crud_book
+    from app.db.base import AsyncSessionLocal, engine
+    from app.db.catalog import catalog_store
+    from app.db.models import Book
+    from app.schemas import BookUpdate
+
+    await seed(engine, args.books)
+    report: Dict[str, Any] = {"database": engine.dialect.name, "books": args.books}
+    async with AsyncSessionLocal() as db:
+        begin = time.perf_counter()
+        await catalog_store.get(db)
+        report["snapshot_load_s"] = round(time.perf_counter() - begin, 3)
+        report["shapes"] = await compare(db, args.repeat)
+
+        # Edits the way the API makes them, so the snapshot learns of them by itself
+        random.seed(1)
+        loaded = catalog_store.snapshot
+        for book_id in random.sample(range(1, args.books + 1), min(args.updates, args.books)):
+            await crud_book.update_book(db, book_id=book_id, obj_in=BookUpdate(
+                title=f"Title {random.randrange(args.books):07d}", cost=round(random.uniform(1, 100), 2),
+            ))
+        begin = time.perf_counter()
+        await catalog_store.get(db)
+        report["snapshot_refresh_s"] = round(time.perf_counter() - begin, 3)
+        report["refresh_was_incremental"] = catalog_store.snapshot.loaded_at == loaded.loaded_at
+        report["after_updates"] = await compare(db, 1)
+        report["rows"] = (await db.execute(select(func.count()).select_from(Book))).scalar_one()
+    await engine.dispose()
+    return report
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    temp_path = _configure_environment(args)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if temp_path:
+            os.unlink(temp_path)
+
+    mismatches = [
+        f"{phase}:{shape}" for phase in ("shapes", "after_updates")
+        for shape, result in report[phase].items() if not result["same"]
+    ]
+    report["mismatches"] = mismatches
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Query plans and latency of the catalog listing for every sort and filter shape.
+
+    python -m benchmarks.catalog_sorts [--books 200000] [--repeat 5] [--output report.json]
+    python -m benchmarks.catalog_sorts --database-url postgresql+asyncpg://... --reset-database
+
+Seeds a catalog (a temporary SQLite file by default), then calls
+CRUDBook.get_multi_filtered for each sort (title, price, price_desc, newest,
+rating) with each filter shape, captures the page query it issues, and reports
+its plan and median time. Plans are classified as:
+
+    index          rows come out of an ordered index scan, no sort step
+    sorts matches  an index range narrows the rows, which are then sorted
+    sorts catalog  the whole table is sorted for the page
+
+The exit code is 1 when any shape sorts the catalog; that is what the indexes on
+books (see the model's __table_args__) are chosen to avoid.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.load import _configure_environment
+
+SORTS = ["title", "price", "price_desc", "newest", "rating"]
+FILTERS: Dict[str, Dict[str, Any]] = {
+    "none": {},
+    "genre": {"genre": "fic"},
+    "availability": {"availability": "available"},
+    "price_range": {"min_cost": 20.0, "max_cost": 30.0},
+    "published": {"published_from": datetime.date(2000, 1, 1), "published_to": datetime.date(2010, 12, 31)},
+    "min_rating": {"min_rating": 4.5},
+    "combined": {"genre": "fic", "min_cost": 10.0, "max_cost": 50.0, "min_rating": 3.0},
+}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.catalog_sorts", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database-url", help="Async SQLAlchemy URL to benchmark against (default: temporary SQLite file)")
+    parser.add_argument("--reset-database", action="store_true", help="Allow dropping and reseeding --database-url")
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs of each page query")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    return parser.parse_args(argv)
+
+
+def classify(dialect: str, plan: List[str]) -> str:
+    text = "\n".join(plan)
+    if dialect == "postgresql":
+        sorted_ = any(line.lstrip(" ->").startswith("Sort") for line in plan)
+        narrowed = "Index Cond" in text or "Recheck Cond" in text
+    else:
+        sorted_ = "TEMP B-TREE FOR ORDER BY" in text
+        narrowed = "SEARCH" in text
+    if not sorted_:
+        return "index"
+    return "sorts matches" if narrowed else "sorts catalog"
+
+
+async def seed(engine, books: int) -> None:
+    from sqlalchemy import insert
+
+    from app.db.base import Base
+    from app.db.models import Book
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    random.seed(0)
+    genres = ["Fiction", "Science Fiction", "Fantasy", "History", "Poetry", "Romance", "Mystery", "Biography"]
+    statuses = ["available", "in_progress", "not_available"]
+    async with engine.begin() as conn:
+        for start in range(1, books + 1, 10_000):
+            rows = []
+            for i in range(start, min(start + 10_000, books + 1)):
+                # One book in ten has no publication date, three in ten no rating
+                dated = random.random() > 0.1
+                rated = random.random() > 0.3
+                rows.append({
+                    "id": i, "title": f"Title {random.randrange(books):07d}", "author": f"Author {i % 50_000}",
+                    "genre": random.choice(genres), "cost": round(random.uniform(1, 100), 2),
+                    "language": random.choice(["en", "de", "fr", "pl"]), "book_count": random.randrange(5),
+                    "availability_status": random.choice(statuses).upper(),
+                    "publication_date": datetime.date(1900, 1, 1) + datetime.timedelta(days=random.randrange(45_000)) if dated else None,
+                    "average_rating": round(random.uniform(1, 5), 2) if rated else None,
+                    "rating_count": random.randrange(1, 50) if rated else 0,
+                })
+            await conn.execute(insert(Book), rows)
+        await conn.exec_driver_sql("ANALYZE")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from sqlalchemy import event
+
+    from app.crud.crud_book import book as crud_book
+    from app.db.base import AsyncSessionLocal, engine
+    from app.db.models.book import BookAvailability
+    from app.schemas import BookSort
+
+    started = time.perf_counter()
+    await seed(engine, args.books)
+    seed_s = time.perf_counter() - started
+    dialect = engine.dialect.name
+    explain = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+
+    captured: List[tuple] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", capture)
+    results: Dict[str, Any] = {}
+    async with AsyncSessionLocal() as db:
+        for sort in SORTS:
+            for name, filters in FILTERS.items():
+                filters = dict(filters)
+                if "availability" in filters:
+                    filters["availability"] = BookAvailability(filters["availability"])
+                captured.clear()
+                await crud_book.get_multi_filtered(db, skip=0, limit=20, sort=BookSort(sort), **filters)
+                # The page query is the last one; the first is the count
+                statement, parameters = captured[-1]
+                captured.clear()
+                conn = await db.connection()
+                rows = (await conn.exec_driver_sql(explain + statement, parameters)).all()
+                plan = [row[-1] for row in rows]
+                timings = []
+                for _ in range(args.repeat):
+                    begin = time.perf_counter()
+                    (await conn.exec_driver_sql(statement, parameters)).all()
+                    timings.append(time.perf_counter() - begin)
+                results[f"{sort}/{name}"] = {
+                    "plan": classify(dialect, plan),
+                    "p50_ms": round(statistics.median(timings) * 1000, 3),
+                    "explain": plan,
+                }
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    await engine.dispose()
+    return {"database": dialect, "books": args.books, "seed_s": round(seed_s, 2), "shapes": results}
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    temp_path = _configure_environment(args)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if temp_path:
+            os.unlink(temp_path)
+
+    catalog_sorts = [shape for shape, result in report["shapes"].items() if result["plan"] == "sorts catalog"]
+    report["catalog_sorts"] = catalog_sorts
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 1 if catalog_sorts else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Python-side overhead of the hot CRUD reads.
+
+    python -m benchmarks.crud_statements [--iterations 2000]
+
+Compares building a fresh select() on every call (what the CRUD methods used to do)
+with the prebuilt and lambda statements used by CRUDBase, CRUDUser and CRUDBook.
+Runs against an in-memory SQLite database, so the per-query times are dominated by
+Python work: statement construction, cache key generation, compilation and ORM loading.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from sqlalchemy import and_, func, select  # noqa: E402
+
+from app.crud.crud_book import book as crud_book  # noqa: E402
+from app.crud.crud_user import user as crud_user  # noqa: E402
+from app.db.base import AsyncSessionLocal, Base, engine  # noqa: E402
+from app.db.models.book import Book  # noqa: E402
+from app.db.models.user import User  # noqa: E402
+
+
+async def _legacy_get(db, id):
+    result = await db.execute(select(Book).filter(Book.id == id))
+    return result.scalars().first()
+
+
+async def _legacy_get_by_username(db, username):
+    result = await db.execute(select(User).filter(User.username == username))
+    return result.scalars().first()
+
+
+async def _legacy_get_multi_filtered(db, author, genre):
+    filters = [Book.author.ilike(f"%{author}%"), Book.genre.ilike(f"%{genre}%")]
+    count = await db.execute(select(func.count()).select_from(Book).filter(and_(*filters)))
+    count.scalar_one()
+    result = await db.execute(select(Book).filter(and_(*filters)).order_by(Book.title).offset(0).limit(20))
+    return result.scalars().all()
+
+
+async def _seed() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        db.add_all(
+            Book(title=f"Title {i}", author=f"Author {i % 50}", genre=f"Genre {i % 10}", cost=10.0, book_count=1)
+            for i in range(1, 501)
+        )
+        db.add(User(username="bench", email="bench@example.com", hashed_password="x"))
+        await db.commit()
+
+
+async def _time_per_call(fn: Callable[..., Awaitable], iterations: int) -> float:
+    async with AsyncSessionLocal() as db:
+        for i in range(50):  # warm up the compiled cache
+            await fn(db, i)
+        started = time.perf_counter()
+        for i in range(iterations):
+            await fn(db, i)
+        elapsed = time.perf_counter() - started
+    return elapsed / iterations * 1e6
+
+
+async def run(iterations: int) -> Dict[str, Dict[str, float]]:
+    await _seed()
+    cases = {
+        "get": (
+            lambda db, i: _legacy_get(db, i % 500 + 1),
+            lambda db, i: crud_book.get(db, id=i % 500 + 1),
+        ),
+        "get_by_username": (
+            lambda db, i: _legacy_get_by_username(db, "bench"),
+            lambda db, i: crud_user.get_by_username(db, username="bench"),
+        ),
+        "get_multi_filtered": (
+            lambda db, i: _legacy_get_multi_filtered(db, f"Author {i % 50}", "Genre"),
+            lambda db, i: crud_book.get_multi_filtered(db, limit=20, author=f"Author {i % 50}", genre="Genre"),
+        ),
+    }
+    report = {}
+    for name, (legacy, cached) in cases.items():
+        legacy_us = await _time_per_call(legacy, iterations)
+        cached_us = await _time_per_call(cached, iterations)
+        report[name] = {
+            "rebuilt_us": round(legacy_us, 1),
+            "cached_us": round(cached_us, 1),
+            "saved_pct": round((1 - cached_us / legacy_us) * 100, 1),
+        }
+    await engine.dispose()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.iterations)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+In-process load test of the HTTP API.
+
+    python -m benchmarks.load [--requests 200] [--concurrency 8] [--output report.json]
+                              [--baseline benchmarks/baseline.json] [--save-baseline]
+    python -m benchmarks.load --database-url postgresql+asyncpg://... --reset-database
+
+Drives the ASGI app through httpx's ASGITransport (no sockets, no server) against a
+freshly seeded database: a temporary aiosqlite file by default, or any URL passed
+with --database-url (its tables are dropped and recreated, hence --reset-database).
+
+Scenarios: catalog browse, book detail, login, cart add, checkout and /me/stats.
+Each one reports p50/p95/p99 latency, throughput and SQL statements per request.
+With --baseline the report is compared to a stored one and the exit code is 1 when
+a scenario got slower, lost throughput or issues more queries than allowed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+SCENARIOS = ["browse", "detail", "login", "cart_add", "checkout", "me_stats"]
+PASSWORD = "bench-password"
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description="In-process load test of the HTTP API.")
+    parser.add_argument("--database-url", help="Async SQLAlchemy URL to benchmark against (default: temporary SQLite file)")
+    parser.add_argument("--reset-database", action="store_true", help="Allow dropping and reseeding --database-url")
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--purchases-per-user", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="Compare against this report (e.g. benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Overwrite {os.path.relpath(DEFAULT_BASELINE)} with this run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative p95/throughput regression")
+    return parser.parse_args(argv)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: List[float], elapsed: float, queries: int, errors: int) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "queries_per_request": round(queries / count, 2) if count else 0.0,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a human-readable line for every regression against `baseline`."""
+    regressions = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append(f"{name}: {current['errors']} errors (baseline {previous.get('errors', 0)})")
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs {previous['p95_ms']}ms")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['throughput_rps']}rps vs {previous['throughput_rps']}rps")
+        # Query counts are deterministic, so any increase is an N+1 creeping in
+        if current["queries_per_request"] > previous["queries_per_request"] + 0.01:
+            regressions.append(
+                f"{name}: {current['queries_per_request']} queries/request vs {previous['queries_per_request']}"
+            )
+    return regressions
+
+
+class Bench:
+    """Seeds the database, logs the users in and runs the scenarios one after another."""
+
+    def __init__(self, args: argparse.Namespace):
+        # Imported here: DATABASE_URL has to be in the environment before app.db.base loads
+        import httpx
+        from sqlalchemy import event
+
+        from app.db.base import engine
+        from app.main import app
+
+        self.args = args
+        self.app = app
+        self.engine = engine
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+        self.tokens: List[str] = []
+        self.queries = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count_query)
+
+    def _count_query(self, *args) -> None:
+        self.queries += 1
+
+    async def seed(self) -> None:
+        from sqlalchemy import insert
+
+        from app.core import security
+        from app.db.base import AsyncSessionLocal, Base
+        from app.db.models import Book, Comment, Purchase, PurchaseStatus, Rating, User
+
+        args = self.args
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+        # One bcrypt hash for everyone keeps seeding fast; login still verifies it per request
+        hashed_password = security.get_password_hash(PASSWORD)
+        genres = ["Fantasy", "Science", "History", "Poetry", "Crime", "Travel", "Children", "Horror"]
+        books = [
+            {
+                "id": i, "title": f"Book {i:06d}", "author": f"Author {i % 400}", "genre": genres[i % len(genres)],
+                "pages": 100 + i % 500, "description": f"Description of book {i}", "cost": 5.0 + i % 40,
+                "language": "en" if i % 3 else "de", "book_count": 1_000_000, "availability_status": "available",
+            }
+            for i in range(1, args.books + 1)
+        ]
+        users = [
+            {
+                "id": i, "username": f"user{i}", "email": f"user{i}@bench.local", "hashed_password": hashed_password,
+                "balance": 1e12, "is_active": True, "is_superuser": False, "is_book_manager": False,
+            }
+            for i in range(1, args.users + 1)
+        ]
+        purchases, ratings, comments = [], [], []
+        for user_id in range(1, args.users + 1):
+            for n in range(args.purchases_per_user):
+                book_id = (user_id * 7919 + n * 104729) % args.books + 1
+                purchases.append({
+                    "user_id": user_id, "book_id": book_id,
+                    "status": PurchaseStatus.COMPLETED, "cost_at_purchase": 10.0,
+                })
+                ratings.append({"user_id": user_id, "book_id": book_id, "score": 1 + (user_id + n) % 5})
+                comments.append({"user_id": user_id, "book_id": book_id, "text": f"Comment {user_id}/{n}"})
+
+        async with AsyncSessionLocal() as db:
+            for model, rows in ((Book, books), (User, users), (Purchase, purchases), (Rating, ratings), (Comment, comments)):
+                for start in range(0, len(rows), 1000):
+                    await db.execute(insert(model), rows[start:start + 1000])
+            await db.commit()
+
+    async def login_all(self) -> None:
+        for i in range(1, self.args.users + 1):
+            response = await self.client.post("/api/v1/login", data={"username": f"user{i}", "password": PASSWORD})
+            response.raise_for_status()
+            self.tokens.append(response.json()["token"])
+
+    def _auth(self, i: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[i % len(self.tokens)]}"}
+
+    async def _clear_carts(self) -> None:
+        from sqlalchemy import delete
+
+        from app.db.base import AsyncSessionLocal
+        from app.db.models import Purchase, PurchaseStatus
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(Purchase).where(Purchase.status == PurchaseStatus.IN_CART))
+            await db.commit()
+
+    async def _fill_carts(self, user_ids: List[int], round_no: int) -> None:
+        from sqlalchemy import insert
+
+        from app.db.base import AsyncSessionLocal
+        from app.db.models import Purchase, PurchaseStatus
+
+        rows = [
+            {
+                "user_id": user_id, "book_id": (user_id * 31 + round_no * 17 + k) % self.args.books + 1,
+                "status": PurchaseStatus.IN_CART, "cost_at_purchase": 12.5,
+            }
+            for user_id in user_ids for k in range(2)
+        ]
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(Purchase), rows)
+            await db.commit()
+
+    # --- Scenarios: each takes the request number and returns the response ---
+
+    def browse(self, i: int):
+        params = {"skip": (i * 20) % max(self.args.books - 20, 1), "limit": 20}
+        if i % 2:
+            params["genre"] = ["Fantasy", "Science", "History", "Crime"][i % 4]
+        return self.client.get("/api/v1/books/", params=params)
+
+    def detail(self, i: int):
+        return self.client.get(f"/api/v1/books/{(i * 7) % self.args.books + 1}")
+
+    def login(self, i: int):
+        username = f"user{i % self.args.users + 1}"
+        return self.client.post("/api/v1/login", data={"username": username, "password": PASSWORD})
+
+    def cart_add(self, i: int):
+        # Distinct (user, book) pairs so the "already in your cart" check never trips
+        users = len(self.tokens)
+        book_id = (i // users) % self.args.books + 1
+        return self.client.post("/api/v1/purchases/cart/items", json={"book_id": book_id}, headers=self._auth(i))
+
+    def checkout(self, i: int):
+        return self.client.post("/api/v1/purchases/checkout", headers=self._auth(i))
+
+    def me_stats(self, i: int):
+        return self.client.get("/api/v1/users/me/stats", headers=self._auth(i))
+
+    async def _drive(self, call: Callable[[int], Awaitable], numbers: List[int]) -> Dict[str, Any]:
+        """Run `call` for every request number with bounded concurrency."""
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        latencies: List[float] = []
+        errors = 0
+
+        async def one(i: int) -> None:
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await call(i)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        queries_before = self.queries
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in numbers))
+        return {
+            "latencies": latencies, "elapsed": time.perf_counter() - started,
+            "queries": self.queries - queries_before, "errors": errors,
+        }
+
+    async def run_scenario(self, name: str) -> Dict[str, float]:
+        args = self.args
+        call = getattr(self, name)
+        if name == "checkout":
+            return await self._run_checkout()
+
+        await self._drive(call, list(range(args.warmup)))
+        if name == "cart_add":
+            await self._clear_carts()
+        result = await self._drive(call, list(range(args.warmup, args.warmup + args.requests)))
+        if name == "cart_add":
+            await self._clear_carts()
+        return summarize(result["latencies"], result["elapsed"], result["queries"], result["errors"])
+
+    async def _run_checkout(self) -> Dict[str, float]:
+        """
+        Every checkout needs a filled cart, and a user can only check out once per
+        batch, so carts are filled directly in the database (untimed) for one batch
+        of users at a time and only the checkout requests are measured.
+        """
+        users = len(self.tokens)
+        latencies: List[float] = []
+        elapsed, queries, errors = 0.0, 0, 0
+        remaining, round_no = self.args.requests, 0
+        while remaining > 0:
+            batch = list(range(min(users, remaining)))
+            await self._fill_carts([i + 1 for i in batch], round_no)
+            result = await self._drive(self.checkout, batch)
+            latencies += result["latencies"]
+            elapsed += result["elapsed"]
+            queries += result["queries"]
+            errors += result["errors"]
+            remaining -= len(batch)
+            round_no += 1
+        return summarize(latencies, elapsed, queries, errors)
+
+    async def run(self, scenarios: List[str]) -> Dict[str, Any]:
+        try:
+            # Seeded before startup, so the background jobs it starts find the tables filled
+            seed_started = time.perf_counter()
+            await self.seed()
+            async with self.app.router.lifespan_context(self.app):
+                await self.login_all()
+                seed_s = time.perf_counter() - seed_started
+                results = {}
+                for name in scenarios:
+                    results[name] = await self.run_scenario(name)
+        finally:
+            try:
+                await self.client.aclose()
+            finally:
+                await self.engine.dispose()
+        return {
+            "database": self.engine.dialect.name,
+            "settings": {
+                "books": self.args.books, "users": self.args.users, "requests": self.args.requests,
+                "concurrency": self.args.concurrency,
+            },
+            "seed_s": round(seed_s, 2),
+            "scenarios": results,
+        }
+
+
+def _configure_environment(args: argparse.Namespace) -> Optional[str]:
+    """Point the app at the benchmark database. Returns a temp file to clean up, if any."""
+    temp_path = None
+    if args.database_url:
+        if not args.reset_database:
+            sys.exit("--database-url drops and reseeds every table; pass --reset-database to confirm.")
+        database_url = args.database_url
+    else:
+        fd, temp_path = tempfile.mkstemp(prefix="bookshop-bench-", suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite+aiosqlite:///{temp_path}"
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["DATABASE_REPLICA_URLS"] = ""
+    os.environ["SCHEMA_BOOTSTRAP"] = "skip"  # the benchmark creates the schema itself
+    os.environ["ADMIN_MOUNT"] = "off"
+    os.environ.setdefault("LOG_LEVEL", "ERROR")  # keep the report alone on stdout
+    return temp_path
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    temp_path = _configure_environment(args)
+    try:
+        report = asyncio.run(Bench(args).run(scenarios))
+    finally:
+        if temp_path:
+            os.unlink(temp_path)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        report["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w") as f:
+            json.dump({k: v for k, v in report.items() if k != "regressions"}, f, indent=2)
+            f.write("\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())